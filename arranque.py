@@ -0,0 +1,111 @@
+"""
+Arranque de cada worker: precalentamiento y medición del tiempo hasta estar listo.
+
+El manejador lifespan de main.py llama a `precalentar()` antes de aceptar
+peticiones, así la primera petición no paga la apertura del pool ni las
+importaciones diferidas (validador de email, serialización, esquema OpenAPI).
+Las fases quedan en `medicion_arranque` y se exponen en /health y en la
+métrica `proceso_arranque_segundos`.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+from database import db_connection
+from database_async import db_connection_async
+
+logger = logging.getLogger(__name__)
+
+PRECALENTAR_HABILITADO = os.getenv("PRECALENTAR_HABILITADO", "true").lower() == "true"
+
+
+def segundos_desde_inicio_proceso() -> Optional[float]:
+    """Tiempo desde que el sistema operativo creó el proceso (Linux, resolución de un tick)"""
+    try:
+        with open("/proc/self/stat") as archivo:
+            # El nombre del ejecutable va entre paréntesis y puede tener espacios
+            campos = archivo.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as archivo:
+            encendido = float(archivo.read().split()[0])
+        return max(0.0, encendido - int(campos[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MedicionArranque:
+    """Duración de las fases de arranque del worker actual"""
+
+    def __init__(self):
+        self.fases: Dict[str, float] = {}
+        self.listo = False
+
+    def marcar(self, fase: str, segundos: float):
+        self.fases[fase] = round(segundos, 4)
+
+    def completar(self):
+        total = segundos_desde_inicio_proceso()
+        if total is not None:
+            self.marcar("total", total)
+        self.listo = True
+        detalle = ", ".join(f"{fase} {segundos} s" for fase, segundos in self.fases.items() if fase != "total")
+        logger.info("Worker %s listo en %s s (%s)", os.getpid(), self.fases.get("total", "?"), detalle)
+
+    def estadisticas(self) -> dict:
+        return {"listo": self.listo, "fases": dict(self.fases)}
+
+
+medicion_arranque = MedicionArranque()
+
+
+async def _precalentar_pool(modo: str):
+    if modo == "async" and db_connection_async is not None:
+        async with db_connection_async.get_db_connection() as conn:
+            await conn.execute("SELECT 1")
+        return
+
+    def tomar_y_devolver():
+        with db_connection.get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+    await asyncio.to_thread(tomar_y_devolver)
+
+
+def _precalentar_importaciones(app):
+    # Validar y serializar un formulario carga email_validator y los validadores de pydantic
+    from models import FormularioClienteCreate, FormularioRegistro
+    from respuestas import dumps
+
+    formulario = FormularioClienteCreate(
+        nombre_completo="Cliente Precalentamiento", email="precalentamiento@example.com",
+        telefono=3000000000, mensaje="Precalentamiento del worker",
+    )
+    ahora = datetime.now()
+    dumps(FormularioRegistro(id="00000000-0000-0000-0000-000000000000", created_at=ahora,
+                             updated_at=ahora, **formulario.model_dump()))
+    # El esquema OpenAPI se genera en la primera visita a /docs y queda en caché
+    app.openapi()
+
+
+async def precalentar(app):
+    """Abre el pool de la ruta de datos activa (DB_MODO) y ejercita el camino de una petición.
+
+    Un fallo de la base no impide arrancar: se registra y el pool se abrirá
+    en la primera petición, como antes.
+    """
+    if not PRECALENTAR_HABILITADO:
+        return
+
+    inicio = time.perf_counter()
+    _precalentar_importaciones(app)
+    medicion_arranque.marcar("importaciones_diferidas", time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    try:
+        await _precalentar_pool(os.getenv("DB_MODO", "async").lower())
+    except Exception as e:
+        logger.warning("No se pudo precalentar el pool de conexiones: %s", e)
+    medicion_arranque.marcar("pool", time.perf_counter() - inicio)
@@ -0,0 +1,126 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+Los benchmarks se ejecutan desde la raíz del proyecto (`python benchmarks/<script>.py`)
+contra la base configurada con las variables DB_* del `.env`.
+"""
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(os.path.join(RAIZ, ".env"))
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not valores:
+        return 0.0
+    indice = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+def resumen_latencias(latencias_s, duracion_s):
+    """p50/p95/p99/máx en milisegundos y throughput en peticiones por segundo"""
+    ordenadas = sorted(latencias_s)
+    return {
+        "peticiones": len(ordenadas),
+        "rps": round(len(ordenadas) / duracion_s, 1) if duracion_s else 0.0,
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 3),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 3),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 3),
+        "max_ms": round((ordenadas[-1] if ordenadas else 0) * 1000, 3),
+    }
+
+
+def sembrar_formularios(cantidad):
+    """Inserta `cantidad` formularios de prueba y devuelve sus IDs"""
+    from database import db_connection
+
+    with db_connection.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO formulario_cliente (nombre_completo, email, telefono, mensaje, created_at, updated_at)
+            SELECT 'Cliente Prueba', 'bench' || g || '@example.com', 3000000000 + g,
+                   'Mensaje de prueba ' || g,
+                   now() - (g || ' seconds')::interval, now() - (g || ' seconds')::interval
+            FROM generate_series(1, %s) AS g
+            RETURNING id
+            """,
+            (cantidad,),
+        )
+        ids = [str(fila["id"]) for fila in cursor.fetchall()]
+        conn.commit()
+    return ids
+
+
+def limpiar_formularios(ids):
+    from database import db_connection
+
+    with db_connection.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM formulario_cliente WHERE id = ANY(%s::uuid[])", (list(ids),))
+        conn.commit()
+
+
+class Cronometro:
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self.inicio
+
+
+async def llamar_asgi(app, metodo, ruta, cuerpo=None, cabeceras=None):
+    """Envía una petición directamente a la app ASGI (sin red) y devuelve (estado, cabeceras, cuerpo)"""
+    import json
+    from urllib.parse import urlsplit
+
+    partes = urlsplit(ruta)
+    datos = b"" if cuerpo is None else (cuerpo if isinstance(cuerpo, bytes) else json.dumps(cuerpo).encode())
+    lista_cabeceras = [(b"host", b"bench"), (b"content-type", b"application/json"),
+                       (b"content-length", str(len(datos)).encode())]
+    for nombre, valor in (cabeceras or {}).items():
+        lista_cabeceras.append((nombre.lower().encode(), valor.encode()))
+
+    alcance = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": metodo, "scheme": "http", "path": partes.path, "raw_path": partes.path.encode(),
+        "query_string": partes.query.encode(), "headers": lista_cabeceras,
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80), "root_path": "",
+    }
+    enviado = False
+    respuesta = {"estado": 0, "cabeceras": {}, "cuerpo": bytearray()}
+
+    async def recibir():
+        nonlocal enviado
+        if not enviado:
+            enviado = True
+            return {"type": "http.request", "body": datos, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def enviar(mensaje):
+        if mensaje["type"] == "http.response.start":
+            respuesta["estado"] = mensaje["status"]
+            respuesta["cabeceras"] = {k.decode(): v.decode() for k, v in mensaje.get("headers", [])}
+        elif mensaje["type"] == "http.response.body":
+            respuesta["cuerpo"] += mensaje.get("body", b"")
+
+    await app(alcance, recibir, enviar)
+    return respuesta["estado"], respuesta["cabeceras"], bytes(respuesta["cuerpo"])
+
+
+def formulario_ejemplo(i):
+    return {
+        "nombre_completo": "Cliente Prueba",
+        "email": f"bench{i}@example.com",
+        "telefono": 3000000000 + i,
+        "mensaje": f"Mensaje de prueba {i}",
+    }
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Latencia p50/p99 de GET por ID bajo carga concurrente para cada ruta de datos:
+
+- bloqueante: repositorio psycopg2 llamado directamente desde la corrutina
+  (comportamiento anterior; bloquea el event loop en cada consulta)
+- hilos:      repositorio psycopg2 en el threadpool (respaldo DB_MODO=sync)
+- async:      repositorio psycopg 3 nativo (DB_MODO=async)
+
+También mide el retraso máximo del event loop, que es lo que sufren las demás
+peticiones del worker mientras una consulta lo bloquea.
+
+Uso: python benchmarks/bench_async_vs_sync.py [--peticiones 5000] [--tasa 2000]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from _comun import resumen_latencias, sembrar_formularios, limpiar_formularios
+
+from repository import formulario_repository
+from repository_async import FormularioClienteRepositoryAsync, FormularioClienteRepositoryEnHilos
+from database_async import db_connection_async
+from service import FormularioClienteService
+
+
+class RepositorioBloqueante:
+    """Ruta anterior: llamadas síncronas dentro de la corrutina"""
+
+    async def buscar_por_id(self, formulario_id):
+        return formulario_repository.buscar_por_id(formulario_id)
+
+
+async def medir_retraso_loop(detener, intervalo=0.001):
+    peor = 0.0
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        await asyncio.sleep(intervalo)
+        peor = max(peor, time.perf_counter() - inicio - intervalo)
+    return peor
+
+
+async def ejecutar(servicio, ids, peticiones, tasa):
+    """Carga de lazo abierto: las peticiones llegan a `tasa` por segundo sin esperar a las
+    anteriores, y la latencia se mide desde la llegada programada. Así el tiempo que una
+    petición pasa esperando a que el event loop quede libre también cuenta."""
+    latencias = []
+
+    async def peticion(llegada):
+        await servicio.buscar_por_id(random.choice(ids))
+        latencias.append(time.perf_counter() - llegada)
+
+    detener = asyncio.Event()
+    monitor = asyncio.create_task(medir_retraso_loop(detener))
+    tareas = []
+    inicio = time.perf_counter()
+    for i in range(peticiones):
+        llegada = inicio + i / tasa
+        espera = llegada - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        tareas.append(asyncio.create_task(peticion(llegada)))
+    await asyncio.gather(*tareas)
+    duracion = time.perf_counter() - inicio
+    detener.set()
+    retraso = await monitor
+
+    resultado = resumen_latencias(latencias, duracion)
+    resultado["retraso_max_loop_ms"] = round(retraso * 1000, 3)
+    return resultado
+
+
+async def principal(args):
+    ids = sembrar_formularios(args.filas)
+    rutas = {
+        "bloqueante": RepositorioBloqueante(),
+        "hilos": FormularioClienteRepositoryEnHilos(formulario_repository),
+    }
+    if db_connection_async is not None:
+        rutas["async"] = FormularioClienteRepositoryAsync()
+
+    resultados = {}
+    try:
+        for nombre, repositorio in rutas.items():
+            servicio = FormularioClienteService(repositorio)
+            # Calentamiento: abre los pools antes de medir
+            await ejecutar(servicio, ids, min(200, args.peticiones), args.tasa)
+            resultados[nombre] = await ejecutar(servicio, ids, args.peticiones, args.tasa)
+            print(f"{nombre:>10}: {resultados[nombre]}")
+    finally:
+        limpiar_formularios(ids)
+        if db_connection_async is not None:
+            await db_connection_async.cerrar()
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=5000)
+    parser.add_argument("--tasa", type=float, default=2000, help="peticiones por segundo")
+    parser.add_argument("--filas", type=int, default=1000)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    asyncio.run(principal(parser.parse_args()))
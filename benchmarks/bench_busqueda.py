@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Planes y tiempos de GET /formulario/search sobre una tabla sembrada (1M filas por defecto).
+
+Siembra formularios con nombres y mensajes variados, ejecuta cada combinación
+de filtros con EXPLAIN (ANALYZE, BUFFERS) usando el mismo SQL que los
+repositorios (consultas.construir_busqueda) y reporta el tiempo, los índices
+usados y si el plan tiene algún Seq Scan. Requiere haber aplicado
+migraciones/0002_busqueda.sql. Las filas sembradas se eliminan al terminar
+(salvo con --conservar).
+
+Uso: python benchmarks/bench_busqueda.py [--filas 1000000] [--repeticiones 20] [--conservar]
+"""
+import argparse
+import json
+import statistics
+from datetime import datetime, timedelta
+
+from _comun import Cronometro
+
+from database import db_connection
+from consultas import construir_busqueda
+from models import FiltrosBusqueda
+
+PREFIJO_EMAIL = "bqbench-"
+
+SQL_SEMBRAR = """
+    INSERT INTO formulario_cliente (nombre_completo, email, telefono, mensaje, created_at, updated_at)
+    SELECT
+        n.nombres[1 + abs(hashint4(g)) %% array_length(n.nombres, 1)] || ' ' ||
+            n.apellidos[1 + abs(hashint4(g * 7)) %% array_length(n.apellidos, 1)],
+        %(prefijo)s || g || '@dominio' || (g %% 500) || '.com',
+        3100000000 + g,
+        array_to_string(ARRAY(
+            SELECT n.palabras[1 + abs(hashint4(g * 31 + k)) %% array_length(n.palabras, 1)]
+            FROM generate_series(1, 8 + g %% 12) AS k
+        ), ' '),
+        %(base)s - g * interval '30 seconds',
+        %(base)s - g * interval '30 seconds'
+    FROM generate_series(%(inicio)s, %(fin)s) AS g,
+    (SELECT
+        ARRAY['Ana', 'Luis', 'María', 'Carlos', 'Lucía', 'Jorge', 'Sofía', 'Andrés', 'Valentina', 'Diego',
+              'Camila', 'Mateo', 'Paula', 'Santiago', 'Daniela', 'Felipe', 'Laura', 'Tomás', 'Sara', 'Julián'] AS nombres,
+        ARRAY['García', 'Rodríguez', 'Martínez', 'López', 'González', 'Pérez', 'Sánchez', 'Ramírez', 'Torres',
+              'Flores', 'Rivera', 'Gómez', 'Díaz', 'Reyes', 'Morales', 'Ortiz', 'Castro', 'Vargas', 'Rojas'] AS apellidos,
+        ARRAY['quiero', 'información', 'sobre', 'precio', 'factura', 'pedido', 'envío', 'devolución', 'garantía',
+              'soporte', 'técnico', 'cuenta', 'contraseña', 'pago', 'tarjeta', 'reembolso', 'descuento', 'plan',
+              'empresa', 'cotización', 'urgente', 'llamada', 'correo', 'dirección', 'producto', 'servicio',
+              'instalación', 'cancelar', 'renovar', 'contrato', 'horario', 'sucursal', 'demora', 'reclamo'] AS palabras
+    ) AS n
+"""
+
+SQL_LIMPIAR = """
+    DELETE FROM formulario_cliente
+    WHERE email COLLATE "C" >= %s AND email COLLATE "C" < %s
+"""
+
+
+def sembrar(filas, tramo=100000):
+    base = datetime.now()
+    with db_connection.get_db_connection() as conn:
+        cursor = conn.cursor()
+        for inicio in range(1, filas + 1, tramo):
+            cursor.execute(SQL_SEMBRAR, {"prefijo": PREFIJO_EMAIL, "base": base,
+                                         "inicio": inicio, "fin": min(filas, inicio + tramo - 1)})
+            conn.commit()
+            print(f"  sembradas {min(filas, inicio + tramo - 1)}/{filas}", flush=True)
+        cursor.execute("ANALYZE formulario_cliente")
+        conn.commit()
+    return base
+
+
+def limpiar():
+    with db_connection.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SQL_LIMPIAR, (PREFIJO_EMAIL, PREFIJO_EMAIL[:-1] + chr(ord(PREFIJO_EMAIL[-1]) + 1)))
+        conn.commit()
+
+
+def nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from nodos(hijo)
+
+
+def analizar(cursor, filtros, limite, despues_de=None):
+    consulta, valores = construir_busqueda(filtros, limite, despues_de)
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + consulta, valores)
+    fila = cursor.fetchone()
+    explicacion = (fila["QUERY PLAN"] if isinstance(fila, dict) else fila[0])[0]
+    todos = list(nodos(explicacion["Plan"]))
+    return {
+        "ejecucion_ms": round(explicacion["Execution Time"], 3),
+        "indices": sorted({n["Index Name"] for n in todos if "Index Name" in n}),
+        "seq_scan": any(n["Node Type"] == "Seq Scan" for n in todos),
+        "filas": explicacion["Plan"].get("Actual Rows"),
+    }
+
+
+def cronometrar(cursor, filtros, limite, repeticiones):
+    consulta, valores = construir_busqueda(filtros, limite)
+    tiempos = []
+    for _ in range(repeticiones):
+        with Cronometro() as c:
+            cursor.execute(consulta, valores)
+            cursor.fetchall()
+        tiempos.append(c.segundos * 1000)
+    return round(statistics.median(tiempos), 3)
+
+
+def escenarios(base, filas):
+    medio = base - timedelta(seconds=30 * filas // 2)
+    return {
+        "texto": FiltrosBusqueda(texto="factura reembolso"),
+        "texto_frase": FiltrosBusqueda(texto='"soporte técnico" urgente'),
+        "texto_y_nombre": FiltrosBusqueda(texto="lucía garantía"),
+        "texto_y_fechas": FiltrosBusqueda(texto="contrato", desde=medio - timedelta(days=1), hasta=medio),
+        "email_exacto": FiltrosBusqueda(email=f"{PREFIJO_EMAIL}{filas // 3}@dominio{(filas // 3) % 500}.com"),
+        "email_prefijo": FiltrosBusqueda(email_prefijo=f"{PREFIJO_EMAIL}12345"),
+        "telefono": FiltrosBusqueda(telefono=3100000000 + filas // 2),
+        "rango_fechas": FiltrosBusqueda(desde=medio - timedelta(hours=6), hasta=medio),
+    }
+
+
+def principal(args):
+    with Cronometro() as siembra:
+        base = sembrar(args.filas)
+    print(f"siembra de {args.filas} filas: {siembra.segundos:.1f} s")
+
+    resultados = {}
+    try:
+        with db_connection.get_db_connection() as conn:
+            cursor = conn.cursor()
+            for nombre, filtros in escenarios(base, args.filas).items():
+                resultado = analizar(cursor, filtros, args.limite)
+
+                # Segunda página: el keyset debe seguir usando los mismos índices
+                consulta, valores = construir_busqueda(filtros, args.limite)
+                cursor.execute(consulta, valores)
+                pagina = cursor.fetchall()
+                if len(pagina) == args.limite:
+                    ultima = pagina[-1]
+                    posicion = (ultima["created_at"], str(ultima["id"]))
+                    if filtros.texto:
+                        posicion = (ultima["rango"],) + posicion
+                    resultado["pagina_2"] = analizar(cursor, filtros, args.limite, posicion)
+
+                resultado["mediana_ms"] = cronometrar(cursor, filtros, args.limite, args.repeticiones)
+                resultados[nombre] = resultado
+                print(f"{nombre:>16}: {resultado}")
+            conn.rollback()
+    finally:
+        if not args.conservar:
+            limpiar()
+
+    con_seq_scan = [n for n, r in resultados.items() if r["seq_scan"] or r.get("pagina_2", {}).get("seq_scan")]
+    print("planes con Seq Scan:", con_seq_scan or "ninguno")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"filas": args.filas, "resultados": resultados}, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1000000)
+    parser.add_argument("--limite", type=int, default=50)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--conservar", action="store_true", help="no eliminar las filas sembradas")
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    principal(parser.parse_args())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga reproducible de /formulario/* con la app ASGI en proceso.
+
+Siembra N formularios y ejecuta mezclas de operaciones con C clientes
+concurrentes (generador aleatorio con semilla fija):
+
+- creacion:        90% POST /create, 10% GET /{id}
+- lectura_por_id:  95% GET /{id}, 5% POST /create
+- listado:         80% GET /all?limit=20, 20% GET /{id}
+- rotacion:        40% PUT /{id}, 20% DELETE /{id}, 20% POST /create, 20% GET /{id}
+
+Por cada mezcla reporta throughput, percentiles de latencia (total y por
+operación), viajes a la base por petición (sentencias contadas en
+db_consulta_segundos; requiere METRICAS_HABILITADAS=true) y memoria del
+proceso. Con `--bd memoria` usa benchmarks/repositorio_memoria.py en lugar
+de PostgreSQL. El resultado se guarda en JSON; con `--base` se compara contra
+un resultado anterior y el proceso termina con código 1 si alguna mezcla
+empeora más que `--tolerancia` (rps, p99 o viajes por petición).
+
+Uso:
+    python benchmarks/bench_carga.py [--bd postgres|memoria] [--filas 1000] [--concurrencia 16]
+        [--peticiones 2000] [--cargas creacion,listado] [--sin-cache] [--salida resultado.json]
+        [--base base.json] [--tolerancia 15]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from datetime import datetime
+
+from _comun import formulario_ejemplo, limpiar_formularios, llamar_asgi, resumen_latencias, sembrar_formularios
+
+CARGAS = {
+    "creacion": {"crear": 90, "leer": 10},
+    "lectura_por_id": {"leer": 95, "crear": 5},
+    "listado": {"listar": 80, "leer": 20},
+    "rotacion": {"actualizar": 40, "eliminar": 20, "crear": 20, "leer": 20},
+}
+
+# Estados que no cuentan como error: un cliente puede leer o modificar un ID que otro acaba de eliminar
+ESTADOS_ESPERADOS = {
+    "crear": {201},
+    "leer": {200, 404},
+    "listar": {200},
+    "actualizar": {200, 404},
+    "eliminar": {200, 404},
+}
+
+
+def memoria_mb():
+    """RSS actual y máximo del proceso en MB"""
+    with open("/proc/self/statm") as archivo:
+        paginas = int(archivo.read().split()[1])
+    return {
+        "rss_mb": round(paginas * os.sysconf("SC_PAGE_SIZE") / 2**20, 1),
+        "rss_max_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+class Estado:
+    """IDs vivos compartidos por los clientes de una corrida"""
+
+    def __init__(self, ids):
+        self.vivos = list(ids)
+        self.creados = []
+        self.contador = 0
+
+    def elegir(self, rng):
+        return rng.choice(self.vivos) if self.vivos else "00000000-0000-0000-0000-000000000000"
+
+    def quitar(self, formulario_id):
+        try:
+            self.vivos.remove(formulario_id)
+        except ValueError:
+            pass
+
+
+async def ejecutar_operacion(app, operacion, estado, rng):
+    if operacion == "crear":
+        estado.contador += 1
+        codigo, _, cuerpo = await llamar_asgi(app, "POST", "/formulario/create",
+                                              formulario_ejemplo(1000000 + estado.contador))
+        if codigo == 201:
+            nuevo = json.loads(cuerpo)["data"][0]["id"]
+            estado.vivos.append(nuevo)
+            estado.creados.append(nuevo)
+        return codigo
+    if operacion == "leer":
+        codigo, _, _ = await llamar_asgi(app, "GET", f"/formulario/{estado.elegir(rng)}")
+        return codigo
+    if operacion == "listar":
+        codigo, _, _ = await llamar_asgi(app, "GET", "/formulario/all?limit=20")
+        return codigo
+    if operacion == "actualizar":
+        codigo, _, _ = await llamar_asgi(app, "PUT", f"/formulario/{estado.elegir(rng)}",
+                                         {"mensaje": f"Mensaje actualizado {rng.randrange(10**6)}"})
+        return codigo
+    if operacion == "eliminar":
+        formulario_id = estado.elegir(rng)
+        estado.quitar(formulario_id)
+        codigo, _, _ = await llamar_asgi(app, "DELETE", f"/formulario/{formulario_id}")
+        return codigo
+    raise ValueError(f"Operación desconocida: {operacion}")
+
+
+async def correr_carga(app, nombre, pesos, estado, args):
+    from metricas import CONSULTA_SEGUNDOS, METRICAS_HABILITADAS
+
+    operaciones, ponderaciones = list(pesos), list(pesos.values())
+    pendientes = args.peticiones
+    latencias = {operacion: [] for operacion in operaciones}
+    estados = {operacion: {} for operacion in operaciones}
+    errores = 0
+
+    async def cliente(numero):
+        nonlocal pendientes, errores
+        rng = random.Random(f"{args.semilla}-{nombre}-{numero}")
+        while pendientes > 0:
+            pendientes -= 1
+            operacion = rng.choices(operaciones, ponderaciones)[0]
+            inicio = time.perf_counter()
+            codigo = await ejecutar_operacion(app, operacion, estado, rng)
+            latencias[operacion].append(time.perf_counter() - inicio)
+            estados[operacion][codigo] = estados[operacion].get(codigo, 0) + 1
+            if codigo not in ESTADOS_ESPERADOS[operacion]:
+                errores += 1
+
+    consultas_antes = CONSULTA_SEGUNDOS.conteo_total()
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(numero) for numero in range(args.concurrencia)))
+    duracion = time.perf_counter() - inicio
+    consultas = CONSULTA_SEGUNDOS.conteo_total() - consultas_antes
+
+    resultado = resumen_latencias([l for lista in latencias.values() for l in lista], duracion)
+    resultado["errores"] = errores
+    resultado["viajes_bd_por_peticion"] = (
+        round(consultas / resultado["peticiones"], 3) if METRICAS_HABILITADAS and resultado["peticiones"] else None
+    )
+    resultado["por_operacion"] = {
+        operacion: dict(resumen_latencias(latencias[operacion], duracion),
+                        estados={str(c): n for c, n in sorted(estados[operacion].items())})
+        for operacion in operaciones if latencias[operacion]
+    }
+    resultado["memoria"] = memoria_mb()
+    return resultado
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones de `actual` respecto de `base` (mismas mezclas)"""
+    regresiones = []
+    limite = tolerancia / 100
+    for nombre, resultado in actual["cargas"].items():
+        anterior = base.get("cargas", {}).get(nombre)
+        if anterior is None:
+            continue
+        if anterior["rps"] and resultado["rps"] < anterior["rps"] * (1 - limite):
+            regresiones.append(f"{nombre}: rps {anterior['rps']} -> {resultado['rps']}")
+        if anterior["p99_ms"] and resultado["p99_ms"] > anterior["p99_ms"] * (1 + limite):
+            regresiones.append(f"{nombre}: p99 {anterior['p99_ms']} ms -> {resultado['p99_ms']} ms")
+        viajes, viajes_antes = resultado.get("viajes_bd_por_peticion"), anterior.get("viajes_bd_por_peticion")
+        if viajes is not None and viajes_antes is not None and viajes > viajes_antes * (1 + limite) + 0.01:
+            regresiones.append(f"{nombre}: viajes a la base por petición {viajes_antes} -> {viajes}")
+    return regresiones
+
+
+async def principal(args):
+    # Se mide la capacidad: con los límites la sobrecarga se volvería 429/503
+    if not args.con_limites:
+        os.environ["LIMITES_HABILITADOS"] = "false"
+    from main import app
+    from cache import formulario_cache
+    from database_async import db_connection_async
+    from metricas import METRICAS_HABILITADAS
+    from service import formulario_service
+
+    if args.sin_cache:
+        formulario_cache.habilitado = False
+    if args.bd == "memoria":
+        from repositorio_memoria import FormularioClienteRepositoryMemoria
+
+        repositorio = FormularioClienteRepositoryMemoria()
+        formulario_service.repositorio = repositorio
+        sembrados = repositorio.sembrar(args.filas)
+    else:
+        sembrados = sembrar_formularios(args.filas)
+    estado = Estado(sembrados)
+
+    resultados = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "bd": args.bd,
+            "db_modo": os.getenv("DB_MODO", "async") if args.bd == "postgres" else None,
+            "filas": args.filas,
+            "concurrencia": args.concurrencia,
+            "peticiones": args.peticiones,
+            "semilla": args.semilla,
+            "cache": formulario_cache.habilitado,
+            "metricas": METRICAS_HABILITADAS,
+            "python": platform.python_version(),
+        },
+        "cargas": {},
+    }
+    try:
+        for nombre in args.cargas:
+            resultado = await correr_carga(app, nombre, CARGAS[nombre], estado, args)
+            resultados["cargas"][nombre] = resultado
+            print(f"{nombre:>15}: {resultado['rps']:>8} rps  p50 {resultado['p50_ms']} ms  "
+                  f"p99 {resultado['p99_ms']} ms  viajes/pet {resultado['viajes_bd_por_peticion']}  "
+                  f"errores {resultado['errores']}  rss {resultado['memoria']['rss_mb']} MB", flush=True)
+    finally:
+        if args.bd == "postgres":
+            limpiar_formularios(sembrados + estado.creados)
+        if db_connection_async is not None:
+            await db_connection_async.cerrar()
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bd", choices=("postgres", "memoria"), default="postgres")
+    parser.add_argument("--filas", type=int, default=1000, help="formularios sembrados antes de empezar")
+    parser.add_argument("--concurrencia", type=int, default=16, help="clientes concurrentes")
+    parser.add_argument("--peticiones", type=int, default=2000, help="peticiones por mezcla")
+    parser.add_argument("--cargas", default=",".join(CARGAS),
+                        type=lambda valor: [nombre.strip() for nombre in valor.split(",") if nombre.strip()])
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--sin-cache", action="store_true", help="desactiva el caché de lectura")
+    parser.add_argument("--con-limites", action="store_true", help="mantiene los límites de tasa y de concurrencia")
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    parser.add_argument("--base", help="resultado JSON anterior contra el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=15.0, help="empeoramiento permitido en %%")
+    argumentos = parser.parse_args()
+    desconocidas = [nombre for nombre in argumentos.cargas if nombre not in CARGAS]
+    if desconocidas:
+        parser.error(f"mezclas desconocidas: {', '.join(desconocidas)} (disponibles: {', '.join(CARGAS)})")
+
+    resultados = asyncio.run(principal(argumentos))
+    if argumentos.salida:
+        with open(argumentos.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+    if argumentos.base:
+        with open(argumentos.base, encoding="utf-8") as archivo:
+            regresiones = comparar(resultados, json.load(archivo), argumentos.tolerancia)
+        if regresiones:
+            print("Regresiones respecto de la base:")
+            for regresion in regresiones:
+                print(f"  - {regresion}")
+            sys.exit(1)
+        print(f"Sin regresiones respecto de la base (tolerancia {argumentos.tolerancia}%)")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Throughput de POST /formulario/create con un COMMIT por petición frente a la
+creación agrupada (creacion_agrupada.py: un INSERT multi-fila y un COMMIT por grupo).
+
+Para cada concurrencia ejecuta las mismas creaciones con la ruta actual y con
+cada ventana de `--ventanas-ms`, y reporta peticiones por segundo, latencia
+p50/p99, COMMIT por petición (1 en la ruta actual, grupos / peticiones en la
+agrupada) y filas por grupo.
+
+Las peticiones se envían a la app ASGI en proceso, sin red, con los límites de
+tasa desactivados. El beneficio depende del costo del fsync: con
+synchronous_commit=off o un disco con caché de escritura la diferencia se achica.
+
+Uso: python benchmarks/bench_commit_agrupado.py [--peticiones 4000] [--concurrencias 1,16,64]
+        [--ventanas-ms 1,5] [--maximo 500] [--salida agrupado.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from _comun import formulario_ejemplo, limpiar_formularios, llamar_asgi, resumen_latencias
+
+
+async def corrida(app, peticiones, concurrencia):
+    ids, latencias = [], []
+    pendientes = iter(range(peticiones))
+
+    async def cliente():
+        for i in pendientes:
+            inicio = time.perf_counter()
+            estado, _, cuerpo = await llamar_asgi(app, "POST", "/formulario/create", formulario_ejemplo(i))
+            latencias.append(time.perf_counter() - inicio)
+            assert estado == 201, cuerpo
+            ids.append(json.loads(cuerpo)["data"][0]["id"])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    return time.perf_counter() - inicio, latencias, ids
+
+
+async def principal(args):
+    os.environ["LIMITES_HABILITADOS"] = "false"
+    from main import app
+    from creacion_agrupada import CreacionAgrupada
+    from database_async import db_connection_async
+    from service import formulario_service
+
+    original = formulario_service.creacion_agrupada
+    modos = [("individual", 0.0)] + [(f"agrupado_{ventana:g}ms", ventana) for ventana in args.ventanas_ms]
+    resultados = {}
+    try:
+        # Calentamiento: abre el pool y prepara las sentencias antes de medir
+        _, _, ids = await corrida(app, 50, 10)
+        limpiar_formularios(ids)
+
+        for concurrencia in args.concurrencias:
+            print(f"concurrencia {concurrencia}:")
+            for nombre, ventana in modos:
+                formulario_service.creacion_agrupada = CreacionAgrupada(
+                    lambda formularios: formulario_service.repositorio.crear_formularios_lote(formularios, atomico=False),
+                    ventana_ms=ventana, maximo=args.maximo, cola_maxima=max(args.maximo * 4, concurrencia),
+                )
+                duracion, latencias, ids = await corrida(app, args.peticiones, concurrencia)
+                limpiar_formularios(ids)
+
+                medida = resumen_latencias(latencias, duracion)
+                agrupada = formulario_service.creacion_agrupada
+                medida["commits_por_peticion"] = round(agrupada.grupos / len(ids), 3) if ventana else 1.0
+                if agrupada.grupos:
+                    medida["filas_por_grupo"] = round(agrupada.filas_agrupadas / agrupada.grupos, 1)
+                resultados.setdefault(str(concurrencia), {})[nombre] = medida
+                print(f"  {nombre:>16}: {medida['rps']:>9} rps  p50 {medida['p50_ms']:>8} ms  "
+                      f"p99 {medida['p99_ms']:>8} ms  commits/pet {medida['commits_por_peticion']:>6}"
+                      + (f"  filas/grupo {medida['filas_por_grupo']}" if "filas_por_grupo" in medida else ""))
+    finally:
+        formulario_service.creacion_agrupada = original
+        if db_connection_async is not None:
+            await db_connection_async.cerrar()
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=4000)
+    parser.add_argument("--concurrencias", type=lambda texto: [int(c) for c in texto.split(",")], default=[1, 16, 64])
+    parser.add_argument("--ventanas-ms", type=lambda texto: [float(v) for v in texto.split(",")], default=[1.0, 5.0])
+    parser.add_argument("--maximo", type=int, default=500, help="filas máximas por grupo")
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    asyncio.run(principal(parser.parse_args()))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Costo de CPU frente a bytes ahorrados al comprimir respuestas de /formulario/all.
+
+Arma páginas de N filas con mensajes de texto variado (hasta 500 caracteres,
+el máximo del modelo) serializadas con RespuestaJSON, y para cada codificación
+instalada (gzip; br y zstd si están `brotli` y `zstandard`) y cada nivel mide:
+
+- completa: el cuerpo entero de una vez, como las páginas normales.
+- stream: NDJSON fila por fila, por tramos de COMPRESION_VACIADO_BYTES con
+  vaciado, como `stream=ndjson`.
+- cache: el costo de un acierto de la caché de comprimidos (resumen blake2b y
+  búsqueda), que reemplaza a la compresión en los cuerpos repetidos.
+
+No usa la base de datos ni la red.
+
+Uso: python benchmarks/bench_compresion.py [--filas 100 1000] [--repeticiones 20]
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from hashlib import blake2b
+
+import _comun  # noqa: F401  (agrega la raíz del proyecto al sys.path)
+
+from compresion import (
+    FlujoBrotli, FlujoGzip, FlujoZstd, CacheComprimidos, Codificacion,
+    codificaciones_disponibles,
+)
+from models import FormularioRegistro, RespuestaApi
+from respuestas import RespuestaJSON, dumps
+
+PALABRAS = (
+    "hola quisiera información sobre el pedido factura envío producto garantía devolución cuenta pago "
+    "tarjeta transferencia dirección entrega fecha semana mes número cliente atención servicio consulta "
+    "precio descuento promoción catálogo talla color disponible gracias saludos cordiales urgente"
+).split()
+
+NIVELES = {"gzip": (1, 6, 9), "br": (1, 4, 6), "zstd": (1, 3, 9)}
+FLUJOS = {"gzip": FlujoGzip, "br": FlujoBrotli, "zstd": FlujoZstd}
+
+
+def filas_ejemplo(cantidad, semilla=7):
+    azar = random.Random(semilla)
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    filas = []
+    for i in range(cantidad):
+        mensaje = " ".join(azar.choice(PALABRAS) for _ in range(azar.randint(5, 80)))[:500].strip()
+        filas.append(FormularioRegistro(
+            id=str(uuid.UUID(int=azar.getrandbits(128), version=4)),
+            nombre_completo=f"Cliente Prueba {i}",
+            email=f"cliente{i}@ejemplo.com",
+            telefono=3000000000 + azar.randint(0, 999999999),
+            mensaje=mensaje,
+            created_at=base + timedelta(seconds=i),
+            updated_at=base + timedelta(seconds=i),
+        ))
+    return filas
+
+
+def mediana(funcion, repeticiones):
+    funcion()  # calentamiento
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2]
+
+
+def comprimir_stream(codificacion, trozos):
+    flujo = codificacion.por_tramos()
+    salida = [flujo.agregar(trozo) for trozo in trozos]
+    salida.append(flujo.terminar())
+    return b"".join(salida)
+
+
+def resultado(original, comprimido, segundos):
+    ahorrados = original - comprimido
+    return {
+        "bytes": comprimido,
+        "razon": round(original / comprimido, 2),
+        "ms": round(segundos * 1000, 3),
+        "mb_s": round(original / segundos / 1e6, 1),
+        # Lo que importa al elegir nivel: cuántos bytes de red ahorra cada ms de CPU
+        "kb_ahorrados_por_ms": round(ahorrados / 1024 / (segundos * 1000), 1),
+    }
+
+
+def principal(args):
+    disponibles = codificaciones_disponibles()
+    resultados = {}
+    for cantidad in args.filas:
+        filas = filas_ejemplo(cantidad)
+        cuerpo = RespuestaJSON(RespuestaApi(
+            message=["Los formularios fueron consultados satisfactoriamente."], data=filas)).body
+        trozos = [dumps(fila) + b"\n" for fila in filas]
+        original_stream = sum(len(trozo) for trozo in trozos)
+        print(f"\n{cantidad} filas: {len(cuerpo)} bytes ({original_stream} en NDJSON)")
+        print(f"  {'codificación':<14}{'modo':<10}{'bytes':>10}{'razón':>8}{'ms':>10}{'MB/s':>9}{'KB ahorrados/ms':>18}")
+
+        por_cantidad = resultados[cantidad] = {}
+        for nombre, codificacion in disponibles.items():
+            for nivel in NIVELES[nombre]:
+                prueba = Codificacion(nombre, nivel, FLUJOS[nombre])
+                comprimido = prueba.comprimir(cuerpo)
+                completa = resultado(len(cuerpo), len(comprimido),
+                                     mediana(lambda: prueba.comprimir(cuerpo), args.repeticiones))
+                en_stream = comprimir_stream(prueba, trozos)
+                stream = resultado(original_stream, len(en_stream), mediana(
+                    lambda: comprimir_stream(prueba, trozos), args.repeticiones))
+                etiqueta = f"{nombre}-{nivel}" + (" *" if nivel == codificacion.nivel else "")
+                por_cantidad[f"{nombre}-{nivel}"] = {"completa": completa, "stream": stream}
+                for modo, datos in (("completa", completa), ("stream", stream)):
+                    print(f"  {etiqueta:<14}{modo:<10}{datos['bytes']:>10}{datos['razon']:>8}{datos['ms']:>10}"
+                          f"{datos['mb_s']:>9}{datos['kb_ahorrados_por_ms']:>18}")
+
+        cache = CacheComprimidos()
+        clave = ("gzip", blake2b(cuerpo, digest_size=16).digest())
+        cache.guardar(clave, disponibles["gzip"].comprimir(cuerpo))
+        acierto = mediana(lambda: cache.obtener(("gzip", blake2b(cuerpo, digest_size=16).digest())),
+                          args.repeticiones)
+        por_cantidad["cache"] = {"ms": round(acierto * 1000, 4)}
+        print(f"  acierto de la caché de comprimidos (resumen + búsqueda): {acierto * 1000:.4f} ms")
+
+    print("\n* nivel configurado (COMPRESION_NIVEL_GZIP / _BR / _ZSTD)")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"codificaciones": list(disponibles), "resultados": resultados}, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    principal(parser.parse_args())
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Exportación e importación con COPY (GET /formulario/export, POST /formulario/import)
+frente a los caminos anteriores, sobre millones de filas.
+
+- Exportación: siembra `--filas` formularios con created_at en enero de 2000 y
+  los descarga con /export (csv y ndjson) filtrando ese rango, frente a
+  /all?stream=ndjson (que recorre la tabla completa).
+- Importación: genera `--filas` formularios en CSV y NDJSON y los sube a
+  /import en streaming, frente a /bulk (lotes de LOTE_MAX_ITEMS) y /create
+  (16 clientes concurrentes) sobre una muestra de `--muestra` filas.
+
+Reporta filas por segundo, MB/s y el pico de RSS del proceso por encima del
+que tenía antes de cada caso (muestreado cada 20 ms). Los cuerpos se generan y
+se consumen por partes, sin armarlos enteros en memoria. Las peticiones van a
+la app ASGI en proceso, sin red, con los límites de tasa desactivados.
+
+Uso: python benchmarks/bench_copia.py [--filas 2000000] [--muestra 50000] [--salida copia.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import _comun
+from _comun import llamar_asgi
+
+DOMINIO = "copia.example.com"
+RANGO_SEMBRADO = "desde=2000-01-01T00:00:00&hasta=2000-02-01T00:00:00"
+BLOQUE_CUERPO = 64 * 1024
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as estado:
+        for linea in estado:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1]) / 1024
+    return 0.0
+
+
+class PicoRss:
+    """Pico de RSS por encima del valor inicial mientras dura el bloque `async with`"""
+
+    async def __aenter__(self):
+        self.base = self.pico = rss_mb()
+        self._tarea = asyncio.create_task(self._muestrear())
+        return self
+
+    async def _muestrear(self):
+        while True:
+            self.pico = max(self.pico, rss_mb())
+            await asyncio.sleep(0.02)
+
+    async def __aexit__(self, *exc):
+        self._tarea.cancel()
+        self.pico = max(self.pico, rss_mb())
+        self.mb = round(self.pico - self.base, 1)
+
+
+async def llamar_stream(app, metodo, ruta, partes=None, tipo="application/octet-stream"):
+    """Petición ASGI con cuerpo por partes; la respuesta se cuenta sin guardarla.
+
+    Devuelve (estado, bytes recibidos, líneas recibidas, primeros bytes).
+    """
+    from urllib.parse import urlsplit
+
+    ruta_partes = urlsplit(ruta)
+    alcance = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": metodo, "scheme": "http", "path": ruta_partes.path, "raw_path": ruta_partes.path.encode(),
+        "query_string": ruta_partes.query.encode(),
+        "headers": [(b"host", b"bench"), (b"content-type", tipo.encode()), (b"transfer-encoding", b"chunked")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80), "root_path": "",
+    }
+    fuente = iter(partes or ())
+    terminado = False
+    respuesta = {"estado": 0, "bytes": 0, "lineas": 0, "inicio": b""}
+
+    async def recibir():
+        nonlocal terminado
+        if terminado:
+            await asyncio.sleep(3600)
+        parte = next(fuente, None)
+        if parte is None:
+            terminado = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": parte, "more_body": True}
+
+    async def enviar(mensaje):
+        if mensaje["type"] == "http.response.start":
+            respuesta["estado"] = mensaje["status"]
+        elif mensaje["type"] == "http.response.body":
+            cuerpo = mensaje.get("body", b"")
+            respuesta["bytes"] += len(cuerpo)
+            respuesta["lineas"] += cuerpo.count(b"\n")
+            if len(respuesta["inicio"]) < 2000:
+                respuesta["inicio"] += cuerpo[:2000]
+
+    await app(alcance, recibir, enviar)
+    return respuesta["estado"], respuesta["bytes"], respuesta["lineas"], respuesta["inicio"]
+
+
+def cuerpo_importacion(formato, filas):
+    """Archivo de `filas` formularios en bloques de ~64 KB, generado a medida que se lee"""
+    partes, tamano = [], 0
+    if formato == "csv":
+        partes.append(b"nombre_completo,email,telefono,mensaje\n")
+    for i in range(filas):
+        if formato == "csv":
+            linea = f'Cliente Prueba,copia{i}@{DOMINIO},{3000000000 + i},"Mensaje de prueba {i}, importado"\n'
+        else:
+            linea = json.dumps({"nombre_completo": "Cliente Prueba", "email": f"copia{i}@{DOMINIO}",
+                                "telefono": 3000000000 + i, "mensaje": f"Mensaje de prueba {i}, importado"}) + "\n"
+        partes.append(linea.encode())
+        tamano += len(linea)
+        if tamano >= BLOQUE_CUERPO:
+            yield b"".join(partes)
+            partes, tamano = [], 0
+    if partes:
+        yield b"".join(partes)
+
+
+def ejecutar_sql(sentencia, valores=None):
+    from database import db_connection
+
+    with db_connection.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sentencia, valores)
+        conn.commit()
+
+
+def sembrar(filas):
+    ejecutar_sql(
+        f"""
+        INSERT INTO formulario_cliente (nombre_completo, email, telefono, mensaje, created_at, updated_at)
+        SELECT 'Cliente Prueba', 'copia' || g || '@{DOMINIO}', 3000000000 + g, 'Mensaje de prueba ' || g,
+               timestamp '2000-01-01' + g * interval '1 ms', timestamp '2000-01-01' + g * interval '1 ms'
+        FROM generate_series(1, %s) AS g
+        """,
+        (filas,),
+    )
+    ejecutar_sql("ANALYZE formulario_cliente")
+
+
+def limpiar():
+    """Borra las filas del benchmark y sus eventos en el registro de cambios"""
+    ejecutar_sql(f"""
+        WITH borrados AS (DELETE FROM formulario_cliente WHERE email LIKE 'copia%%@{DOMINIO}' RETURNING id)
+        DELETE FROM formulario_cambios WHERE formulario_id IN (SELECT id FROM borrados)
+    """)
+
+
+def medida(filas, bytes_, segundos, pico):
+    return {
+        "filas": filas,
+        "segundos": round(segundos, 2),
+        "filas_por_s": round(filas / segundos),
+        "mb_por_s": round(bytes_ / segundos / 2 ** 20, 1),
+        "pico_rss_mb": pico.mb,
+    }
+
+
+def mostrar(nombre, m):
+    print(f"  {nombre:<28}{m['filas']:>10} filas {m['segundos']:>8} s {m['filas_por_s']:>10} filas/s "
+          f"{m['mb_por_s']:>7} MB/s  +{m['pico_rss_mb']} MB RSS")
+
+
+async def exportaciones(app, args):
+    resultados = {}
+    casos = [
+        ("export_csv", f"/formulario/export?formato=csv&{RANGO_SEMBRADO}", 1),
+        ("export_ndjson", f"/formulario/export?formato=ndjson&{RANGO_SEMBRADO}", 0),
+        ("all_stream_ndjson", "/formulario/all?stream=ndjson", 0),
+    ]
+    for nombre, ruta, encabezado in casos:
+        async with PicoRss() as pico:
+            inicio = time.perf_counter()
+            estado, recibidos, lineas, primeros = await llamar_stream(app, "GET", ruta)
+            segundos = time.perf_counter() - inicio
+        assert estado == 200, primeros
+        resultados[nombre] = medida(lineas - encabezado, recibidos, segundos, pico)
+        mostrar(nombre, resultados[nombre])
+    return resultados
+
+
+async def importaciones(app, args):
+    from copia import IMPORTAR_TAMANO_BLOQUE
+    from service import LOTE_MAX_ITEMS
+
+    resultados = {}
+    for formato in ("csv", "ndjson"):
+        nombre = f"import_{formato}"
+        enviados = sum(len(parte) for parte in cuerpo_importacion(formato, args.filas))
+        async with PicoRss() as pico:
+            inicio = time.perf_counter()
+            estado, _, _, cuerpo = await llamar_stream(
+                app, "POST", f"/formulario/import?formato={formato}", cuerpo_importacion(formato, args.filas))
+            segundos = time.perf_counter() - inicio
+        assert estado == 201, cuerpo
+        limpiar()
+        resultados[nombre] = medida(args.filas, enviados, segundos, pico)
+        mostrar(f"{nombre} ({IMPORTAR_TAMANO_BLOQUE}/bloque)", resultados[nombre])
+
+    formularios = [{"nombre_completo": "Cliente Prueba", "email": f"copia{i}@{DOMINIO}",
+                    "telefono": 3000000000 + i, "mensaje": f"Mensaje de prueba {i}, importado"}
+                   for i in range(args.muestra)]
+
+    async with PicoRss() as pico:
+        inicio, enviados = time.perf_counter(), 0
+        for desde in range(0, len(formularios), LOTE_MAX_ITEMS):
+            lote = json.dumps(formularios[desde:desde + LOTE_MAX_ITEMS]).encode()
+            enviados += len(lote)
+            estado, _, cuerpo = await llamar_asgi(app, "POST", "/formulario/bulk", lote)
+            assert estado == 201, cuerpo[:500]
+        segundos = time.perf_counter() - inicio
+    limpiar()
+    resultados["bulk"] = medida(len(formularios), enviados, segundos, pico)
+    mostrar(f"bulk ({LOTE_MAX_ITEMS}/lote)", resultados["bulk"])
+
+    pendientes = iter(formularios)
+    enviados = 0
+
+    async def cliente():
+        nonlocal enviados
+        for formulario in pendientes:
+            cuerpo = json.dumps(formulario).encode()
+            enviados += len(cuerpo)
+            estado, _, respuesta = await llamar_asgi(app, "POST", "/formulario/create", cuerpo)
+            assert estado == 201, respuesta
+
+    async with PicoRss() as pico:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente() for _ in range(16)))
+        segundos = time.perf_counter() - inicio
+    limpiar()
+    resultados["create"] = medida(len(formularios), enviados, segundos, pico)
+    mostrar("create (16 clientes)", resultados["create"])
+    return resultados
+
+
+async def principal(args):
+    os.environ["LIMITES_HABILITADOS"] = "false"
+    from main import app
+    from database_async import db_connection_async
+
+    limpiar()
+    resultados = {"filas": args.filas, "muestra": args.muestra}
+    try:
+        print(f"sembrando {args.filas} filas...")
+        sembrar(args.filas)
+        print("exportación:")
+        resultados["exportacion"] = await exportaciones(app, args)
+        limpiar()
+        print("importación:")
+        resultados["importacion"] = await importaciones(app, args)
+    finally:
+        limpiar()
+        if db_connection_async is not None:
+            await db_connection_async.cerrar()
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=2000000)
+    parser.add_argument("--muestra", type=int, default=50000, help="filas de /bulk y /create")
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    asyncio.run(principal(parser.parse_args()))
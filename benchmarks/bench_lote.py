@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Filas por segundo de POST /formulario/create (una petición por formulario)
+frente a POST /formulario/bulk (lotes de N formularios en una transacción).
+
+Las peticiones se envían a la app ASGI en proceso, sin red, así se mide el
+costo de la API y la base de datos.
+
+Uso: python benchmarks/bench_lote.py [--filas 5000] [--concurrencia 20] [--tamano-lote 500]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from _comun import llamar_asgi, formulario_ejemplo, limpiar_formularios
+
+from main import app
+from database_async import db_connection_async
+
+
+async def con_individuales(filas, concurrencia):
+    ids = []
+    pendientes = iter(range(filas))
+
+    async def cliente():
+        for i in pendientes:
+            estado, _, cuerpo = await llamar_asgi(app, "POST", "/formulario/create", formulario_ejemplo(i))
+            assert estado == 201, cuerpo
+            ids.append(json.loads(cuerpo)["data"][0]["id"])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    return time.perf_counter() - inicio, ids
+
+
+async def con_lotes(filas, concurrencia, tamano_lote):
+    ids = []
+    lotes = iter(range(0, filas, tamano_lote))
+
+    async def cliente():
+        for inicio in lotes:
+            cuerpo = [formulario_ejemplo(i) for i in range(inicio, min(filas, inicio + tamano_lote))]
+            estado, _, respuesta = await llamar_asgi(app, "POST", "/formulario/bulk", cuerpo)
+            assert estado == 201, respuesta
+            ids.extend(item["id"] for item in json.loads(respuesta)["data"])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(max(1, concurrencia // 4))))
+    return time.perf_counter() - inicio, ids
+
+
+async def principal(args):
+    resultados = {}
+    for nombre, corrida in (
+        ("individual", lambda: con_individuales(args.filas, args.concurrencia)),
+        (f"lote_{args.tamano_lote}", lambda: con_lotes(args.filas, args.concurrencia, args.tamano_lote)),
+    ):
+        duracion, ids = await corrida()
+        limpiar_formularios(ids)
+        resultados[nombre] = {"filas": len(ids), "segundos": round(duracion, 3), "filas_por_segundo": round(len(ids) / duracion, 1)}
+        print(f"{nombre:>12}: {resultados[nombre]}")
+
+    if db_connection_async is not None:
+        await db_connection_async.cerrar()
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--tamano-lote", type=int, default=500)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    asyncio.run(principal(parser.parse_args()))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Costo de las métricas: la misma carga con METRICAS_HABILITADAS=true y =false.
+
+Cada modo corre en un subproceso (la opción se lee al importar) y envía
+peticiones a la app ASGI en proceso: GET /formulario/{id} servido desde el
+caché (sin base de datos, donde el costo relativo es mayor) y GET
+/formulario/all?limit=20 (con consulta). Reporta microsegundos por petición
+y la diferencia entre ambos modos.
+
+Uso: python benchmarks/bench_metricas.py [--peticiones 20000] [--rondas 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from _comun import llamar_asgi, sembrar_formularios, limpiar_formularios
+
+
+async def medir_ruta(app, ruta, peticiones, rondas):
+    for _ in range(min(200, peticiones)):  # calentamiento (carga el caché)
+        await llamar_asgi(app, "GET", ruta)
+    mejor = float("inf")
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            estado, _, _ = await llamar_asgi(app, "GET", ruta)
+            assert estado == 200, estado
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return round(mejor / peticiones * 1e6, 2)
+
+
+async def hijo(args):
+    from main import app
+    from database_async import db_connection_async
+
+    ids = sembrar_formularios(50)
+    try:
+        resultado = {
+            "por_id_cache_us": await medir_ruta(app, f"/formulario/{ids[0]}", args.peticiones, args.rondas),
+            "all_limit_20_us": await medir_ruta(app, "/formulario/all?limit=20", args.peticiones // 10, args.rondas),
+        }
+    finally:
+        limpiar_formularios(ids)
+        if db_connection_async is not None:
+            await db_connection_async.cerrar()
+    print(json.dumps(resultado))
+
+
+def correr_modo(habilitadas, args):
+    # Sin límites de tasa: las rondas superan LIMITE_TASA y recibirían 429
+    entorno = dict(os.environ, METRICAS_HABILITADAS="true" if habilitadas else "false", LIMITES_HABILITADOS="false")
+    salida = subprocess.run(
+        [sys.executable, __file__, "--hijo", "--peticiones", str(args.peticiones), "--rondas", str(args.rondas)],
+        env=entorno, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def principal(args):
+    sin = correr_modo(False, args)
+    con = correr_modo(True, args)
+    resultados = {"sin_metricas": sin, "con_metricas": con, "costo_us": {}, "costo_pct": {}}
+    for clave in sin:
+        resultados["costo_us"][clave] = round(con[clave] - sin[clave], 2)
+        resultados["costo_pct"][clave] = round((con[clave] - sin[clave]) / sin[clave] * 100, 1)
+    print(json.dumps(resultados, indent=2))
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=20000)
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    argumentos = parser.parse_args()
+    if argumentos.hijo:
+        asyncio.run(hijo(argumentos))
+    else:
+        principal(argumentos)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Planificación ahorrada por las sentencias preparadas de los repositorios (sentencias.py).
+
+Siembra formularios y, para cada sentencia fija de consultas.py (por ID, página,
+INSERT, UPDATE, DELETE), compara enviarla como texto contra ejecutarla preparada:
+
+- planificación: "Planning Time" de EXPLAIN (ANALYZE) del texto frente al de
+  EXPLAIN (ANALYZE) EXECUTE, del lado del servidor. No incluye el análisis
+  sintáctico ni la reescritura, que la sentencia preparada también se ahorra.
+- viaje: p50 de la ejecución completa desde psycopg2 (PREPARE/EXECUTE de
+  `sentencias.ejecutar`) y, si está instalado, desde psycopg 3 (`prepare=`).
+  La diferencia es el tiempo ahorrado por petición.
+
+Antes de medir cada sentencia se ejecuta `--calentamiento` veces: PostgreSQL
+planifica a medida las primeras cinco ejecuciones de una sentencia preparada
+y recién después reutiliza el plan genérico. Las escrituras se deshacen con
+ROLLBACK en psycopg2 y quedan hechas en psycopg 3 (autocommit); las filas
+sembradas y las insertadas se eliminan al terminar.
+
+Uso: python benchmarks/bench_preparadas.py [--filas 10000] [--repeticiones 200] [--salida preparadas.json]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+import _comun
+
+from consultas import (
+    SQL_BUSCAR_POR_ID, SQL_BUSCAR_POR_IDS, SQL_ELIMINAR, SQL_INSERTAR, SQL_INSERTAR_ID_BD, SQL_VERSION_POR_ID,
+    construir_actualizacion, construir_insercion, construir_pagina,
+)
+from database import db_connection
+from database_async import ASYNC_DISPONIBLE, db_connection_async, psycopg
+from models import FormularioClienteCreate, FormularioClienteUpdate
+from sentencias import ejecutar
+
+
+def casos(ids, ultima):
+    """(etiqueta, sentencia, valores de la repetición i, escribe) de cada sentencia fija medida"""
+    ahora = datetime.now()
+    insercion = construir_insercion(FormularioClienteCreate(**_comun.formulario_ejemplo(0)), ahora)
+    actualizacion = construir_actualizacion(ids[1], FormularioClienteUpdate(mensaje="Mensaje nuevo"), ahora)
+    pagina, pagina_desde = construir_pagina(100), construir_pagina(100, ultima)
+    # Sin ROLLBACK (psycopg 3) cada repetición elimina una fila sembrada distinta
+    reserva = ids[len(ids) // 2 + 1:]
+    return [
+        ("buscar_por_id", SQL_BUSCAR_POR_ID, lambda i: (ids[0],), False),
+        ("buscar_por_ids", SQL_BUSCAR_POR_IDS, lambda i: (ids[:20],), False),
+        ("version_por_id", SQL_VERSION_POR_ID, lambda i: (ids[0],), False),
+        ("pagina", pagina[0], lambda i: pagina[1], False),
+        ("pagina_desde", pagina_desde[0], lambda i: pagina_desde[1], False),
+        ("insertar", insercion[0], lambda i: insercion[1], True),
+        ("actualizar", actualizacion[0], lambda i: actualizacion[1], True),
+        ("eliminar", SQL_ELIMINAR, lambda i: (reserva[i],), True),
+    ]
+
+
+def mediana(valores):
+    ordenados = sorted(valores)
+    return ordenados[len(ordenados) // 2]
+
+
+def planificacion_ms(cursor, consulta, valores, escribe):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + consulta, valores)
+    plan = cursor.fetchone()["QUERY PLAN"][0]
+    if escribe:
+        cursor.connection.rollback()
+    return plan["Planning Time"]
+
+
+def medir_psycopg2(conn, sentencia, valores_de, escribe, args):
+    """Las escrituras se deshacen con ROLLBACK: psycopg2 no toca las sentencias preparadas"""
+    cursor = conn.cursor()
+    valores = valores_de(0)
+    resultado = {}
+    for modo in ("texto", "preparada"):
+        if modo == "texto":
+            def correr():
+                cursor.execute(str(sentencia), valores)
+        else:
+            def correr():
+                ejecutar(cursor, sentencia, valores)
+
+        tiempos, planes = [], []
+        for repeticion in range(args.calentamiento + args.repeticiones):
+            inicio = time.perf_counter()
+            correr()
+            cursor.fetchall()
+            transcurrido = time.perf_counter() - inicio
+            conn.rollback()
+            if repeticion >= args.calentamiento:
+                tiempos.append(transcurrido)
+        consulta = str(sentencia) if modo == "texto" else sentencia.ejecutar
+        for _ in range(min(args.repeticiones, 20)):
+            planes.append(planificacion_ms(cursor, consulta, valores, escribe))
+        conn.rollback()
+        resultado[modo] = {"plan_ms": round(mediana(planes), 4), "p50_us": round(mediana(tiempos) * 1e6, 1)}
+    return resultado
+
+
+def medir_psycopg3(sentencia, valores_de, args, creados):
+    """En autocommit: psycopg 3 descarta todas sus sentencias preparadas ante cualquier
+    ROLLBACK (también ROLLBACK TO SAVEPOINT), así que las escrituras quedan hechas"""
+    resultado = {}
+    repeticiones = args.calentamiento + args.repeticiones
+    with psycopg.connect(db_connection_async.conninfo(), autocommit=True) as conn:
+        for desplazamiento, (modo, preparar) in enumerate((("texto", False), ("preparada", True))):
+            tiempos = []
+            for repeticion in range(repeticiones):
+                valores = valores_de(desplazamiento * repeticiones + repeticion)
+                inicio = time.perf_counter()
+                filas = conn.execute(str(sentencia), valores, prepare=preparar).fetchall()
+                transcurrido = time.perf_counter() - inicio
+                if sentencia is SQL_INSERTAR or sentencia is SQL_INSERTAR_ID_BD:
+                    creados.extend(str(fila[0]) for fila in filas)
+                if repeticion >= args.calentamiento:
+                    tiempos.append(transcurrido)
+            resultado[modo] = {"p50_us": round(mediana(tiempos) * 1e6, 1)}
+    return resultado
+
+
+def principal(args):
+    if args.filas < 4 * (args.calentamiento + args.repeticiones) + 2:
+        raise SystemExit("--filas debe alcanzar para 4 × (calentamiento + repeticiones) + 2 filas")
+    ids = _comun.sembrar_formularios(args.filas)
+    creados = []
+    try:
+        with db_connection.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT created_at, id FROM formulario_cliente WHERE id = %s", (ids[len(ids) // 2],))
+            fila = cursor.fetchone()
+            ultima = (fila["created_at"], fila["id"])
+            conn.rollback()
+
+            print(f"{args.filas} filas sembradas; {args.repeticiones} repeticiones tras {args.calentamiento} de calentamiento")
+            print(f"  {'sentencia':<16}{'plan texto':>12}{'plan prep.':>12}{'ahorro ms':>11}"
+                  f"{'psycopg2 µs':>22}{'psycopg 3 µs':>22}")
+            resultados = {}
+            for etiqueta, sentencia, valores_de, escribe in casos(ids, ultima):
+                medida = {"psycopg2": medir_psycopg2(conn, sentencia, valores_de, escribe, args)}
+                if ASYNC_DISPONIBLE:
+                    medida["psycopg3"] = medir_psycopg3(sentencia, valores_de, args, creados)
+                texto, preparada = medida["psycopg2"]["texto"], medida["psycopg2"]["preparada"]
+                medida["ahorro_plan_ms"] = round(texto["plan_ms"] - preparada["plan_ms"], 4)
+                resultados[etiqueta] = medida
+                p3 = medida.get("psycopg3")
+                columna_p3 = f"{p3['texto']['p50_us']:>10} → {p3['preparada']['p50_us']:<9}" if p3 else f"{'-':>22}"
+                print(f"  {etiqueta:<16}{texto['plan_ms']:>12}{preparada['plan_ms']:>12}{medida['ahorro_plan_ms']:>11}"
+                      f"{texto['p50_us']:>10} → {preparada['p50_us']:<9}{columna_p3}")
+
+        resumen = {"ahorro_plan_ms": round(sum(m["ahorro_plan_ms"] for m in resultados.values()) / len(resultados), 4)}
+        for driver in ("psycopg2", "psycopg3"):
+            medidas = [m[driver] for m in resultados.values() if driver in m]
+            if medidas:
+                resumen[f"ahorro_us_{driver}"] = round(sum(
+                    m["texto"]["p50_us"] - m["preparada"]["p50_us"] for m in medidas) / len(medidas), 1)
+        print("\nahorro promedio por petición (una sentencia fija por petición): "
+              + ", ".join(f"{clave} {valor}" for clave, valor in resumen.items()))
+        if args.salida:
+            with open(args.salida, "w", encoding="utf-8") as archivo:
+                json.dump({"filas": args.filas, "resultados": resultados, "resumen": resumen}, archivo, indent=2)
+    finally:
+        _comun.limpiar_formularios(ids + creados)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--calentamiento", type=int, default=10)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    principal(parser.parse_args())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tiempo de serialización de una respuesta de N filas, sin base de datos ni red.
+
+- pydantic: fila dict -> FormularioClienteResponse -> ApiResponse, y luego lo que
+  hace FastAPI con `response_model` (revalidar + jsonable_encoder) y JSONResponse.
+- rapida: fila dict -> FormularioRegistro -> RespuestaApi -> RespuestaJSON (orjson).
+
+Verifica además que ambos caminos producen el mismo JSON.
+
+Uso: python benchmarks/bench_serializacion.py [--filas 1000 10000] [--repeticiones 20]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import _comun  # noqa: F401  (agrega la raíz del proyecto al sys.path)
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import ApiResponse, FormularioClienteResponse, FormularioRegistro, RespuestaApi
+from respuestas import ORJSON_DISPONIBLE, RespuestaJSON
+
+MENSAJE = ["Los formularios fueron consultados satisfactoriamente."]
+
+
+def filas_ejemplo(cantidad):
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "nombre_completo": f"Cliente Prueba {i}",
+            "email": f"cliente{i}@ejemplo.com",
+            "telefono": 3000000000 + i,
+            "mensaje": "Mensaje de prueba para medir la serialización de la respuesta.",
+            "created_at": base + timedelta(microseconds=i * 137),
+            "updated_at": base + timedelta(seconds=i),
+        }
+        for i in range(cantidad)
+    ]
+
+
+async def camino_pydantic(filas, campo):
+    respuesta = ApiResponse(message=MENSAJE, data=[FormularioClienteResponse(**fila) for fila in filas])
+    contenido = await serialize_response(field=campo, response_content=respuesta)
+    return JSONResponse(contenido).body
+
+
+async def camino_rapido(filas, campo):
+    respuesta = RespuestaApi(message=MENSAJE, data=[FormularioRegistro(**fila) for fila in filas])
+    return RespuestaJSON(respuesta).body
+
+
+async def medir(camino, filas, campo, repeticiones):
+    await camino(filas, campo)  # calentamiento
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        await camino(filas, campo)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {"mediana_ms": round(tiempos[len(tiempos) // 2] * 1000, 3), "min_ms": round(tiempos[0] * 1000, 3)}
+
+
+async def principal(args):
+    campo = create_response_field(name="response", type_=ApiResponse)
+    resultados = {}
+    for cantidad in args.filas:
+        filas = filas_ejemplo(cantidad)
+        assert json.loads(await camino_pydantic(filas, campo)) == json.loads(await camino_rapido(filas, campo))
+
+        pydantic = await medir(camino_pydantic, filas, campo, args.repeticiones)
+        rapida = await medir(camino_rapido, filas, campo, args.repeticiones)
+        resultados[cantidad] = {
+            "pydantic": pydantic,
+            "rapida": rapida,
+            "aceleracion": round(pydantic["mediana_ms"] / rapida["mediana_ms"], 1),
+        }
+        print(f"{cantidad:>7} filas: {resultados[cantidad]}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump({"orjson": ORJSON_DISPONIBLE, "resultados": resultados}, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    asyncio.run(principal(parser.parse_args()))
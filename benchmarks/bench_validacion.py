@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Formularios validados por segundo con FormularioClienteCreate, sin base de datos.
+
+Compara los modelos actuales (validaciones.py: StringConstraints y AfterValidator
+con patrones precompilados) contra una copia de los modelos anteriores con
+`@validator` de pydantic v1, para payloads válidos e inválidos, uno por uno
+(/create) y como lista completa (/bulk). Los emails de prueba comparten dominio,
+como ocurre en la práctica, así que el dominio se valida una sola vez.
+
+Uso: python benchmarks/bench_validacion.py [--payloads 20000] [--repeticiones 5]
+"""
+import argparse
+import json
+import re
+import time
+from typing import List
+
+import _comun  # noqa: F401  (agrega la raíz del proyecto al sys.path)
+from _comun import formulario_ejemplo
+
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter, ValidationError, validator
+
+from models import FormularioClienteCreate
+
+
+class FormularioReferencia(BaseModel):
+    """Copia de FormularioClienteCreate antes de validaciones.py"""
+    nombre_completo: str = Field(..., min_length=2, max_length=255)
+    email: EmailStr = Field(...)
+    telefono: int = Field(...)
+    mensaje: str = Field(..., min_length=1, max_length=500)
+
+    @validator('nombre_completo')
+    def validate_nombre_completo(cls, v):
+        if not re.match(r'^[a-zA-ZáéíóúüñÁÉÍÓÚÜÑ\s\-\'\.]+$', v.strip()):
+            raise ValueError('El nombre solo puede contener letras, espacios, guiones y apóstrofes')
+        palabras = v.strip().split()
+        if len(palabras) < 2:
+            raise ValueError('Debe ingresar nombre y apellido')
+        return v.strip().title()
+
+    @validator('telefono')
+    def validate_telefono(cls, v):
+        if not re.match(r'^\d{7,15}$', str(v)):
+            raise ValueError('El teléfono debe tener entre 7 y 15 dígitos')
+        return v
+
+    @validator('mensaje')
+    def validate_mensaje(cls, v):
+        if len(v.strip().split()) > 500:
+            raise ValueError('El mensaje no puede exceder las 500 palabras')
+        return v.strip()
+
+
+def payloads_invalidos(cantidad):
+    return [
+        {**formulario_ejemplo(i), "nombre_completo": "solo", "telefono": 12}
+        for i in range(cantidad)
+    ]
+
+
+def por_segundo(funcion, cantidad, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return round(cantidad / mejor)
+
+
+def uno_por_uno(modelo, payloads):
+    def correr():
+        for payload in payloads:
+            try:
+                modelo.model_validate(payload)
+            except ValidationError:
+                pass
+    return correr
+
+
+def como_lista(modelo, payloads):
+    adaptador = TypeAdapter(List[modelo])
+
+    def correr():
+        try:
+            adaptador.validate_python(payloads)
+        except ValidationError:
+            pass
+    return correr
+
+
+def principal(args):
+    validos = [formulario_ejemplo(i) for i in range(args.payloads)]
+    invalidos = payloads_invalidos(args.payloads)
+
+    resultados = {}
+    for nombre, modelo in (("referencia_v1", FormularioReferencia), ("actual", FormularioClienteCreate)):
+        resultados[nombre] = {
+            "validos_por_segundo": por_segundo(uno_por_uno(modelo, validos), len(validos), args.repeticiones),
+            "invalidos_por_segundo": por_segundo(uno_por_uno(modelo, invalidos), len(invalidos), args.repeticiones),
+            "lista_por_segundo": por_segundo(como_lista(modelo, validos), len(validos), args.repeticiones),
+        }
+        print(f"{nombre:>14}: {resultados[nombre]}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="ruta opcional para guardar el resultado en JSON")
+    principal(parser.parse_args())
@@ -0,0 +1,216 @@
+"""
+Repositorio en memoria con la misma interfaz async que FormularioClienteRepositoryAsync.
+
+Sustituye a PostgreSQL en bench_carga.py (`--bd memoria`) para medir la API
+sin base de datos: cada método cuenta como un viaje a la base en
+`db_consulta_segundos`, igual que una sentencia real. La búsqueda por texto
+es una coincidencia de palabras sin ranking; no pretende imitar tsvector.
+"""
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Set, Tuple, Union
+import uuid
+
+from metricas import medido_repositorio, observar_consulta, observar_filas
+from models import (
+    CambioFormulario, FiltrosBusqueda, FormularioClienteCreate, FormularioClienteUpdate, FormularioRegistro,
+)
+from paginacion import codificar_cursor_cambios
+
+
+class FormularioClienteRepositoryMemoria:
+
+    def __init__(self):
+        self._por_id = {}
+        self._orden = []  # claves (created_at, id) en orden ascendente
+        self._cambios = []  # (txid, id, operacion, formulario_id, fecha) en orden
+        self._txid = 0
+
+    def _viaje(self, filas: int):
+        observar_consulta(0.0)
+        observar_filas(filas)
+
+    def _guardar(self, registro: FormularioRegistro):
+        self._por_id[registro.id] = registro
+        insort(self._orden, (registro.created_at, registro.id))
+
+    def _quitar(self, registro: FormularioRegistro):
+        del self._por_id[registro.id]
+        del self._orden[bisect_left(self._orden, (registro.created_at, registro.id))]
+
+    def _anotar(self, operacion: str, formulario_ids):
+        """Registro de cambios: cada llamada hace de una transacción"""
+        self._txid += 1
+        fecha = datetime.now()
+        for formulario_id in formulario_ids:
+            self._cambios.append((self._txid, len(self._cambios) + 1, operacion, formulario_id, fecha))
+
+    def _nuevo(self, formulario: FormularioClienteCreate, fecha: datetime) -> FormularioRegistro:
+        return FormularioRegistro(
+            id=str(uuid.uuid4()),
+            nombre_completo=formulario.nombre_completo,
+            email=formulario.email,
+            telefono=formulario.telefono,
+            mensaje=formulario.mensaje,
+            created_at=fecha,
+            updated_at=fecha,
+        )
+
+    def sembrar(self, cantidad: int) -> List[str]:
+        """Carga `cantidad` formularios como _comun.sembrar_formularios y devuelve sus IDs"""
+        ahora = datetime.now()
+        ids = []
+        for g in range(1, cantidad + 1):
+            fecha = ahora - timedelta(seconds=g)
+            registro = FormularioRegistro(
+                id=str(uuid.uuid4()), nombre_completo="Cliente Prueba", email=f"bench{g}@example.com",
+                telefono=3000000000 + g, mensaje=f"Mensaje de prueba {g}", created_at=fecha, updated_at=fecha,
+            )
+            self._guardar(registro)
+            ids.append(registro.id)
+        return ids
+
+    @medido_repositorio
+    async def crear_formulario(self, formulario: FormularioClienteCreate) -> FormularioRegistro:
+        registro = self._nuevo(formulario, datetime.now())
+        self._guardar(registro)
+        self._anotar("crear", [registro.id])
+        self._viaje(1)
+        return registro
+
+    @medido_repositorio
+    async def crear_formularios_lote(self, formularios: List[FormularioClienteCreate], atomico: bool = True,
+                                     tamano_tramo: int = 1000) -> List[Union[FormularioRegistro, Exception]]:
+        fecha = datetime.now()
+        resultados = [self._nuevo(formulario, fecha) for formulario in formularios]
+        for registro in resultados:
+            self._guardar(registro)
+        self._anotar("crear", [registro.id for registro in resultados])
+        for inicio in range(0, len(resultados), tamano_tramo):
+            self._viaje(len(resultados[inicio:inicio + tamano_tramo]))
+        return resultados
+
+    @medido_repositorio
+    async def buscar_por_id(self, formulario_id: str) -> Optional[FormularioRegistro]:
+        registro = self._por_id.get(formulario_id)
+        self._viaje(1 if registro else 0)
+        return registro
+
+    @medido_repositorio
+    async def buscar_por_ids(self, formulario_ids: List[str]) -> List[FormularioRegistro]:
+        registros = [self._por_id[i] for i in set(formulario_ids) if i in self._por_id]
+        self._viaje(len(registros))
+        return registros
+
+    @medido_repositorio
+    async def version_por_id(self, formulario_id: str) -> Optional[datetime]:
+        registro = self._por_id.get(formulario_id)
+        self._viaje(1 if registro else 0)
+        return registro.updated_at if registro else None
+
+    @medido_repositorio
+    async def version_coleccion(self) -> Tuple[Optional[datetime], int]:
+        self._viaje(1)
+        return max((registro.updated_at for registro in self._por_id.values()), default=None), len(self._por_id)
+
+    def _desde(self, despues_de):
+        """Registros en orden (created_at, id) descendente, después de la posición `despues_de`"""
+        fin = len(self._orden) if despues_de is None else bisect_left(self._orden, tuple(despues_de))
+        for indice in range(fin - 1, -1, -1):
+            yield self._por_id[self._orden[indice][1]]
+
+    @medido_repositorio
+    async def buscar_pagina(self, limite: int, despues_de=None) -> List[FormularioRegistro]:
+        pagina = []
+        for registro in self._desde(despues_de):
+            if len(pagina) == limite:
+                break
+            pagina.append(registro)
+        self._viaje(len(pagina))
+        return pagina
+
+    @medido_repositorio
+    async def buscar_filtrados(self, filtros: FiltrosBusqueda, limite: int,
+                               despues_de=None) -> List[Tuple[FormularioRegistro, Optional[float]]]:
+        palabras = set((filtros.texto or "").lower().split())
+        # Sin ranking: con texto el cursor trae (rango, created_at, id) y se ignora el rango
+        posicion = despues_de[1:] if despues_de is not None and palabras else despues_de
+        pagina = []
+        for registro in self._desde(posicion):
+            if len(pagina) == limite:
+                break
+            if filtros.email is not None and registro.email != filtros.email:
+                continue
+            if filtros.email_prefijo and not registro.email.startswith(filtros.email_prefijo):
+                continue
+            if filtros.telefono is not None and registro.telefono != filtros.telefono:
+                continue
+            if filtros.desde is not None and registro.created_at < filtros.desde:
+                continue
+            if filtros.hasta is not None and registro.created_at >= filtros.hasta:
+                continue
+            if palabras and not palabras <= set(f"{registro.nombre_completo} {registro.mensaje}".lower().split()):
+                continue
+            pagina.append((registro, 0.0 if palabras else None))
+        self._viaje(len(pagina))
+        return pagina
+
+    @medido_repositorio
+    async def buscar_cambios(self, despues_de: Tuple[int, int], limite: int) -> List[CambioFormulario]:
+        inicio = bisect_right(self._cambios, tuple(despues_de), key=lambda cambio: cambio[:2])
+        cambios = [
+            CambioFormulario(
+                cursor=codificar_cursor_cambios(txid, cambio_id), operacion=operacion, id=formulario_id,
+                fecha=fecha, formulario=self._por_id.get(formulario_id) if operacion != "eliminar" else None,
+            )
+            for txid, cambio_id, operacion, formulario_id, fecha in self._cambios[inicio:inicio + limite]
+        ]
+        self._viaje(len(cambios))
+        return cambios
+
+    @medido_repositorio
+    async def posicion_cambios(self) -> Tuple[int, int]:
+        self._viaje(1)
+        return self._txid + 1, 0
+
+    async def iterar_todos(self, despues_de=None, tamano_lote: int = 500) -> AsyncIterator[FormularioRegistro]:
+        for registro in list(self._desde(despues_de)):
+            yield registro
+
+    @medido_repositorio
+    async def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate,
+                                    versiones: Optional[List[datetime]] = None) -> Optional[FormularioRegistro]:
+        registro = self._por_id.get(formulario_id)
+        if registro is None or (versiones is not None and registro.updated_at not in versiones):
+            self._viaje(0)
+            return None
+        cambios = {campo: valor for campo, valor in formulario.model_dump().items() if valor is not None}
+        actualizado = replace(registro, updated_at=datetime.now(), **cambios)
+        self._por_id[formulario_id] = actualizado
+        self._anotar("actualizar", [formulario_id])
+        self._viaje(1)
+        return actualizado
+
+    @medido_repositorio
+    async def eliminar_formulario(self, formulario_id: str, versiones: Optional[List[datetime]] = None) -> bool:
+        registro = self._por_id.get(formulario_id)
+        if registro is None or (versiones is not None and registro.updated_at not in versiones):
+            self._viaje(0)
+            return False
+        self._quitar(registro)
+        self._anotar("eliminar", [formulario_id])
+        self._viaje(1)
+        return True
+
+    @medido_repositorio
+    async def eliminar_formularios_lote(self, formulario_ids: List[str], atomico: bool = True) -> Tuple[Set[str], bool]:
+        encontrados = {formulario_id for formulario_id in formulario_ids if formulario_id in self._por_id}
+        if atomico and len(encontrados) < len(set(formulario_ids)):
+            self._viaje(0)
+            return encontrados, False
+        for formulario_id in encontrados:
+            self._quitar(self._por_id[formulario_id])
+        self._anotar("eliminar", encontrados)
+        self._viaje(len(encontrados))
+        return encontrados, True
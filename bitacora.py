@@ -0,0 +1,232 @@
+"""
+Logs estructurados que no frenan las peticiones.
+
+`configurar_logs()` deja en el logger raíz un solo handler que encola cada
+registro; un hilo aparte (QueueListener) formatea las trazas, arma la línea y
+escribe en stderr. Ni el event loop ni los hilos del threadpool esperan por la
+E/S de los logs. Los módulos registran con argumentos `%`
+(`logger.error("Error creando formulario: %s", e)`): con el nivel desactivado
+el mensaje ni siquiera se arma.
+
+- LOG_FORMATO=json escribe un objeto JSON por línea con la hora, el nivel, el
+  logger, el mensaje, el `request_id` de la petición en curso y la traza si hay
+  excepción; `texto` usa el formato de siempre.
+- MiddlewareIdPeticion toma el ID de la cabecera X-Request-ID (o genera uno),
+  lo deja en `id_peticion` para los logs de la petición, también los del
+  threadpool, y lo devuelve en la respuesta.
+- Muestreo: de un mismo error (mismo punto del código y mismo tipo de
+  excepción) se escriben LOG_MUESTREO_MAXIMO por ventana de
+  LOG_MUESTREO_VENTANA_S segundos; el primero de la ventana siguiente informa
+  cuántos se omitieron (`omitidos`).
+- Con la cola llena (LOG_COLA_MAXIMA registros) el registro se descarta y se
+  cuenta, en vez de bloquear la petición.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import copy
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+
+from respuestas import dumps
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json").lower()  # json o texto
+LOG_COLA_MAXIMA = int(os.getenv("LOG_COLA_MAXIMA") or "10000")
+LOG_MUESTREO_VENTANA_S = float(os.getenv("LOG_MUESTREO_VENTANA_S") or "10")
+LOG_MUESTREO_MAXIMO = int(os.getenv("LOG_MUESTREO_MAXIMO") or "5")  # 0 = sin muestreo
+
+FORMATO_TEXTO = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+SIN_PETICION = "-"
+CABECERA_ID_PETICION = b"x-request-id"
+_ID_VALIDO = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+id_peticion: ContextVar[str] = ContextVar("id_peticion", default=SIN_PETICION)
+
+estadisticas_logs = {"descartados": 0, "omitidos": 0}
+_cola: Optional[queue.Queue] = None
+_oyente: Optional[QueueListener] = None
+
+
+class FiltroPeticion(logging.Filter):
+    """Agrega al registro el ID de la petición en curso (se lee en el hilo que registra)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = id_peticion.get()
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar `maximo` registros iguales de nivel WARNING o más por ventana de `ventana` segundos.
+
+    Dos registros son iguales si salen de la misma línea con el mismo tipo de
+    excepción; las claves quedan acotadas por los puntos del código que registran.
+    """
+
+    def __init__(self, ventana: float = LOG_MUESTREO_VENTANA_S, maximo: int = LOG_MUESTREO_MAXIMO):
+        super().__init__()
+        self.ventana = ventana
+        self.maximo = maximo
+        self._vistos = {}  # clave -> [inicio de la ventana, escritos, omitidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.maximo <= 0 or record.levelno < logging.WARNING:
+            return True
+        if record.exc_info:
+            tipo = record.exc_info[0]
+        else:
+            argumentos = record.args if isinstance(record.args, tuple) else ()
+            tipo = next((type(a) for a in argumentos if isinstance(a, BaseException)), None)
+        clave = (record.pathname, record.lineno, tipo)
+        ahora = time.monotonic()
+        with self._lock:
+            visto = self._vistos.get(clave)
+            if visto is None or ahora - visto[0] >= self.ventana:
+                if visto is not None and visto[2]:
+                    record.omitidos = visto[2]
+                self._vistos[clave] = [ahora, 1, 0]
+                return True
+            if visto[1] < self.maximo:
+                visto[1] += 1
+                return True
+            visto[2] += 1
+            estadisticas_logs["omitidos"] += 1
+        return False
+
+
+class ManejadorCola(QueueHandler):
+    """QueueHandler que no bloquea con la cola llena y deja el formateo para el hilo"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            estadisticas_logs["descartados"] += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Solo el mensaje se arma aquí, porque los argumentos pueden cambiar
+        # después; la traza, la línea JSON y la escritura quedan para el hilo
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class FormateadorJson(logging.Formatter):
+    """Un objeto JSON por línea"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        linea = {
+            "hora": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", SIN_PETICION)
+        if request_id != SIN_PETICION:
+            linea["request_id"] = request_id
+        if getattr(record, "omitidos", 0):
+            linea["omitidos"] = record.omitidos
+        if record.exc_info:
+            linea["excepcion"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            linea["pila"] = self.formatStack(record.stack_info)
+        return dumps(linea).decode("utf-8")
+
+
+class _FormateadorTexto(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = SIN_PETICION
+        texto = super().format(record)
+        if getattr(record, "omitidos", 0):
+            texto += f" ({record.omitidos} iguales omitidos)"
+        return texto
+
+
+def configurar_logs(nivel: str = LOG_LEVEL, formato: str = LOG_FORMATO):
+    """Deja el logger raíz con el handler en cola y arranca el hilo que escribe.
+
+    Solo tiene efecto la primera vez en cada proceso.
+    """
+    global _cola, _oyente
+    if _oyente is not None:
+        return
+    salida = logging.StreamHandler(sys.stderr)
+    salida.setFormatter(FormateadorJson() if formato == "json" else _FormateadorTexto(FORMATO_TEXTO))
+    _cola = queue.Queue(LOG_COLA_MAXIMA)
+    manejador = ManejadorCola(_cola)
+    manejador.addFilter(FiltroMuestreo())
+    manejador.addFilter(FiltroPeticion())
+
+    raiz = logging.getLogger()
+    for anterior in list(raiz.handlers):
+        raiz.removeHandler(anterior)
+    raiz.addHandler(manejador)
+    raiz.setLevel(nivel.upper())
+    # uvicorn instala sus propios handlers al arrancar; sus registros (también el
+    # access log) pasan por la misma cola y salen con el mismo formato
+    for nombre in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger_uvicorn = logging.getLogger(nombre)
+        logger_uvicorn.handlers.clear()
+        logger_uvicorn.propagate = True
+
+    _oyente = QueueListener(_cola, salida)
+    _oyente.start()
+    atexit.register(detener_logs)
+
+
+def detener_logs():
+    """Escribe lo que queda en la cola y detiene el hilo"""
+    global _oyente
+    if _oyente is not None:
+        _oyente.stop()
+        _oyente = None
+
+
+def estadisticas() -> dict:
+    return {
+        "formato": LOG_FORMATO,
+        "nivel": logging.getLevelName(logging.getLogger().level),
+        "en_cola": _cola.qsize() if _cola is not None else 0,
+        "cola_maxima": LOG_COLA_MAXIMA,
+        "descartados": estadisticas_logs["descartados"],
+        "omitidos": estadisticas_logs["omitidos"],
+    }
+
+
+class MiddlewareIdPeticion:
+    """Middleware ASGI: ID de la petición para los logs, tomado de X-Request-ID o generado"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recibido = next((valor for nombre, valor in scope["headers"] if nombre == CABECERA_ID_PETICION), b"")
+        recibido = recibido.decode("latin-1")
+        # Solo se acepta un ID corto y sin espacios, para que no pueda inyectar texto en los logs
+        valor = recibido if _ID_VALIDO.fullmatch(recibido) else uuid.uuid4().hex
+        # Sin reset: uvicorn atiende cada petición en su propia tarea, así que el valor
+        # no pasa a la siguiente y sigue visible en el manejador global de errores
+        id_peticion.set(valor)
+        cabecera = (CABECERA_ID_PETICION, valor.encode("latin-1"))
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                mensaje["headers"] = [*mensaje.get("headers", ()), cabecera]
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
@@ -0,0 +1,402 @@
+"""
+Caché de lectura para GET /formulario/{id}.
+
+Dos niveles:
+- Local (por worker): LRU con TTL y número máximo de entradas.
+- Compartido (opcional): cualquier implementación de `CacheCompartido`.
+  `CacheCompartidoRedis` se activa con CACHE_COMPARTIDO_URL y publica las
+  invalidaciones para que los demás workers limpien su nivel local;
+  `CacheCompartidoMemoria` es el sustituto local para desarrollo y pruebas.
+
+Con más de un worker el caché solo se habilita si el nivel compartido publica
+las invalidaciones (Redis): de lo contrario un worker seguiría sirviendo la
+fila que otro acaba de actualizar o eliminar. La suscripción se inicia al
+arrancar el worker (`iniciar()`) y se reconecta si Redis la corta; mientras el
+worker no está suscrito, el nivel local queda vacío y sin uso.
+
+También guarda los 404 (caché negativa, con TTL propio) y evita estampidas:
+las peticiones concurrentes que fallan en la misma clave esperan una sola
+carga. Si una escritura invalida una clave mientras su carga está en curso,
+esa carga se marca como obsoleta y su resultado no se guarda, así el worker
+no vuelve a cachear el valor anterior a la escritura.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from models import FormularioRegistro
+from replicas import escrituras_recientes
+from respuestas import dumps, registro_desde_json
+
+logger = logging.getLogger(__name__)
+
+# Marca de "no existe" para la caché negativa
+NO_ENCONTRADO = object()
+
+
+class CacheLocal:
+    """LRU con TTL por entrada, seguro entre hilos"""
+
+    def __init__(self, max_entradas: int = 10000):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+        self.desalojos = 0
+        self.expiraciones = 0
+
+    def obtener(self, clave):
+        """Devuelve el valor o None si no está o expiró"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira_en, valor = entrada
+            if expira_en <= time.monotonic():
+                del self._datos[clave]
+                self.expiraciones += 1
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl: float):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class CacheCompartido(ABC):
+    """Interfaz del nivel compartido entre workers"""
+
+    # True si las invalidaciones llegan a los demás workers (escuchar_invalidaciones)
+    publica_invalidaciones = False
+
+    @abstractmethod
+    async def obtener(self, clave: str):
+        ...
+
+    @abstractmethod
+    async def guardar(self, clave: str, valor, ttl: float):
+        ...
+
+    @abstractmethod
+    async def eliminar(self, clave: str):
+        ...
+
+    async def escuchar_invalidaciones(self, callback: Callable[[str], None], suscripcion: Callable[[bool], None]):
+        """Arranca la escucha de las invalidaciones hechas por otros workers.
+
+        `callback` recibe cada clave invalidada y `suscripcion` se llama con True
+        cuando la suscripción queda confirmada y con False cuando se pierde.
+        """
+
+    async def cerrar(self):
+        pass
+
+
+class CacheCompartidoMemoria(CacheCompartido):
+    """Sustituto local del nivel compartido (un solo proceso)"""
+
+    def __init__(self):
+        self._local = CacheLocal(max_entradas=100000)
+
+    async def obtener(self, clave: str):
+        return self._local.obtener(clave)
+
+    async def guardar(self, clave: str, valor, ttl: float):
+        self._local.guardar(clave, valor, ttl)
+
+    async def eliminar(self, clave: str):
+        self._local.eliminar(clave)
+
+
+class CacheCompartidoRedis(CacheCompartido):
+    """Nivel compartido en Redis; las invalidaciones se publican en un canal"""
+
+    CANAL = "formulario:invalidaciones"
+    publica_invalidaciones = True
+    PREFIJO = "formulario:"
+    VALOR_NO_ENCONTRADO = "__404__"
+
+    ESPERA_RECONEXION_MINIMA = 0.5
+    ESPERA_RECONEXION_MAXIMA = 30.0
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # dependencia opcional
+
+        self._redis = redis.from_url(url)
+        self._tarea_escucha = None
+
+    async def obtener(self, clave: str):
+        crudo = await self._redis.get(self.PREFIJO + clave)
+        if crudo is None:
+            return None
+        if crudo == self.VALOR_NO_ENCONTRADO.encode():
+            return NO_ENCONTRADO
+        return registro_desde_json(crudo)
+
+    async def guardar(self, clave: str, valor, ttl: float):
+        crudo = self.VALOR_NO_ENCONTRADO if valor is NO_ENCONTRADO else dumps(valor)
+        await self._redis.set(self.PREFIJO + clave, crudo, px=max(1, int(ttl * 1000)))
+
+    async def eliminar(self, clave: str):
+        await self._redis.delete(self.PREFIJO + clave)
+        await self._redis.publish(self.CANAL, clave)
+
+    async def escuchar_invalidaciones(self, callback: Callable[[str], None], suscripcion: Callable[[bool], None]):
+        if self._tarea_escucha is None:
+            self._tarea_escucha = asyncio.create_task(self._escuchar(callback, suscripcion))
+
+    async def _escuchar(self, callback: Callable[[str], None], suscripcion: Callable[[bool], None]):
+        """Escucha el canal hasta que se cancele la tarea; ante un error o un corte vuelve a suscribirse"""
+        espera = self.ESPERA_RECONEXION_MINIMA
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.CANAL)
+                async for mensaje in pubsub.listen():
+                    if mensaje.get("type") == "subscribe":
+                        # Desde aquí Redis entrega todo lo publicado en el canal
+                        suscripcion(True)
+                        espera = self.ESPERA_RECONEXION_MINIMA
+                    elif mensaje.get("type") == "message":
+                        callback(mensaje["data"].decode())
+                logger.warning("Redis cerró la suscripción a las invalidaciones del caché; reconectando")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Suscripción a las invalidaciones del caché perdida (%s); reintento en %.1f s", e, espera)
+            finally:
+                suscripcion(False)
+                try:
+                    await asyncio.shield(pubsub.aclose())
+                except Exception:
+                    pass
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, self.ESPERA_RECONEXION_MAXIMA)
+
+    async def cerrar(self):
+        if self._tarea_escucha is not None:
+            self._tarea_escucha.cancel()
+            try:
+                await self._tarea_escucha
+            except asyncio.CancelledError:
+                pass
+            self._tarea_escucha = None
+        await self._redis.aclose()
+
+
+class CacheFormularios:
+    """Caché de lectura con invalidación en escrituras, caché negativa y protección ante estampidas"""
+
+    def __init__(self, habilitado: bool = True, max_entradas: int = 10000, ttl: float = 60.0,
+                 ttl_negativo: float = 5.0, compartido: Optional[CacheCompartido] = None, workers: int = 1):
+        self.compartido = compartido
+        # Una escritura solo limpia el nivel local del worker que la atiende: con varios
+        # workers el caché sirve filas viejas salvo que las invalidaciones se publiquen
+        self.invalidacion_entre_workers = workers <= 1 or (
+            compartido is not None and compartido.publica_invalidaciones)
+        if habilitado and not self.invalidacion_entre_workers:
+            logger.warning("Caché de lectura desactivado: hay %s workers y CACHE_COMPARTIDO_URL no publica "
+                           "invalidaciones entre ellos (configurar Redis)", workers)
+            habilitado = False
+        self.habilitado = habilitado
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.local = CacheLocal(max_entradas)
+        self._en_vuelo = {}       # clave -> tarea de la carga en curso
+        self._obsoletas = set()   # cargas en curso invalidadas por una escritura
+        # Con invalidaciones publicadas el nivel local solo se usa mientras el worker está suscrito
+        self._requiere_suscripcion = compartido is not None and compartido.publica_invalidaciones
+        self._suscrito = False
+
+        self.aciertos = 0
+        self.aciertos_compartido = 0
+        self.aciertos_negativos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.invalidaciones = 0
+
+    def _invalidar_local(self, clave: str):
+        self.local.eliminar(clave)
+        tarea = self._en_vuelo.pop(clave, None)
+        if tarea is not None:
+            # La carga en curso pudo leer la fila antes de la escritura: no debe guardarse
+            self._obsoletas.add(tarea)
+
+    def _invalidacion_remota(self, clave: str):
+        # Otro worker escribió la fila: sus lecturas van al primario durante la ventana de replicas.py
+        escrituras_recientes.marcar([clave])
+        self._invalidar_local(clave)
+
+    def _suscripcion(self, activa: bool):
+        if activa == self._suscrito:
+            return
+        self._suscrito = activa
+        if activa:
+            logger.info("Suscrito a las invalidaciones del caché compartido; nivel local activo")
+        else:
+            logger.warning("Sin suscripción a las invalidaciones del caché compartido; nivel local desactivado")
+        # Lo guardado o cargado sin suscripción pudo perderse invalidaciones de otros workers
+        self.local.limpiar()
+        self._obsoletas.update(self._en_vuelo.values())
+        self._en_vuelo.clear()
+
+    def _local_activo(self) -> bool:
+        return self.habilitado and (self._suscrito or not self._requiere_suscripcion)
+
+    async def iniciar(self):
+        """Suscribe el worker a las invalidaciones de los demás; se llama al arrancar el worker"""
+        if self.habilitado and self.compartido is not None:
+            await self.compartido.escuchar_invalidaciones(self._invalidacion_remota, self._suscripcion)
+
+    def _resolver(self, valor):
+        if valor is NO_ENCONTRADO:
+            self.aciertos_negativos += 1
+            return None
+        return valor
+
+    def _carga_terminada(self, clave: str, tarea: asyncio.Task):
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        self._obsoletas.discard(tarea)
+        if not tarea.cancelled():
+            tarea.exception()  # marca la excepción como recuperada
+
+    async def obtener_o_cargar(self, clave: str, cargar: Callable[[], Awaitable[Optional[FormularioRegistro]]]):
+        """Devuelve el formulario (o None si no existe) desde el caché o llamando a `cargar`"""
+        if not self.habilitado:
+            return await cargar()
+
+        valor = self.local.obtener(clave) if self._local_activo() else None
+        if valor is not None:
+            self.aciertos += 1
+            return self._resolver(valor)
+
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self.coalescidas += 1
+        else:
+            # La carga corre en su propia tarea: si quien la inició se cancela,
+            # las demás peticiones que la esperan no se ven afectadas
+            tarea = asyncio.create_task(self._cargar_desde_niveles(clave, cargar))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._carga_terminada(clave, t))
+        return await asyncio.shield(tarea)
+
+    def obtener_local(self, clave: str):
+        """Valor del nivel local sin cargarlo: el formulario, NO_ENCONTRADO o None si no está"""
+        if not self._local_activo():
+            return None
+        return self.local.obtener(clave)
+
+    def _vigente(self) -> bool:
+        return asyncio.current_task() not in self._obsoletas and self._local_activo()
+
+    async def _cargar_desde_niveles(self, clave, cargar):
+        if self.compartido is not None:
+            try:
+                valor = await self.compartido.obtener(clave)
+            except Exception as e:
+                logger.error("Error leyendo caché compartido: %s", e)
+                valor = None
+            if valor is not None:
+                self.aciertos_compartido += 1
+                if self._vigente():
+                    self.local.guardar(clave, valor, self.ttl_negativo if valor is NO_ENCONTRADO else self.ttl)
+                return self._resolver(valor)
+
+        self.fallos += 1
+        resultado = await cargar()
+        if self._vigente():
+            await self._guardar(clave, resultado)
+        return resultado
+
+    async def _guardar(self, clave: str, resultado):
+        valor, ttl = (NO_ENCONTRADO, self.ttl_negativo) if resultado is None else (resultado, self.ttl)
+        if self._local_activo():
+            self.local.guardar(clave, valor, ttl)
+        if self.compartido is not None:
+            try:
+                await self.compartido.guardar(clave, valor, ttl)
+            except Exception as e:
+                logger.error("Error escribiendo caché compartido: %s", e)
+
+    async def guardar(self, clave: str, resultado: FormularioRegistro):
+        """Precarga un formulario recién creado"""
+        if self.habilitado:
+            await self._guardar(clave, resultado)
+
+    async def invalidar(self, clave: str):
+        """Quita la clave de ambos niveles; se llama después de confirmar cada escritura"""
+        if not self.habilitado:
+            return
+        self.invalidaciones += 1
+        self._invalidar_local(clave)
+        if self.compartido is not None:
+            try:
+                await self.compartido.eliminar(clave)
+            except Exception as e:
+                logger.error("Error invalidando caché compartido: %s", e)
+
+    def estadisticas(self) -> dict:
+        return {
+            "habilitado": self.habilitado,
+            "invalidacion_entre_workers": self.invalidacion_entre_workers,
+            "nivel_local_activo": self._local_activo(),
+            "entradas": len(self.local),
+            "aciertos": self.aciertos,
+            "aciertos_compartido": self.aciertos_compartido,
+            "aciertos_negativos": self.aciertos_negativos,
+            "fallos": self.fallos,
+            "coalescidas": self.coalescidas,
+            "desalojos": self.local.desalojos,
+            "expiraciones": self.local.expiraciones,
+            "invalidaciones": self.invalidaciones,
+        }
+
+    async def cerrar(self):
+        if self.compartido is not None:
+            await self.compartido.cerrar()
+
+
+def crear_cache_compartido() -> Optional[CacheCompartido]:
+    url = os.getenv("CACHE_COMPARTIDO_URL", "")
+    if not url:
+        return None
+    if url == "memoria://":
+        return CacheCompartidoMemoria()
+    try:
+        return CacheCompartidoRedis(url)
+    except ImportError:
+        logger.warning("CACHE_COMPARTIDO_URL configurado pero el paquete 'redis' no está instalado; se usa solo el caché local")
+        return None
+
+
+formulario_cache = CacheFormularios(
+    habilitado=os.getenv("CACHE_HABILITADO", "true").lower() == "true",
+    max_entradas=int(os.getenv("CACHE_MAX_ENTRADAS", "10000")),
+    ttl=float(os.getenv("CACHE_TTL", "60")),
+    ttl_negativo=float(os.getenv("CACHE_TTL_NEGATIVO", "5")),
+    compartido=crear_cache_compartido(),
+    # run_server.py fija SERVIDOR_WORKERS; uvicorn --workers toma WEB_CONCURRENCY
+    workers=int(os.getenv("SERVIDOR_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1"),
+)
@@ -0,0 +1,112 @@
+"""
+Registro de cambios de formulario_cliente (migraciones/0003_cambios.sql).
+
+Cada INSERT, UPDATE y DELETE de los repositorios anota sus filas en
+formulario_cambios dentro de la misma sentencia (consultas.registrar_cambios),
+así que un evento existe si y solo si su cambio se confirmó. Los consumidores
+leen los eventos desde un cursor:
+
+- GET /formulario/sync?since=<cursor>: página JSON de eventos y el cursor siguiente.
+- GET /formulario/changes: stream SSE que se reanuda con Last-Event-ID.
+
+`OyenteCambios` mantiene por worker una conexión con LISTEN al canal que
+notifica el trigger de la tabla y despierta a los streams abiertos; si no hay
+psycopg 3 o la conexión falla, los streams consultan cada
+CAMBIOS_INTERVALO_SONDEO segundos.
+"""
+from typing import Optional
+import asyncio
+import logging
+import os
+
+from database_async import ASYNC_DISPONIBLE, db_connection_async, psycopg
+from models import CambioFormulario, FormularioRegistro
+from paginacion import codificar_cursor_cambios
+
+logger = logging.getLogger(__name__)
+
+CANAL_CAMBIOS = "formulario_cambios"
+CAMBIOS_INTERVALO_SONDEO = float(os.getenv("CAMBIOS_INTERVALO_SONDEO", "2"))
+CAMBIOS_LATIDO = float(os.getenv("CAMBIOS_LATIDO", "15"))
+CAMBIOS_TAMANO_LOTE = int(os.getenv("CAMBIOS_TAMANO_LOTE", "500"))
+
+
+def cambio_desde_fila(fila: dict) -> CambioFormulario:
+    """Convierte una fila de SQL_BUSCAR_CAMBIOS (evento + columnas del formulario)"""
+    txid = fila.pop("cambio_txid")
+    cambio_id = fila.pop("cambio_id")
+    operacion = fila.pop("cambio_operacion")
+    formulario_id = str(fila.pop("cambio_formulario_id"))
+    fecha = fila.pop("cambio_fecha")
+    return CambioFormulario(
+        cursor=codificar_cursor_cambios(txid, cambio_id),
+        operacion=operacion,
+        id=formulario_id,
+        fecha=fecha,
+        formulario=FormularioRegistro(**fila) if fila["id"] is not None else None,
+    )
+
+
+class OyenteCambios:
+    """LISTEN compartido por los streams SSE del worker"""
+
+    def __init__(self, intervalo_sondeo: float = CAMBIOS_INTERVALO_SONDEO):
+        self.intervalo_sondeo = intervalo_sondeo
+        self._aviso: Optional[asyncio.Event] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self.notificaciones = 0
+
+    def _avisar(self):
+        # Se reemplaza el evento: los que esperaban el anterior despiertan una sola vez
+        aviso, self._aviso = self._aviso, asyncio.Event()
+        if aviso is not None:
+            aviso.set()
+
+    async def _escuchar(self):
+        while True:
+            try:
+                conn = await psycopg.AsyncConnection.connect(db_connection_async.conninfo(), autocommit=True)
+                async with conn:
+                    await conn.execute(f"LISTEN {CANAL_CAMBIOS}")
+                    logger.info("Escuchando el canal de cambios de formulario_cliente")
+                    self._avisar()  # pudo haber cambios mientras no se escuchaba
+                    async for _ in conn.notifies():
+                        self.notificaciones += 1
+                        self._avisar()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error escuchando cambios; se reintenta en %s s: %s", self.intervalo_sondeo, e)
+                await asyncio.sleep(self.intervalo_sondeo)
+
+    def _iniciar(self):
+        if self._aviso is None:
+            self._aviso = asyncio.Event()
+        if self._tarea is None and ASYNC_DISPONIBLE:
+            self._tarea = asyncio.create_task(self._escuchar())
+
+    def aviso_actual(self) -> asyncio.Event:
+        """Evento que se activa con el próximo aviso; se toma antes de consultar para no perder
+        un aviso que llegue entre la consulta y la espera"""
+        self._iniciar()
+        return self._aviso
+
+    async def esperar(self, aviso: asyncio.Event, timeout: Optional[float] = None) -> bool:
+        """Espera `aviso`; True si llegó antes del timeout (por defecto, el intervalo de sondeo)"""
+        try:
+            await asyncio.wait_for(aviso.wait(), timeout or self.intervalo_sondeo)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def cerrar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+
+oyente_cambios = OyenteCambios()
@@ -0,0 +1,123 @@
+"""
+Deduplicación de lecturas concurrentes en el servicio.
+
+- `VueloUnico`: las peticiones idénticas que llegan mientras una consulta
+  sigue en curso esperan esa misma consulta en lugar de lanzar la suya
+  (GET /formulario/{id}, /all y /search con los mismos parámetros).
+  Las escrituras llaman a `olvidar` para que las lecturas posteriores no se
+  unan a una consulta que pudo leer la fila antes del cambio.
+- `LotePorId`: ventana opcional de unos milisegundos que junta las búsquedas
+  por ID distintas en una sola consulta `WHERE id = ANY(%s)`.
+
+La consulta corre en su propia tarea: si quien la inició se cancela, las
+demás peticiones que la esperan no se ven afectadas (igual que en cache.py).
+"""
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+import logging
+import os
+
+from models import FormularioRegistro
+from metricas import observar_lote_por_id
+
+logger = logging.getLogger(__name__)
+
+COALESCENCIA_HABILITADA = os.getenv("COALESCENCIA_HABILITADA", "true").lower() == "true"
+LOTE_POR_ID_VENTANA_MS = float(os.getenv("LOTE_POR_ID_VENTANA_MS", "0"))  # 0 = sin agrupar
+LOTE_POR_ID_MAXIMO = int(os.getenv("LOTE_POR_ID_MAXIMO", "100"))
+
+
+def _recuperar_excepcion(tarea: asyncio.Future):
+    if not tarea.cancelled():
+        tarea.exception()  # marca la excepción como recuperada aunque nadie la espere
+
+
+class VueloUnico:
+    """Una sola llamada en curso por clave; las llamadas concurrentes con la misma clave comparten su resultado"""
+
+    def __init__(self, habilitado: bool = True):
+        self.habilitado = habilitado
+        self._en_vuelo: Dict[Hashable, asyncio.Task] = {}
+        self.ejecutadas = 0
+        self.coalescidas = 0
+
+    def _terminada(self, clave: Hashable, tarea: asyncio.Task):
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        _recuperar_excepcion(tarea)
+
+    async def ejecutar(self, clave: Hashable, funcion: Callable[[], Awaitable]):
+        if not self.habilitado:
+            return await funcion()
+
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self.coalescidas += 1
+        else:
+            self.ejecutadas += 1
+            tarea = asyncio.create_task(funcion())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminada(clave, t))
+        return await asyncio.shield(tarea)
+
+    def olvidar(self, clave: Optional[Hashable] = None):
+        """Desvincula la llamada en curso de `clave` (o todas); las siguientes lanzan una nueva"""
+        if clave is None:
+            self._en_vuelo.clear()
+        else:
+            self._en_vuelo.pop(clave, None)
+
+
+class LotePorId:
+    """Agrupa las búsquedas por ID de una ventana de tiempo en una sola llamada a `cargar_varios`"""
+
+    def __init__(self, cargar_varios: Callable[[List[str]], Awaitable[List[FormularioRegistro]]],
+                 ventana_ms: float = LOTE_POR_ID_VENTANA_MS, maximo: int = LOTE_POR_ID_MAXIMO):
+        self.cargar_varios = cargar_varios
+        self.ventana = ventana_ms / 1000
+        self.maximo = maximo
+        self._pendientes: Dict[str, asyncio.Future] = {}
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self.lotes = 0
+        self.ids_agrupados = 0
+
+    @property
+    def habilitado(self) -> bool:
+        return self.ventana > 0
+
+    async def cargar(self, formulario_id: str) -> Optional[FormularioRegistro]:
+        futuro = self._pendientes.get(formulario_id)
+        if futuro is None:
+            loop = asyncio.get_running_loop()
+            futuro = loop.create_future()
+            futuro.add_done_callback(_recuperar_excepcion)
+            self._pendientes[formulario_id] = futuro
+            if len(self._pendientes) >= self.maximo:
+                self._despachar()
+            elif self._temporizador is None:
+                self._temporizador = loop.call_later(self.ventana, self._despachar)
+        return await asyncio.shield(futuro)
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        pendientes, self._pendientes = self._pendientes, {}
+        if pendientes:
+            asyncio.get_running_loop().create_task(self._ejecutar(pendientes))
+
+    async def _ejecutar(self, pendientes: Dict[str, asyncio.Future]):
+        self.lotes += 1
+        self.ids_agrupados += len(pendientes)
+        observar_lote_por_id(len(pendientes))
+        try:
+            encontrados = {registro.id: registro for registro in await self.cargar_varios(list(pendientes))}
+        except Exception as e:
+            logger.error("Error en búsqueda agrupada de %s formularios: %s", len(pendientes), e)
+            for futuro in pendientes.values():
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        for formulario_id, futuro in pendientes.items():
+            if not futuro.done():
+                futuro.set_result(encontrados.get(formulario_id))
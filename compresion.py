@@ -0,0 +1,482 @@
+"""
+Compresión de las respuestas negociada con Accept-Encoding.
+
+gzip siempre está disponible (zlib); br y zstd se ofrecen si están instalados
+`brotli` y `zstandard` (`pip install brotli zstandard`). Con varias aceptadas
+gana la de mayor q y, a igual q, el orden de COMPRESION_PREFERENCIA.
+
+`MiddlewareCompresion` (ASGI):
+
+- Solo comprime los tipos de COMPRESION_TIPOS (JSON, NDJSON, CSV y texto; no el
+  stream SSE, cuyos eventos deben llegar al instante) y los cuerpos de al
+  menos COMPRESION_MINIMO_BYTES: por debajo, las cabeceras y la CPU cuestan
+  más de lo que se ahorra.
+- Las respuestas en streaming (`stream=ndjson|json` de /formulario/all) se
+  comprimen por tramos de COMPRESION_VACIADO_BYTES sin comprimir, vaciando el
+  flujo tras cada uno, así el cliente puede ir procesando filas.
+- Los cuerpos grandes (COMPRESION_CACHE_MINIMO_BYTES) que se repiten, como la
+  primera página de /all entre dos escrituras, se comprimen una vez y se
+  reutilizan desde una caché por contenido (LRU de COMPRESION_CACHE_MB por
+  worker). Un cuerpo entra en la caché la segunda vez que se ve, para que las
+  páginas de un solo uso no desalojen a las frecuentes.
+- Los cuerpos de más de COMPRESION_HILO_BYTES se comprimen en el threadpool
+  para no bloquear el event loop.
+
+Un cuerpo comprimido lleva su propio ETag fuerte (`"<v>-gz"`, `-br`, `-zst`;
+etags.py quita el sufijo al comparar If-Match e If-None-Match), y un 304 repite
+el ETag codificado que mandó el cliente. Además se agrega
+`Vary: Accept-Encoding` para que las cachés intermedias guarden cada
+codificación por separado.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Dict, Optional
+import logging
+import os
+import time
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+
+from etags import etag_con_codificacion
+from metricas import COMPRESION_SEGUNDOS, METRICAS_HABILITADAS
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESION_HABILITADA = os.getenv("COMPRESION_HABILITADA", "true").lower() == "true"
+COMPRESION_MINIMO_BYTES = int(os.getenv("COMPRESION_MINIMO_BYTES", "1024"))
+COMPRESION_PREFERENCIA = [
+    c.strip() for c in (os.getenv("COMPRESION_PREFERENCIA") or "zstd,br,gzip").split(",") if c.strip()
+]
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "6"))
+COMPRESION_NIVEL_BR = int(os.getenv("COMPRESION_NIVEL_BR", "4"))
+COMPRESION_NIVEL_ZSTD = int(os.getenv("COMPRESION_NIVEL_ZSTD", "3"))
+COMPRESION_TIPOS = {
+    t.strip().lower() for t in (
+        os.getenv("COMPRESION_TIPOS")
+        or "application/json,application/x-ndjson,text/csv,text/plain,text/html,text/css,application/javascript"
+    ).split(",") if t.strip()
+}
+COMPRESION_VACIADO_BYTES = int(os.getenv("COMPRESION_VACIADO_BYTES", "65536"))
+COMPRESION_HILO_BYTES = int(os.getenv("COMPRESION_HILO_BYTES", "131072"))
+COMPRESION_CACHE_BYTES = int(float(os.getenv("COMPRESION_CACHE_MB", "32")) * 1024 * 1024)
+COMPRESION_CACHE_MINIMO_BYTES = int(os.getenv("COMPRESION_CACHE_MINIMO_BYTES", "16384"))
+
+
+class FlujoGzip:
+    """Compresor incremental: `comprimir` puede no devolver nada hasta el próximo `vaciar`"""
+
+    def __init__(self, nivel: int):
+        self._zlib = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._zlib.compress(datos)
+
+    def vaciar(self) -> bytes:
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self) -> bytes:
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class FlujoBrotli:
+    def __init__(self, nivel: int):
+        self._brotli = brotli.Compressor(quality=nivel)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._brotli.process(datos)
+
+    def vaciar(self) -> bytes:
+        return self._brotli.flush()
+
+    def terminar(self) -> bytes:
+        return self._brotli.finish()
+
+
+class FlujoZstd:
+    def __init__(self, nivel: int):
+        self._zstd = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+    def comprimir(self, datos: bytes) -> bytes:
+        return self._zstd.compress(datos)
+
+    def vaciar(self) -> bytes:
+        return self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def terminar(self) -> bytes:
+        return self._zstd.flush()
+
+
+class CompresionPorTramos:
+    """Junta los trozos de un streaming y los comprime de a `tramo` bytes, vaciando el flujo.
+
+    Las filas del stream llegan de a unos cientos de bytes: comprimir cada una
+    por separado multiplica las llamadas y, en brotli de calidad baja, empeora
+    mucho la razón de compresión.
+    """
+
+    def __init__(self, flujo, tramo: int = COMPRESION_VACIADO_BYTES):
+        self._flujo = flujo
+        self.tramo = tramo
+        self._pendientes = []
+        self._bytes_pendientes = 0
+
+    def agregar(self, datos: bytes) -> bytes:
+        if datos:
+            self._pendientes.append(datos)
+            self._bytes_pendientes += len(datos)
+        if self._bytes_pendientes < self.tramo:
+            return b""
+        return self._comprimir_pendientes() + self._flujo.vaciar()
+
+    def terminar(self) -> bytes:
+        return self._comprimir_pendientes() + self._flujo.terminar()
+
+    def _comprimir_pendientes(self) -> bytes:
+        if not self._pendientes:
+            return b""
+        salida = self._flujo.comprimir(b"".join(self._pendientes))
+        self._pendientes.clear()
+        self._bytes_pendientes = 0
+        return salida
+
+
+class Codificacion:
+    """Una codificación de Content-Encoding con su nivel"""
+
+    def __init__(self, nombre: str, nivel: int, flujo):
+        self.nombre = nombre
+        self.nivel = nivel
+        self._flujo = flujo
+        self.cabecera = nombre.encode("latin-1")
+
+    def flujo(self):
+        return self._flujo(self.nivel)
+
+    def por_tramos(self) -> CompresionPorTramos:
+        return CompresionPorTramos(self.flujo())
+
+    def comprimir(self, datos: bytes) -> bytes:
+        if self.nombre == "br":
+            return brotli.compress(datos, quality=self.nivel)
+        if self.nombre == "zstd":
+            # Un compresor por llamada: pueden correr varias a la vez en el threadpool
+            return zstandard.ZstdCompressor(level=self.nivel).compress(datos)
+        flujo = self.flujo()
+        return flujo.comprimir(datos) + flujo.terminar()
+
+
+def codificaciones_disponibles() -> Dict[str, Codificacion]:
+    disponibles = {"gzip": Codificacion("gzip", COMPRESION_NIVEL_GZIP, FlujoGzip)}
+    if brotli is not None:
+        disponibles["br"] = Codificacion("br", COMPRESION_NIVEL_BR, FlujoBrotli)
+    if zstandard is not None:
+        disponibles["zstd"] = Codificacion("zstd", COMPRESION_NIVEL_ZSTD, FlujoZstd)
+    return disponibles
+
+
+CODIFICACIONES = codificaciones_disponibles()
+# Orden de preferencia del servidor, solo con las instaladas
+PREFERENCIA = [nombre for nombre in COMPRESION_PREFERENCIA if nombre in CODIFICACIONES]
+
+
+@lru_cache(maxsize=256)
+def negociar(accept_encoding: str) -> Optional[str]:
+    """Codificación a usar según Accept-Encoding (None = sin comprimir).
+
+    Los navegadores envían unas pocas variantes de la cabecera, por eso se
+    guarda el resultado de cada una.
+    """
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        parametro = parametros.strip()
+        if parametro.startswith("q="):
+            try:
+                q = float(parametro[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre] = q
+
+    elegida, mejor_q = None, 0.0
+    for nombre in PREFERENCIA:
+        q = aceptadas.get(nombre, aceptadas.get("*", 0.0))
+        if q > mejor_q:
+            elegida, mejor_q = nombre, q
+    return elegida
+
+
+class CacheComprimidos:
+    """Cuerpos ya comprimidos por (codificación, resumen del cuerpo), con un máximo de bytes (LRU)"""
+
+    def __init__(self, max_bytes: int = COMPRESION_CACHE_BYTES, max_vistos: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_vistos = max_vistos
+        self._datos = OrderedDict()  # (codificación, resumen) -> cuerpo comprimido
+        self._vistos = OrderedDict()  # resúmenes vistos una vez, candidatos a entrar
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave) -> Optional[bytes]:
+        cuerpo = self._datos.get(clave)
+        if cuerpo is None:
+            self.fallos += 1
+            return None
+        self._datos.move_to_end(clave)
+        self.aciertos += 1
+        return cuerpo
+
+    def admitir(self, resumen: bytes) -> bool:
+        """True si el cuerpo ya se había visto y merece guardarse comprimido"""
+        if resumen in self._vistos:
+            self._vistos.move_to_end(resumen)
+            return True
+        self._vistos[resumen] = None
+        if len(self._vistos) > self.max_vistos:
+            self._vistos.popitem(last=False)
+        return False
+
+    def guardar(self, clave, cuerpo: bytes):
+        if len(cuerpo) > self.max_bytes or clave in self._datos:
+            return
+        self._datos[clave] = cuerpo
+        self.bytes += len(cuerpo)
+        while self.bytes > self.max_bytes:
+            _, desalojado = self._datos.popitem(last=False)
+            self.bytes -= len(desalojado)
+            self.desalojos += 1
+
+    def __len__(self):
+        return len(self._datos)
+
+
+def _tipo(cabeceras) -> bytes:
+    for nombre, valor in cabeceras:
+        if nombre == b"content-type":
+            return valor.split(b";", 1)[0].strip().lower()
+    return b""
+
+
+def _con_vary(cabeceras) -> list:
+    """Cabeceras con Accept-Encoding agregado a Vary (CORS puede haber puesto Origin)"""
+    resultado = []
+    agregado = False
+    for nombre, valor in cabeceras:
+        if nombre == b"vary":
+            agregado = True
+            if b"accept-encoding" not in valor.lower() and valor.strip() != b"*":
+                valor = valor + b", Accept-Encoding"
+        resultado.append((nombre, valor))
+    if not agregado:
+        resultado.append((b"vary", b"Accept-Encoding"))
+    return resultado
+
+
+def _sin(cabeceras, nombre: bytes) -> list:
+    return [(n, v) for n, v in cabeceras if n != nombre]
+
+
+def _etag_codificado(valor: bytes, codificacion: "Codificacion") -> bytes:
+    return etag_con_codificacion(valor.decode("latin-1"), codificacion.nombre).encode("latin-1")
+
+
+def _con_etag_codificado(cabeceras, codificacion: "Codificacion") -> list:
+    """Cabeceras del cuerpo comprimido: el ETag fuerte lleva el sufijo de la codificación"""
+    return [(n, _etag_codificado(v, codificacion) if n == b"etag" else v) for n, v in cabeceras]
+
+
+def _etag_304(cabeceras, codificacion: "Codificacion", if_none_match: bytes) -> list:
+    """En un 304 el ETag debe ser el del cuerpo que tiene el cliente: el codificado, si lo mandó"""
+    candidatos = {candidato.strip() for candidato in if_none_match.split(b",")}
+    resultado = []
+    for nombre, valor in cabeceras:
+        if nombre == b"etag":
+            codificado = _etag_codificado(valor, codificacion)
+            if codificado in candidatos:
+                valor = codificado
+        resultado.append((nombre, valor))
+    return resultado
+
+
+class MiddlewareCompresion:
+    """Middleware ASGI: va por dentro de MiddlewareMetricas para que la latencia incluya la compresión"""
+
+    def __init__(self, app):
+        self.app = app
+        self.cache = CacheComprimidos()
+        self.tipos = {tipo.encode("latin-1") for tipo in COMPRESION_TIPOS}
+        estadisticas_compresion["cache"] = self.cache
+
+    def _accept_encoding(self, scope) -> str:
+        for nombre, valor in scope["headers"]:
+            if nombre == b"accept-encoding":
+                return valor.decode("latin-1")
+        return ""
+
+    def _if_none_match(self, scope) -> bytes:
+        for nombre, valor in scope["headers"]:
+            if nombre == b"if-none-match":
+                return valor
+        return b""
+
+    async def _comprimir(self, codificacion: Codificacion, cuerpo: bytes) -> bytes:
+        resumen = None
+        if len(cuerpo) >= COMPRESION_CACHE_MINIMO_BYTES and self.cache.max_bytes > 0:
+            resumen = blake2b(cuerpo, digest_size=16).digest()
+            comprimido = self.cache.obtener((codificacion.nombre, resumen))
+            if comprimido is not None:
+                _contar(codificacion.nombre, "cache", len(cuerpo), len(comprimido))
+                return comprimido
+
+        inicio = time.perf_counter()
+        if len(cuerpo) >= COMPRESION_HILO_BYTES:
+            comprimido = await run_in_threadpool(codificacion.comprimir, cuerpo)
+        else:
+            comprimido = codificacion.comprimir(cuerpo)
+        if METRICAS_HABILITADAS:
+            COMPRESION_SEGUNDOS.observar(time.perf_counter() - inicio, (codificacion.nombre,))
+
+        if resumen is not None and self.cache.admitir(resumen):
+            self.cache.guardar((codificacion.nombre, resumen), comprimido)
+        _contar(codificacion.nombre, "completa", len(cuerpo), len(comprimido))
+        return comprimido
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        nombre = negociar(self._accept_encoding(scope))
+        codificacion = CODIFICACIONES[nombre] if nombre else None
+        inicio_respuesta = None
+        flujo = None
+        segundos_flujo = 0.0
+        pasar = False
+
+        async def enviar(mensaje):
+            nonlocal inicio_respuesta, flujo, segundos_flujo, pasar
+            if pasar:
+                await send(mensaje)
+                return
+
+            if mensaje["type"] == "http.response.start":
+                cabeceras = mensaje.get("headers", [])
+                codigo = mensaje["status"]
+                if (codigo < 200 or codigo in (204, 304) or _tipo(cabeceras) not in self.tipos
+                        or any(n == b"content-encoding" for n, _ in cabeceras)):
+                    pasar = True
+                    if codigo == 304 and codificacion is not None:
+                        if_none_match = self._if_none_match(scope)
+                        if if_none_match:
+                            mensaje = {**mensaje, "headers": _etag_304(cabeceras, codificacion, if_none_match)}
+                    await send(mensaje)
+                    return
+                inicio_respuesta = {**mensaje, "headers": _con_vary(cabeceras)}
+                return
+
+            if mensaje["type"] != "http.response.body":
+                await send(mensaje)
+                return
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+
+            if flujo is None and not mas:
+                # Respuesta completa en un solo mensaje
+                pasar = True
+                if codificacion is None or len(cuerpo) < COMPRESION_MINIMO_BYTES:
+                    _omitir("sin_codificacion" if codificacion is None else "minimo")
+                    await send(inicio_respuesta)
+                    await send(mensaje)
+                    return
+                comprimido = await self._comprimir(codificacion, cuerpo)
+                if len(comprimido) >= len(cuerpo):
+                    _omitir("incompresible")
+                    await send(inicio_respuesta)
+                    await send(mensaje)
+                    return
+                cabeceras = _con_etag_codificado(_sin(inicio_respuesta["headers"], b"content-length"), codificacion)
+                cabeceras.append((b"content-encoding", codificacion.cabecera))
+                cabeceras.append((b"content-length", str(len(comprimido)).encode()))
+                await send({**inicio_respuesta, "headers": cabeceras})
+                await send({"type": "http.response.body", "body": comprimido})
+                return
+
+            if flujo is None:
+                # Primer trozo de un streaming: el tamaño total no se conoce
+                if codificacion is None:
+                    pasar = True
+                    _omitir("sin_codificacion")
+                    await send(inicio_respuesta)
+                    await send(mensaje)
+                    return
+                flujo = codificacion.por_tramos()
+                cabeceras = _con_etag_codificado(_sin(inicio_respuesta["headers"], b"content-length"), codificacion)
+                cabeceras.append((b"content-encoding", codificacion.cabecera))
+                await send({**inicio_respuesta, "headers": cabeceras})
+
+            inicio = time.perf_counter()
+            salida = flujo.agregar(cuerpo) if mas else flujo.agregar(cuerpo) + flujo.terminar()
+            segundos_flujo += time.perf_counter() - inicio
+            _contar(codificacion.nombre, "stream", len(cuerpo), len(salida), respuesta=not mas)
+
+            if salida or not mas:
+                await send({"type": "http.response.body", "body": salida, "more_body": mas})
+            if not mas and METRICAS_HABILITADAS:
+                COMPRESION_SEGUNDOS.observar(segundos_flujo, (codificacion.nombre,))
+
+        await self.app(scope, receive, enviar)
+
+
+def _contar(codificacion: str, modo: str, originales: int, comprimidos: int, respuesta: bool = True):
+    contador = estadisticas_compresion["codificaciones"].get((codificacion, modo))
+    if contador is None:
+        contador = estadisticas_compresion["codificaciones"][(codificacion, modo)] = {
+            "respuestas": 0, "bytes_originales": 0, "bytes_comprimidos": 0,
+        }
+    contador["respuestas"] += respuesta
+    contador["bytes_originales"] += originales
+    contador["bytes_comprimidos"] += comprimidos
+
+
+def _omitir(motivo: str):
+    omitidas = estadisticas_compresion["omitidas"]
+    omitidas[motivo] = omitidas.get(motivo, 0) + 1
+
+
+def estadisticas() -> dict:
+    cache = estadisticas_compresion["cache"]
+    originales = sum(c["bytes_originales"] for c in estadisticas_compresion["codificaciones"].values())
+    comprimidos = sum(c["bytes_comprimidos"] for c in estadisticas_compresion["codificaciones"].values())
+    return {
+        "habilitada": COMPRESION_HABILITADA,
+        "codificaciones": PREFERENCIA,
+        "ahorro": round(1 - comprimidos / originales, 4) if originales else None,
+        "omitidas": dict(estadisticas_compresion["omitidas"]),
+        "cache": None if cache is None else {
+            "entradas": len(cache), "bytes": cache.bytes, "aciertos": cache.aciertos, "fallos": cache.fallos,
+            "desalojos": cache.desalojos,
+        },
+    }
+
+
+# Contadores por (codificación, modo) y respuestas sin comprimir por motivo;
+# el middleware registra su caché al crearse
+estadisticas_compresion = {"codificaciones": {}, "omitidas": {}, "cache": None}
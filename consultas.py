@@ -0,0 +1,418 @@
+"""
+Sentencias SQL de formulario_cliente compartidas por los repositorios
+síncrono (psycopg2) y asíncrono (psycopg 3). Ambos drivers usan `%s`
+como marcador de parámetros.
+
+Las de texto fijo son `Sentencia` con nombre: cada conexión las prepara una
+vez (ver sentencias.py). Las que dependen de los filtros se arman por petición.
+"""
+from functools import lru_cache
+from typing import Optional
+import os
+
+from sentencias import Sentencia
+
+COLUMNAS = "id, nombre_completo, email, telefono, mensaje, created_at, updated_at"
+
+# Registro de cambios (migraciones/0003_cambios.sql) para /formulario/changes y /formulario/sync
+CAMBIOS_HABILITADOS = os.getenv("CAMBIOS_HABILITADOS", "true").lower() == "true"
+
+
+def registrar_cambios(sentencia: str, operacion: str, columnas: str = COLUMNAS) -> str:
+    """Envuelve un INSERT/UPDATE/DELETE ... RETURNING en un CTE que anota cada fila afectada
+    en formulario_cambios; el evento queda en la misma sentencia y transacción que el cambio"""
+    if not CAMBIOS_HABILITADOS:
+        return sentencia
+    return f"""
+    WITH filas AS ({sentencia}),
+    cambio AS (
+        INSERT INTO formulario_cambios (formulario_id, operacion)
+        SELECT id, '{operacion}' FROM filas
+    )
+    SELECT {columnas} FROM filas
+"""
+
+
+SQL_INSERTAR = Sentencia("formulario_insertar", registrar_cambios(f"""
+    INSERT INTO formulario_cliente
+    (id, nombre_completo, email, telefono, mensaje, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    RETURNING {COLUMNAS}
+""", "crear"))
+
+# El ID lo genera el DEFAULT de la columna
+SQL_INSERTAR_ID_BD = Sentencia("formulario_insertar_id_bd", registrar_cambios(f"""
+    INSERT INTO formulario_cliente
+    (nombre_completo, email, telefono, mensaje, created_at, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING {COLUMNAS}
+""", "crear"))
+
+SQL_BUSCAR_POR_ID = Sentencia("formulario_buscar_por_id", f"""
+    SELECT {COLUMNAS}
+    FROM formulario_cliente
+    WHERE id = %s
+""")
+
+# Búsqueda agrupada de GET /formulario/{id} (coalescencia.LotePorId)
+SQL_BUSCAR_POR_IDS = Sentencia("formulario_buscar_por_ids", f"""
+    SELECT {COLUMNAS}
+    FROM formulario_cliente
+    WHERE id = ANY(%s::uuid[])
+""")
+
+# Validadores de GET condicional: solo la versión, sin traer ni serializar filas
+SQL_VERSION_POR_ID = Sentencia("formulario_version_por_id", """
+    SELECT updated_at FROM formulario_cliente WHERE id = %s
+""")
+
+# Versión de la colección sin recorrer formulario_cliente: el xmin del snapshot y la
+# cantidad de cambios registrados desde él (idx_formulario_cambios_txid_id). Toda
+# escritura confirmada después de este snapshot agrega un cambio con txid >= xmin o
+# adelanta el xmin, así que la versión cambia; lo anterior al xmin ya no se mueve
+SQL_VERSION_COLECCION = Sentencia("formulario_version_coleccion", """
+    SELECT s.xmin AS posicion,
+           (SELECT count(*) FROM formulario_cambios WHERE txid >= s.xmin) AS cantidad
+    FROM (SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin) s
+""")
+
+# Keyset sobre (created_at, id): usa idx_formulario_cliente_created_at_id sin OFFSET
+SQL_BUSCAR_PAGINA = Sentencia("formulario_pagina", f"""
+    SELECT {COLUMNAS}
+    FROM formulario_cliente
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s
+""")
+
+SQL_BUSCAR_PAGINA_DESDE = Sentencia("formulario_pagina_desde", f"""
+    SELECT {COLUMNAS}
+    FROM formulario_cliente
+    WHERE (created_at, id) < (%s, %s)
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s
+""")
+
+SQL_RECORRER_TODOS = f"""
+    SELECT {COLUMNAS}
+    FROM formulario_cliente
+    ORDER BY created_at DESC, id DESC
+"""
+
+SQL_RECORRER_TODOS_DESDE = f"""
+    SELECT {COLUMNAS}
+    FROM formulario_cliente
+    WHERE (created_at, id) < (%s, %s)
+    ORDER BY created_at DESC, id DESC
+"""
+
+SQL_ELIMINAR = Sentencia("formulario_eliminar", registrar_cambios("""
+    DELETE FROM formulario_cliente
+    WHERE id = %s
+    RETURNING id
+""", "eliminar", "id"))
+
+SQL_ELIMINAR_VERSION = Sentencia("formulario_eliminar_version", registrar_cambios("""
+    DELETE FROM formulario_cliente
+    WHERE id = %s AND updated_at = ANY(%s)
+    RETURNING id
+""", "eliminar", "id"))
+
+def construir_pagina(limite, despues_de=None):
+    """SELECT de una página; `despues_de` es la tupla (created_at, id) de la última fila vista"""
+    if despues_de is None:
+        return SQL_BUSCAR_PAGINA, (limite,)
+    return SQL_BUSCAR_PAGINA_DESDE, (despues_de[0], despues_de[1], limite)
+
+
+def construir_exportacion(formato, desde=None, hasta=None):
+    """COPY ... TO STDOUT de los formularios creados en [desde, hasta), en orden de creación.
+
+    COPY no admite parámetros del lado del servidor: psycopg2 (mogrify) y
+    psycopg 3 (`cursor.copy`) los interpolan en el cliente. En NDJSON cada fila
+    es el JSON de la API armado por PostgreSQL; sale en formato csv con comillas
+    y separador que el JSON nunca contiene, porque el formato text escaparía sus
+    barras invertidas.
+    """
+    condiciones, valores = [], []
+    if desde is not None:
+        condiciones.append("created_at >= %s")
+        valores.append(desde)
+    if hasta is not None:
+        condiciones.append("created_at < %s")
+        valores.append(hasta)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+    if formato == "csv":
+        seleccion, opciones = COLUMNAS, "FORMAT csv, HEADER"
+    else:
+        pares = ", ".join(f"'{columna}', {columna}" for columna in COLUMNAS.split(", "))
+        seleccion, opciones = f"json_build_object({pares})::text", "FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02'"
+    return f"""
+        COPY (
+            SELECT {seleccion}
+            FROM formulario_cliente
+            {donde}
+            ORDER BY created_at, id
+        ) TO STDOUT WITH ({opciones})
+    """, valores
+
+
+# POST /formulario/import: las filas ya validadas llegan en CSV (copia.datos_importacion)
+SQL_IMPORTAR = f"COPY formulario_cliente ({COLUMNAS}) FROM STDIN WITH (FORMAT csv)"
+
+# COPY no pasa por registrar_cambios: los eventos de las filas copiadas se anotan
+# aparte, en la misma transacción
+SQL_IMPORTAR_CAMBIOS = Sentencia("formulario_importar_cambios", """
+    INSERT INTO formulario_cambios (formulario_id, operacion)
+    SELECT unnest(%s::uuid[]), 'crear'
+""") if CAMBIOS_HABILITADOS else None
+
+
+def construir_recorrido(despues_de=None):
+    """SELECT completo para recorrer con un cursor del lado del servidor"""
+    if despues_de is None:
+        return SQL_RECORRER_TODOS, ()
+    return SQL_RECORRER_TODOS_DESDE, (despues_de[0], despues_de[1])
+
+
+@lru_cache(maxsize=64)
+def sql_insercion_lote(cantidad: int) -> str:
+    """INSERT multi-fila con `cantidad` tuplas de VALUES (cacheado por tamaño)"""
+    tuplas = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * cantidad)
+    return registrar_cambios(f"""
+        INSERT INTO formulario_cliente
+        (id, nombre_completo, email, telefono, mensaje, created_at, updated_at)
+        VALUES {tuplas}
+        RETURNING {COLUMNAS}
+    """, "crear")
+
+
+def valores_insercion(formulario, fecha_actual, nuevo_id):
+    return (
+        nuevo_id,
+        formulario.nombre_completo,
+        formulario.email,
+        formulario.telefono,
+        formulario.mensaje,
+        fecha_actual,
+        fecha_actual,
+    )
+
+
+def aplanar(filas):
+    return [valor for fila in filas for valor in fila]
+
+
+def es_error_de_datos(error) -> bool:
+    """True si PostgreSQL rechazó los datos de la fila (SQLSTATE clase 22 o 23)"""
+    codigo = getattr(error, "pgcode", None) or getattr(error, "sqlstate", None) or ""
+    return codigo[:2] in ("22", "23")
+
+
+SQL_ELIMINAR_LOTE = Sentencia("formulario_eliminar_lote", registrar_cambios("""
+    DELETE FROM formulario_cliente
+    WHERE id = ANY(%s::uuid[])
+    RETURNING id
+""", "eliminar", "id"))
+
+
+# Reintentos del INSERT ante una colisión real de clave primaria
+MAX_INTENTOS_INSERCION = 3
+
+
+def construir_insercion(formulario, fecha_actual, nuevo_id=None):
+    """Arma el INSERT ... RETURNING; sin `nuevo_id` la base de datos genera el ID"""
+    valores = (
+        formulario.nombre_completo,
+        formulario.email,
+        formulario.telefono,
+        formulario.mensaje,
+        fecha_actual,
+        fecha_actual,
+    )
+    if nuevo_id is None:
+        return SQL_INSERTAR_ID_BD, valores
+    return SQL_INSERTAR, (nuevo_id,) + valores
+
+
+CAMPOS_ACTUALIZABLES = ("nombre_completo", "email", "telefono", "mensaje")
+
+
+@lru_cache(maxsize=2 ** (len(CAMPOS_ACTUALIZABLES) + 1))
+def sentencia_actualizacion(campos: tuple, con_version: bool) -> Sentencia:
+    """UPDATE ... RETURNING para una combinación de campos enviados (a lo sumo 2^4 × 2 variantes)"""
+    mascara = sum(1 << CAMPOS_ACTUALIZABLES.index(campo) for campo in campos)
+    asignaciones = [f"{campo} = %s" for campo in campos] + ["updated_at = %s"]
+    condicion = "id = %s AND updated_at = ANY(%s)" if con_version else "id = %s"
+    return Sentencia(f"formulario_actualizar_{mascara}{'_version' if con_version else ''}", registrar_cambios(f"""
+        UPDATE formulario_cliente
+        SET {', '.join(asignaciones)}
+        WHERE {condicion}
+        RETURNING {COLUMNAS}
+    """, "actualizar"))
+
+
+def construir_actualizacion(formulario_id, formulario, fecha_actual, versiones=None):
+    """Arma el UPDATE con los campos enviados; updated_at siempre se actualiza.
+
+    Con `versiones` (lista de updated_at aceptados, de If-Match) la fila solo se
+    modifica si su versión actual está en la lista.
+    """
+    campos = []
+    valores = []
+
+    for campo in CAMPOS_ACTUALIZABLES:
+        valor = getattr(formulario, campo)
+        if valor is not None:
+            campos.append(campo)
+            valores.append(valor)
+
+    valores.append(fecha_actual)
+    valores.append(formulario_id)
+    if versiones is not None:
+        valores.append(list(versiones))
+
+    return sentencia_actualizacion(tuple(campos), versiones is not None), valores
+
+
+def construir_eliminacion(formulario_id, versiones=None):
+    """DELETE por ID, condicionado opcionalmente a la versión (If-Match)"""
+    if versiones is None:
+        return SQL_ELIMINAR, (formulario_id,)
+    return SQL_ELIMINAR_VERSION, (formulario_id, list(versiones))
+
+
+# Configuración de texto completo; debe coincidir con la columna `busqueda`
+# de migraciones/0002_busqueda.sql
+CONFIG_BUSQUEDA = "spanish"
+
+
+def limite_superior_prefijo(prefijo: str) -> Optional[str]:
+    """Menor texto mayor que todos los que empiezan por `prefijo` (orden por bytes, COLLATE "C")"""
+    while prefijo:
+        codigo = ord(prefijo[-1]) + 1
+        if codigo == 0xD800:  # los sustitutos UTF-16 no existen en UTF-8
+            codigo = 0xE000
+        if codigo <= 0x10FFFF:
+            return prefijo[:-1] + chr(codigo)
+        prefijo = prefijo[:-1]
+    return None
+
+
+def construir_busqueda(filtros, limite, despues_de=None):
+    """SELECT de una página de búsqueda con los filtros de `FiltrosBusqueda`.
+
+    Sin texto (`filtros.texto`) ordena y pagina como /all, por (created_at, id).
+    Con texto ordena por relevancia y el keyset es (rango, created_at, id);
+    cada fila trae además la columna `rango`.
+    """
+    condiciones = []
+    valores = []
+
+    if filtros.email is not None:
+        # Igualdad en "C": misma semántica y usa idx_formulario_cliente_email_c_created_at_id
+        condiciones.append('email COLLATE "C" = %s')
+        valores.append(filtros.email)
+    if filtros.email_prefijo:
+        # Rango sobre idx_formulario_cliente_email_c_created_at_id en lugar de LIKE,
+        # que con parámetros del lado del servidor no siempre usa el índice
+        condiciones.append('email COLLATE "C" >= %s')
+        valores.append(filtros.email_prefijo)
+        superior = limite_superior_prefijo(filtros.email_prefijo)
+        if superior is not None:
+            condiciones.append('email COLLATE "C" < %s')
+            valores.append(superior)
+    if filtros.telefono is not None:
+        condiciones.append("telefono = %s")
+        valores.append(filtros.telefono)
+    if filtros.desde is not None:
+        condiciones.append("created_at >= %s")
+        valores.append(filtros.desde)
+    if filtros.hasta is not None:
+        condiciones.append("created_at < %s")
+        valores.append(filtros.hasta)
+
+    if filtros.texto:
+        condiciones.insert(0, "busqueda @@ consulta")
+        if despues_de is not None:
+            condiciones.append("(ts_rank(busqueda, consulta), created_at, id) < (%s::real, %s, %s)")
+            valores.extend(despues_de)
+        consulta = f"""
+            SELECT {COLUMNAS}, ts_rank(busqueda, consulta) AS rango
+            FROM formulario_cliente, websearch_to_tsquery('{CONFIG_BUSQUEDA}', %s) AS consulta
+            WHERE {' AND '.join(condiciones)}
+            ORDER BY rango DESC, created_at DESC, id DESC
+            LIMIT %s
+        """
+        return consulta, [filtros.texto] + valores + [limite]
+
+    if despues_de is not None:
+        condiciones.append("(created_at, id) < (%s, %s)")
+        valores.extend(despues_de)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    consulta = f"""
+        SELECT {COLUMNAS}
+        FROM formulario_cliente
+        {donde}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """
+    return consulta, valores + [limite]
+
+
+# Cambios en orden de transacción (txid, id). Solo se entregan los de transacciones
+# anteriores al xmin del snapshot actual: esas ya terminaron todas, así que ninguna
+# transacción en curso puede agregar después un cambio con una posición menor a la
+# ya entregada. El formulario se une con su estado actual (NULL si ya no existe).
+SQL_BUSCAR_CAMBIOS = Sentencia("formulario_cambios", f"""
+    SELECT c.txid AS cambio_txid, c.id AS cambio_id, c.operacion AS cambio_operacion,
+           c.formulario_id AS cambio_formulario_id, c.creado_en AS cambio_fecha,
+           {", ".join("f." + columna for columna in COLUMNAS.split(", "))}
+    FROM formulario_cambios c
+    LEFT JOIN formulario_cliente f ON f.id = c.formulario_id AND c.operacion <> 'eliminar'
+    WHERE (c.txid, c.id) > (%s, %s)
+      AND c.txid < txid_snapshot_xmin(txid_current_snapshot())
+    ORDER BY c.txid, c.id
+    LIMIT %s
+""")
+
+# Posición de "ahora": todo lo anterior a las transacciones en curso ya se considera visto
+SQL_POSICION_CAMBIOS = Sentencia("formulario_posicion_cambios", """
+    SELECT txid_snapshot_xmin(txid_current_snapshot()) AS txid
+""")
+
+
+# Claves de idempotencia (migraciones/0004_idempotencia.sql). La reserva y la
+# lectura de la respuesta guardada van en un solo viaje: si la clave no existe o
+# expiró se reserva (fila sin código) y `reservada` es true; si no, se devuelve la
+# fila vigente. Si otra transacción la está insertando en ese momento no vuelve
+# ninguna de las dos y quien llama lo trata como "en curso".
+SQL_IDEMPOTENCIA_RESERVAR = """
+    WITH reserva AS (
+        INSERT INTO formulario_idempotencia (clave, huella, expira_en)
+        VALUES (%(clave)s, %(huella)s, now() + make_interval(secs => %(reserva)s))
+        ON CONFLICT (clave) DO UPDATE
+            SET huella = EXCLUDED.huella, codigo = NULL, cabeceras = NULL, cuerpo = NULL,
+                expira_en = EXCLUDED.expira_en
+            WHERE formulario_idempotencia.expira_en <= now()
+        RETURNING clave
+    )
+    SELECT EXISTS (SELECT 1 FROM reserva) AS reservada, i.huella, i.codigo, i.cabeceras, i.cuerpo
+    FROM (SELECT 1) AS uno
+    LEFT JOIN formulario_idempotencia i
+        ON i.clave = %(clave)s AND i.expira_en > now() AND NOT EXISTS (SELECT 1 FROM reserva)
+"""
+
+SQL_IDEMPOTENCIA_COMPLETAR = """
+    UPDATE formulario_idempotencia
+    SET codigo = %s, cabeceras = %s, cuerpo = %s, expira_en = now() + make_interval(secs => %s)
+    WHERE clave = %s AND huella = %s AND codigo IS NULL
+"""
+
+SQL_IDEMPOTENCIA_LIBERAR = """
+    DELETE FROM formulario_idempotencia WHERE clave = %s AND huella = %s AND codigo IS NULL
+"""
+
+SQL_IDEMPOTENCIA_PURGAR = """
+    DELETE FROM formulario_idempotencia WHERE expira_en <= now()
+"""
@@ -1,11 +1,32 @@
-from fastapi import APIRouter, HTTPException, status
-from models import FormularioClienteCreate, FormularioClienteUpdate, ApiResponse
+from typing import Any, List, Literal, Optional
+from datetime import datetime
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from models import (
+    FormularioClienteCreate, FormularioClienteUpdate, ApiResponse, ApiResponseLote, ApiResponseCambios,
+    ApiResponseImportacion, FiltrosBusqueda,
+)
 from service import formulario_service
+from paginacion import TAMANO_PAGINA_DEFECTO, TAMANO_PAGINA_MAXIMO
+from etags import (
+    CACHE_CONTROL_LISTADOS, ETAG_LISTADOS_HABILITADO, cabeceras_formulario, etag_coleccion, etag_desde_fecha,
+    no_modificado,
+)
+from respuestas import RespuestaJSON
+from copia import TIPOS_CONTENIDO
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/formulario", tags=["Formulario Cliente"])
+# Las rutas devuelven RespuestaJSON ya armada: FastAPI no revalida contra response_model,
+# que queda solo para documentar el esquema en OpenAPI
+router = APIRouter(prefix="/formulario", tags=["Formulario Cliente"], default_response_class=RespuestaJSON)
+
+# La cabecera la procesa MiddlewareIdempotencia antes de llegar a la ruta; aquí solo se documenta
+DESCRIPCION_IDEMPOTENCIA = (
+    "Clave única por operación: un reintento con la misma clave y el mismo cuerpo devuelve la respuesta "
+    "original sin repetir la escritura"
+)
 
 @router.post(
     "/create",
@@ -14,14 +35,21 @@ router = APIRouter(prefix="/formulario", tags=["Formulario Cliente"])
     summary="Crear nuevo formulario cliente",
     description="Crea un nuevo formulario cliente con validaciones de negocio"
 )
-async def crear_formulario(formulario: FormularioClienteCreate):
+async def crear_formulario(
+    formulario: FormularioClienteCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description=DESCRIPCION_IDEMPOTENCIA),
+):
     try:
-        # ✅ CORRECTO - El servicio ya devuelve ApiResponse, devolverlo directamente
-        return formulario_service.crear_formulario(formulario)
+        resultado = await formulario_service.crear_formulario(formulario)
+        return RespuestaJSON(
+            resultado,
+            status_code=status.HTTP_201_CREATED,
+            headers={"ETag": etag_desde_fecha(resultado.data[0].updated_at)}
+        )
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error en controlador crear_formulario: {e}")
+        logger.error("Error en controlador crear_formulario: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor al crear el formulario"
@@ -29,41 +57,303 @@ async def crear_formulario(formulario: FormularioClienteCreate):
 
 
 
+@router.post(
+    "/bulk",
+    response_model=ApiResponseLote,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_201_CREATED,
+    summary="Crear formularios en lote",
+    description=(
+        "Crea varios formularios en una sola transacción. Cada elemento se valida como en /create. "
+        "Con `atomico=true` (por defecto) no se guarda nada si algún elemento falla; con `atomico=false` "
+        "se guardan los válidos. La respuesta trae el estado de cada elemento en el mismo orden."
+    )
+)
+async def crear_lote(
+    formularios: List[Any] = Body(..., description="Arreglo de formularios con el esquema de /create"),
+    atomico: bool = Query(True, description="Todo o nada (true) o resultado por elemento (false)"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description=DESCRIPCION_IDEMPOTENCIA),
+):
+    try:
+        resultado, codigo = await formulario_service.crear_lote(formularios, atomico)
+        return RespuestaJSON(resultado, status_code=codigo)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador crear_lote: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al crear los formularios"
+        )
+
+@router.delete(
+    "/bulk",
+    response_model=ApiResponseLote,
+    response_model_exclude_none=True,
+    status_code=status.HTTP_200_OK,
+    summary="Eliminar formularios en lote",
+    description="Elimina varios formularios por ID con una sola sentencia DELETE"
+)
+async def eliminar_lote(
+    ids: List[Any] = Body(..., description="Arreglo de IDs a eliminar"),
+    atomico: bool = Query(True, description="Todo o nada (true) o resultado por elemento (false)"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description=DESCRIPCION_IDEMPOTENCIA),
+):
+    try:
+        resultado, codigo = await formulario_service.eliminar_lote(ids, atomico)
+        return RespuestaJSON(resultado, status_code=codigo)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador eliminar_lote: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al eliminar los formularios"
+        )
+
 @router.get(
     "/all",
     response_model=ApiResponse,
     status_code=status.HTTP_200_OK,
     summary="Obtener todos los formularios",
-    description="Obtiene la lista completa de formularios cliente ordenados por fecha de creación"
+    description=(
+        "Obtiene los formularios cliente ordenados por fecha de creación, paginados por cursor. "
+        "El token de la siguiente página se devuelve en la cabecera X-Next-Cursor (y en Link). "
+        "Con `stream=ndjson` o `stream=json` se recorre la tabla completa en streaming."
+    )
 )
-async def buscar_todos():
+async def buscar_todos(
+    limit: int = Query(TAMANO_PAGINA_DEFECTO, ge=1, le=TAMANO_PAGINA_MAXIMO, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Token opaco de la página siguiente"),
+    stream: Optional[Literal["ndjson", "json"]] = Query(None, description="Devolver todas las filas en streaming"),
+    if_none_match: Optional[str] = Header(None, description="ETag de colección recibido antes: 304 si no cambió"),
+):
     try:
-        # ✅ El servicio ya devuelve ApiResponse, devolverlo directamente
-        return formulario_service.buscar_todos()
+        if stream:
+            contenido = await formulario_service.recorrer_todos(stream, cursor)
+            tipo = "application/x-ndjson" if stream == "ndjson" else "application/json"
+            return StreamingResponse(contenido, media_type=tipo)
+
+        cabeceras = {"Cache-Control": CACHE_CONTROL_LISTADOS}
+        if ETAG_LISTADOS_HABILITADO:
+            # La versión se lee antes que la página: si una escritura cae en medio, el ETag
+            # queda más viejo que el contenido y el próximo GET condicional trae la página nueva.
+            # Sin Last-Modified: la versión es una posición en formulario_cambios, no una fecha
+            cabeceras["ETag"] = etag_coleccion(*await formulario_service.version_coleccion())
+            if if_none_match is not None and no_modificado(if_none_match, None, cabeceras["ETag"]):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+
+        resultado, siguiente_cursor = await formulario_service.buscar_todos(limit, cursor)
+        if siguiente_cursor:
+            cabeceras["X-Next-Cursor"] = siguiente_cursor
+            cabeceras["Link"] = f'</formulario/all?limit={limit}&cursor={siguiente_cursor}>; rel="next"'
+        return RespuestaJSON(resultado, headers=cabeceras)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error en controlador buscar_todos: {e}")
+        logger.error("Error en controlador buscar_todos: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor al obtener los formularios"
         )
     
+@router.get(
+    "/search",
+    response_model=ApiResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Buscar formularios",
+    description=(
+        "Busca formularios por email (exacto o por prefijo), teléfono, rango de fecha de creación "
+        "y texto libre sobre nombre y mensaje. Con `q` los resultados se ordenan por relevancia; "
+        "sin `q`, por fecha de creación. Se pagina por cursor igual que /all"
+    )
+)
+async def buscar(
+    request: Request,
+    email: Optional[str] = Query(None, description="Email exacto"),
+    email_prefijo: Optional[str] = Query(None, max_length=255, description="Inicio del email"),
+    telefono: Optional[int] = Query(None, description="Teléfono exacto"),
+    desde: Optional[datetime] = Query(None, description="Creados desde esta fecha (inclusive)"),
+    hasta: Optional[datetime] = Query(None, description="Creados antes de esta fecha"),
+    q: Optional[str] = Query(None, max_length=200, description="Texto a buscar en nombre y mensaje"),
+    limit: int = Query(TAMANO_PAGINA_DEFECTO, ge=1, le=TAMANO_PAGINA_MAXIMO, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Token opaco de la página siguiente"),
+):
+    try:
+        filtros = FiltrosBusqueda(
+            email=email,
+            email_prefijo=email_prefijo,
+            telefono=telefono,
+            desde=desde,
+            hasta=hasta,
+            texto=q.strip() if q else None,
+        )
+        resultado, siguiente_cursor = await formulario_service.buscar(filtros, limit, cursor)
+        cabeceras = {}
+        if siguiente_cursor:
+            siguiente = request.url.include_query_params(cursor=siguiente_cursor)
+            cabeceras["X-Next-Cursor"] = siguiente_cursor
+            cabeceras["Link"] = f'<{siguiente.path}?{siguiente.query}>; rel="next"'
+        return RespuestaJSON(resultado, headers=cabeceras)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador buscar: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al buscar los formularios"
+        )
+
+@router.get(
+    "/changes",
+    status_code=status.HTTP_200_OK,
+    summary="Cambios en tiempo real (SSE)",
+    description=(
+        "Stream text/event-stream con un evento por cada formulario creado, actualizado o eliminado "
+        "(event: crear | actualizar | eliminar). El `id` de cada evento es su cursor: al reconectarse, "
+        "EventSource lo envía en Last-Event-ID y el stream continúa sin perder eventos. Sin cursor "
+        "empieza desde el momento de la conexión"
+    ),
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def seguir_cambios(
+    cursor: Optional[str] = Query(None, description="Cursor del último evento recibido"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID", description="Cursor enviado por EventSource"),
+):
+    try:
+        contenido = await formulario_service.seguir_cambios(last_event_id or cursor)
+        return StreamingResponse(
+            contenido,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador seguir_cambios: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al consultar los cambios"
+        )
+
+@router.get(
+    "/sync",
+    response_model=ApiResponseCambios,
+    status_code=status.HTTP_200_OK,
+    summary="Sincronización incremental",
+    description=(
+        "Devuelve los cambios posteriores al cursor `since`, en orden, con el estado actual de cada "
+        "formulario (null si se eliminó). El cursor para la siguiente llamada llega siempre en la "
+        "cabecera X-Next-Cursor. Sin `since` empieza desde el inicio del registro de cambios"
+    )
+)
+async def sincronizar(
+    since: Optional[str] = Query(None, description="Cursor devuelto por la llamada anterior"),
+    limit: int = Query(TAMANO_PAGINA_DEFECTO, ge=1, le=TAMANO_PAGINA_MAXIMO, description="Máximo de cambios"),
+):
+    try:
+        resultado, siguiente_cursor = await formulario_service.sincronizar(since, limit)
+        return RespuestaJSON(resultado, headers={"X-Next-Cursor": siguiente_cursor})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador sincronizar: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al consultar los cambios"
+        )
+
+@router.get(
+    "/export",
+    status_code=status.HTTP_200_OK,
+    summary="Exportar formularios en CSV o NDJSON",
+    description=(
+        "Descarga en streaming los formularios creados en [desde, hasta) en orden de creación, "
+        "con COPY ... TO STDOUT. El CSV trae encabezado; en NDJSON cada línea es el JSON del formulario"
+    ),
+    responses={200: {"content": {"text/csv": {}, "application/x-ndjson": {}}}},
+)
+async def exportar(
+    formato: Literal["csv", "ndjson"] = Query("csv", description="Formato del archivo"),
+    desde: Optional[datetime] = Query(None, description="Creados desde esta fecha (inclusive)"),
+    hasta: Optional[datetime] = Query(None, description="Creados antes de esta fecha"),
+):
+    try:
+        contenido = await formulario_service.exportar(formato, desde, hasta)
+        return StreamingResponse(
+            contenido,
+            media_type=TIPOS_CONTENIDO[formato],
+            headers={"Content-Disposition": f'attachment; filename="formularios.{formato}"'},
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador exportar: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al exportar los formularios"
+        )
+
+@router.post(
+    "/import",
+    response_model=ApiResponseImportacion,
+    status_code=status.HTTP_201_CREATED,
+    summary="Importar formularios desde CSV o NDJSON",
+    description=(
+        "Importa el cuerpo de la petición a medida que llega: cada registro se valida como en /create "
+        "y los válidos se guardan con COPY ... FROM STDIN, en una transacción por bloque. El CSV debe "
+        "tener encabezado con nombre_completo, email, telefono y mensaje (las demás columnas se ignoran). "
+        "La respuesta informa cuántos se importaron y las líneas rechazadas con sus errores"
+    ),
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "text/csv": {"schema": {"type": "string"}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+    }}},
+)
+async def importar(
+    request: Request,
+    formato: Literal["csv", "ndjson"] = Query("csv", description="Formato del cuerpo"),
+):
+    try:
+        resultado, codigo = await formulario_service.importar(formato, request.stream())
+        return RespuestaJSON(resultado, status_code=codigo)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error en controlador importar: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor al importar los formularios"
+        )
+
 @router.get(
     "/{id}",
     response_model=ApiResponse,
     status_code=status.HTTP_200_OK,
     summary="Buscar formulario por ID",
-    description="Obtiene un formulario específico por su ID único"
+    description=(
+        "Obtiene un formulario específico por su ID único. Con If-None-Match (ETag) o If-Modified-Since "
+        "responde 304 sin cuerpo si no cambió"
+    )
 )
-async def buscar_por_id(id: str):
+async def buscar_por_id(
+    id: str,
+    if_none_match: Optional[str] = Header(None, description="ETag recibido antes"),
+    if_modified_since: Optional[str] = Header(None, description="Last-Modified recibido antes"),
+):
     try:
-        # ✅ El servicio ya devuelve ApiResponse, devolverlo directamente
-        return formulario_service.buscar_por_id(id)
+        if if_none_match is not None or if_modified_since is not None:
+            version = await formulario_service.version_por_id(id)
+            if version is not None and no_modificado(
+                    if_none_match, if_modified_since, etag_desde_fecha(version), version):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras_formulario(version))
+
+        resultado = await formulario_service.buscar_por_id(id)
+        return RespuestaJSON(resultado, headers=cabeceras_formulario(resultado.data[0].updated_at))
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error en controlador buscar_por_id: {e}")
+        logger.error("Error en controlador buscar_por_id: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor al buscar el formulario"
@@ -74,16 +364,24 @@ async def buscar_por_id(id: str):
     response_model=ApiResponse,
     status_code=status.HTTP_200_OK,
     summary="Actualizar formulario cliente",
-    description="Actualiza un formulario existente. Solo se actualizan los campos proporcionados"
+    description=(
+        "Actualiza un formulario existente. Solo se actualizan los campos proporcionados. "
+        "Con la cabecera If-Match (ETag recibido al consultar) la actualización solo se aplica "
+        "si nadie más modificó el formulario; si no, responde 412"
+    )
 )
-async def actualizar_formulario(id: str, formulario: FormularioClienteUpdate):
+async def actualizar_formulario(
+    id: str,
+    formulario: FormularioClienteUpdate,
+    if_match: Optional[str] = Header(None, description="ETag de la versión que se quiere modificar"),
+):
     try:
-        # ✅ El servicio ya devuelve ApiResponse, devolverlo directamente
-        return formulario_service.actualizar_formulario(id, formulario)
+        resultado = await formulario_service.actualizar_formulario(id, formulario, if_match)
+        return RespuestaJSON(resultado, headers={"ETag": etag_desde_fecha(resultado.data[0].updated_at)})
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error en controlador actualizar_formulario: {e}")
+        logger.error("Error en controlador actualizar_formulario: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor al actualizar el formulario"
@@ -94,16 +392,20 @@ async def actualizar_formulario(id: str, formulario: FormularioClienteUpdate):
     response_model=ApiResponse,
     status_code=status.HTTP_200_OK,
     summary="Eliminar formulario cliente",
-    description="Elimina un formulario cliente de forma permanente"
+    description=(
+        "Elimina un formulario cliente de forma permanente. Acepta If-Match igual que la actualización"
+    )
 )
-async def eliminar_formulario(id: str):
+async def eliminar_formulario(
+    id: str,
+    if_match: Optional[str] = Header(None, description="ETag de la versión que se quiere eliminar"),
+):
     try:
-        # ✅ El servicio ya devuelve ApiResponse, devolverlo directamente
-        return formulario_service.eliminar_formulario(id)
+        return RespuestaJSON(await formulario_service.eliminar_formulario(id, if_match))
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error en controlador eliminar_formulario: {e}")
+        logger.error("Error en controlador eliminar_formulario: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor al eliminar el formulario"
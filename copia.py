@@ -0,0 +1,235 @@
+"""
+Exportación e importación masiva de formulario_cliente con COPY.
+
+GET /formulario/export y POST /formulario/import no pasan cada fila por
+pydantic ni por el JSON de la API: los datos viajan con `COPY ... TO STDOUT`
+y `COPY ... FROM STDIN`, en CSV o NDJSON, y la memoria del worker no depende
+del tamaño de la tabla ni del archivo.
+
+- Exportación: el COPY arma el CSV (o el JSON de cada fila) en PostgreSQL y
+  los datos se reenvían al cliente en bloques de EXPORTAR_BLOQUE_BYTES.
+- Importación: el cuerpo se parte en registros a medida que llega y se
+  valida de a IMPORTAR_TAMANO_BLOQUE registros con una sola llamada al
+  validador de `List[FormularioClienteCreate]` (las mismas reglas que
+  /create). Los válidos de cada bloque se copian con un COPY en su propia
+  transacción; los rechazados se informan con su número de línea.
+"""
+from typing import Iterator, List, Optional, Tuple
+import csv
+import io
+import logging
+import os
+import queue
+
+from pydantic import TypeAdapter, ValidationError
+
+from models import FormularioClienteCreate
+from respuestas import loads
+
+logger = logging.getLogger(__name__)
+
+EXPORTAR_BLOQUE_BYTES = int(os.getenv("EXPORTAR_BLOQUE_BYTES") or "65536")
+IMPORTAR_TAMANO_BLOQUE = int(os.getenv("IMPORTAR_TAMANO_BLOQUE") or "5000")
+IMPORTAR_MAX_ERRORES = int(os.getenv("IMPORTAR_MAX_ERRORES") or "1000")
+IMPORTAR_MAX_REGISTRO_BYTES = int(os.getenv("IMPORTAR_MAX_REGISTRO_BYTES") or "65536")
+
+FORMATOS = ("csv", "ndjson")
+TIPOS_CONTENIDO = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+CAMPOS_IMPORTACION = ("nombre_completo", "email", "telefono", "mensaje")
+
+_VALIDADOR_BLOQUE = TypeAdapter(List[FormularioClienteCreate])
+
+
+class RegistroDemasiadoLargoError(ValueError):
+    """Un registro del archivo importado supera IMPORTAR_MAX_REGISTRO_BYTES"""
+
+    def __init__(self, linea: int):
+        super().__init__(f"El registro de la línea {linea} supera los {IMPORTAR_MAX_REGISTRO_BYTES} bytes")
+        self.linea = linea
+
+
+class LectorRegistros:
+    """Parte el cuerpo de la importación en registros a medida que llegan los bytes.
+
+    Un registro termina en un salto de línea; en CSV, solo si las comillas del
+    registro están cerradas (un campo entre comillas puede tener saltos de
+    línea). Cada registro sale con el número de línea donde empieza.
+    """
+
+    def __init__(self, formato: str):
+        self.csv = formato == "csv"
+        self._resto = b""       # última línea, todavía sin salto de línea
+        self._lineas = []       # líneas del registro con comillas abiertas
+        self._comillas = 0
+        self._tamano = 0
+        self._linea = 1         # línea donde empieza el registro en curso
+        self._siguiente = 1     # línea de `_resto`
+
+    def agregar(self, datos: bytes) -> List[Tuple[int, bytes]]:
+        registros = []
+        partes = (self._resto + datos).split(b"\n")
+        self._resto = partes.pop()
+        for parte in partes:
+            self._lineas.append(parte)
+            self._tamano += len(parte) + 1
+            self._siguiente += 1
+            if self.csv:
+                self._comillas += parte.count(b'"')
+                if self._comillas % 2:
+                    continue
+            registro = b"\n".join(self._lineas).rstrip(b"\r")
+            if registro.strip():
+                registros.append((self._linea, registro))
+            self._lineas, self._comillas, self._tamano = [], 0, 0
+            self._linea = self._siguiente
+        if self._tamano + len(self._resto) > IMPORTAR_MAX_REGISTRO_BYTES:
+            raise RegistroDemasiadoLargoError(self._linea)
+        return registros
+
+    def terminar(self) -> List[Tuple[int, bytes]]:
+        registro = b"\n".join(self._lineas + [self._resto]).rstrip(b"\r")
+        self._resto, self._lineas, self._comillas, self._tamano = b"", [], 0, 0
+        return [(self._linea, registro)] if registro.strip() else []
+
+
+def leer_encabezado(registro: bytes) -> List[str]:
+    """Columnas del encabezado CSV; deben estar las de /create, las demás se ignoran"""
+    columnas = [columna.strip().lower() for columna in next(csv.reader([registro.decode("utf-8-sig")]))]
+    faltantes = [campo for campo in CAMPOS_IMPORTACION if campo not in columnas]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el encabezado: {', '.join(faltantes)}")
+    return columnas
+
+
+def _mensajes(detalles: List[dict]) -> List[str]:
+    return [f"{'.'.join(str(parte) for parte in detalle['loc']) or 'formulario'}: {detalle['msg']}"
+            for detalle in detalles]
+
+
+def validar_bloque(formato: str, registros: List[Tuple[int, bytes]], columnas: Optional[List[str]] = None
+                   ) -> Tuple[List[FormularioClienteCreate], List[Tuple[int, List[str]]]]:
+    """Valida un bloque de registros con las reglas de FormularioClienteCreate.
+
+    Devuelve los formularios válidos en orden y los rechazados como
+    (línea, errores). El bloque se valida con una sola llamada; solo si hay
+    errores se vuelve a validar sin los registros rechazados.
+    """
+    rechazados = []
+    datos, lineas = [], []
+    if formato == "csv":
+        for linea, registro in registros:
+            try:
+                valores = next(csv.reader([registro.decode("utf-8")]))
+            except UnicodeDecodeError:
+                rechazados.append((linea, ["El registro no está codificado en UTF-8"]))
+                continue
+            except csv.Error as e:
+                rechazados.append((linea, [f"CSV inválido: {e}"]))
+                continue
+            datos.append(dict(zip(columnas, valores)))
+            lineas.append(linea)
+    else:
+        for linea, registro in registros:
+            try:
+                datos.append(loads(registro))
+                lineas.append(linea)
+            except ValueError:
+                rechazados.append((linea, ["JSON inválido"]))
+
+    try:
+        formularios = _VALIDADOR_BLOQUE.validate_python(datos)
+    except ValidationError as e:
+        errores = {}
+        for detalle in e.errors():
+            errores.setdefault(detalle["loc"][0], []).append({**detalle, "loc": detalle["loc"][1:]})
+        rechazados.extend((lineas[indice], _mensajes(detalles)) for indice, detalles in errores.items())
+        formularios = _VALIDADOR_BLOQUE.validate_python(
+            [dato for indice, dato in enumerate(datos) if indice not in errores])
+
+    rechazados.sort()
+    return formularios, rechazados
+
+
+def datos_importacion(formularios: List[FormularioClienteCreate], ids: List[str], fecha_actual) -> bytes:
+    """Filas en CSV para el COPY FROM STDIN de consultas.SQL_IMPORTAR"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator="\n")
+    escritor.writerows(
+        (formulario_id, f.nombre_completo, f.email, f.telefono, f.mensaje, fecha_actual, fecha_actual)
+        for formulario_id, f in zip(ids, formularios)
+    )
+    return salida.getvalue().encode("utf-8")
+
+
+class CopiaCanceladaError(Exception):
+    """El cliente dejó de leer la exportación"""
+
+
+_FIN = object()
+
+
+class EscritorEnCola:
+    """Archivo para `copy_expert` de psycopg2 que entrega lo copiado por una cola acotada.
+
+    psycopg2 escribe el COPY en el archivo hasta terminar, así que corre en un
+    hilo aparte (`copiar`) y el consumidor itera los bloques al ritmo del
+    cliente; con la cola llena el COPY espera. `cancelar` hace que la próxima
+    escritura aborte el COPY.
+    """
+
+    def __init__(self, tamano_bloque: int = EXPORTAR_BLOQUE_BYTES, maximo_bloques: int = 4):
+        self.tamano_bloque = tamano_bloque
+        self.cola = queue.Queue(maximo_bloques)
+        self.cancelado = False
+        self.completo = False
+        self._partes = []
+        self._tamano = 0
+
+    def write(self, datos):
+        if self.cancelado:
+            raise CopiaCanceladaError()
+        self._partes.append(datos)
+        self._tamano += len(datos)
+        if self._tamano >= self.tamano_bloque:
+            self._entregar(b"".join(self._partes))
+            self._partes, self._tamano = [], 0
+
+    def _entregar(self, elemento):
+        while True:
+            try:
+                self.cola.put(elemento, timeout=0.05)
+                return
+            except queue.Full:
+                if self.cancelado:
+                    raise CopiaCanceladaError()
+
+    def copiar(self, cursor, consulta: str):
+        try:
+            cursor.copy_expert(consulta, self)
+            if self._partes:
+                self._entregar(b"".join(self._partes))
+            self.completo = True
+            resultado = _FIN
+        except Exception as e:
+            resultado = e
+        try:
+            self._entregar(resultado)
+        except CopiaCanceladaError:
+            pass
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            elemento = self.cola.get()
+            if elemento is _FIN:
+                return
+            if isinstance(elemento, Exception):
+                raise elemento
+            yield elemento
+
+    def cancelar(self):
+        self.cancelado = True
+        try:
+            while True:
+                self.cola.get_nowait()
+        except queue.Empty:
+            pass
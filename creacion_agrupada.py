@@ -0,0 +1,144 @@
+"""
+Creación agrupada (group commit) de POST /formulario/create.
+
+Con CREAR_AGRUPADO_VENTANA_MS > 0 las creaciones concurrentes del worker no
+hacen cada una su INSERT y su COMMIT: se encolan y se guardan juntas con un
+INSERT multi-fila y un solo COMMIT (un solo fsync del WAL) cada
+CREAR_AGRUPADO_VENTANA_MS milisegundos o al juntar CREAR_AGRUPADO_MAXIMO filas,
+lo que ocurra antes. Cada petición recibe su propia fila o su propio error: la
+respuesta es la misma que sin agrupar.
+
+- El grupo se guarda con `crear_formularios_lote(atomico=False)`: una fila que
+  la base rechaza no arrastra a las demás.
+- Como mucho CREAR_AGRUPADO_EN_VUELO grupos se escriben a la vez; mientras
+  tanto se siguen juntando filas para los siguientes.
+- Contrapresión: la cola admite CREAR_AGRUPADO_COLA_MAXIMA filas entre
+  pendientes y en escritura. Con la cola llena la petición espera lugar hasta
+  CREAR_AGRUPADO_ESPERA_COLA_MS y después recibe 503 con Retry-After.
+
+La latencia que se agrega a cada creación es como mucho la ventana más la
+espera por un grupo en vuelo; a cambio, con muchas creaciones concurrentes el
+costo del COMMIT se reparte entre todas las filas del grupo.
+"""
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+import asyncio
+import logging
+import os
+
+from models import FormularioClienteCreate, FormularioRegistro
+from metricas import observar_creacion_agrupada
+
+logger = logging.getLogger(__name__)
+
+CREAR_AGRUPADO_VENTANA_MS = float(os.getenv("CREAR_AGRUPADO_VENTANA_MS") or "0")  # 0 = sin agrupar
+CREAR_AGRUPADO_MAXIMO = int(os.getenv("CREAR_AGRUPADO_MAXIMO") or "500")
+CREAR_AGRUPADO_EN_VUELO = int(os.getenv("CREAR_AGRUPADO_EN_VUELO") or "2")
+CREAR_AGRUPADO_COLA_MAXIMA = int(os.getenv("CREAR_AGRUPADO_COLA_MAXIMA") or "5000")
+CREAR_AGRUPADO_ESPERA_COLA_MS = float(os.getenv("CREAR_AGRUPADO_ESPERA_COLA_MS") or "1000")
+
+
+class ColaLlenaError(Exception):
+    """La cola de creaciones agrupadas no tuvo lugar dentro del tiempo de espera"""
+
+    def __init__(self, espera: float):
+        super().__init__(f"La cola de creaciones sigue llena después de {espera:g}s")
+        self.espera = espera
+
+
+def _recuperar_excepcion(futuro: asyncio.Future):
+    if not futuro.cancelled():
+        futuro.exception()  # marca la excepción como recuperada aunque nadie la espere
+
+
+class CreacionAgrupada:
+    """Junta las creaciones de una ventana de tiempo en una sola llamada a `guardar_varios`"""
+
+    def __init__(self, guardar_varios: Callable[[List[FormularioClienteCreate]],
+                                                Awaitable[List[Union[FormularioRegistro, Exception]]]],
+                 ventana_ms: float = CREAR_AGRUPADO_VENTANA_MS, maximo: int = CREAR_AGRUPADO_MAXIMO,
+                 en_vuelo: int = CREAR_AGRUPADO_EN_VUELO, cola_maxima: int = CREAR_AGRUPADO_COLA_MAXIMA,
+                 espera_cola_ms: float = CREAR_AGRUPADO_ESPERA_COLA_MS):
+        self.guardar_varios = guardar_varios
+        self.ventana = ventana_ms / 1000
+        self.maximo = maximo
+        self.cola_maxima = cola_maxima
+        self.espera_cola = espera_cola_ms / 1000
+        self._pendientes: List[Tuple[FormularioClienteCreate, asyncio.Future]] = []
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+        self._lugares = asyncio.Semaphore(cola_maxima)
+        self._escrituras = asyncio.Semaphore(en_vuelo)
+        self.en_cola = 0
+        self.grupos = 0
+        self.filas_agrupadas = 0
+        self.rechazadas = 0
+
+    @property
+    def habilitado(self) -> bool:
+        return self.ventana > 0
+
+    async def _reservar_lugar(self):
+        if self._lugares.locked():
+            try:
+                await asyncio.wait_for(self._lugares.acquire(), self.espera_cola)
+            except asyncio.TimeoutError:
+                self.rechazadas += 1
+                raise ColaLlenaError(self.espera_cola)
+        else:
+            await self._lugares.acquire()
+        self.en_cola += 1
+
+    async def crear(self, formulario: FormularioClienteCreate) -> FormularioRegistro:
+        """Encola el formulario y espera la fila guardada con su grupo (o la excepción de esa fila)"""
+        await self._reservar_lugar()
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        futuro.add_done_callback(_recuperar_excepcion)
+        self._pendientes.append((formulario, futuro))
+        if len(self._pendientes) >= self.maximo:
+            self._despachar()
+        elif self._temporizador is None:
+            self._temporizador = loop.call_later(self.ventana, self._despachar)
+        # Si la petición se cancela, su fila se guarda igual con el grupo
+        return await asyncio.shield(futuro)
+
+    def _despachar(self):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        grupo, self._pendientes = self._pendientes, []
+        if grupo:
+            asyncio.get_running_loop().create_task(self._ejecutar(grupo))
+
+    async def _ejecutar(self, grupo: List[Tuple[FormularioClienteCreate, asyncio.Future]]):
+        try:
+            async with self._escrituras:
+                self.grupos += 1
+                self.filas_agrupadas += len(grupo)
+                observar_creacion_agrupada(len(grupo))
+                try:
+                    resultados = await self.guardar_varios([formulario for formulario, _ in grupo])
+                except Exception as e:
+                    logger.error("Error guardando un grupo de %s formularios: %s", len(grupo), e)
+                    resultados = [e] * len(grupo)
+            for (_, futuro), resultado in zip(grupo, resultados):
+                if futuro.done():
+                    continue
+                if isinstance(resultado, Exception):
+                    futuro.set_exception(resultado)
+                else:
+                    futuro.set_result(resultado)
+        finally:
+            for _ in grupo:
+                self.en_cola -= 1
+                self._lugares.release()
+
+    def estadisticas(self) -> dict:
+        return {
+            "habilitada": self.habilitado,
+            "ventana_ms": self.ventana * 1000,
+            "en_cola": self.en_cola,
+            "cola_maxima": self.cola_maxima,
+            "grupos": self.grupos,
+            "filas_agrupadas": self.filas_agrupadas,
+            "rechazadas": self.rechazadas,
+        }
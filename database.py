@@ -1,12 +1,224 @@
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 from contextlib import contextmanager
 import logging
 import os
+import threading
+import time
+
+from metricas import observar_consulta, observar_espera_conexion, observar_filas
+from replicas import REPLICA_TIMEOUT, REPLICAS, SQL_RETRASO_REPLICA, Enrutador, Replica, parametros_replica
+from sentencias import ConexionPreparada
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class CursorMedido(RealDictCursor):
+    """RealDictCursor que registra el tiempo de cada sentencia y las filas que devuelve o afecta"""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observar_consulta(time.perf_counter() - inicio)
+            if self.rowcount >= 0:
+                observar_filas(self.rowcount)
+
+
+class PoolAgotadoError(Exception):
+    """No se obtuvo una conexión del pool dentro del tiempo de espera"""
+
+
+class PoolConexiones:
+    """Pool de conexiones psycopg2 seguro entre hilos.
+
+    - Mantiene entre `minimo` y `maximo` conexiones abiertas.
+    - Espera como máximo `timeout` segundos por una conexión libre.
+    - Verifica la conexión al tomarla: descarta las cerradas o en estado
+      inconsistente y hace `SELECT 1` si estuvo inactiva más de
+      `verificar_tras_inactividad` segundos (0 = verificar siempre).
+    - Recicla las conexiones que superan `vida_maxima` segundos.
+    """
+
+    def __init__(self, fabrica, minimo: int = 1, maximo: int = 10, timeout: float = 5.0,
+                 vida_maxima: float = 1800.0, verificar_tras_inactividad: float = 10.0):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Configuración de pool inválida: se requiere 0 <= minimo <= maximo y maximo >= 1")
+
+        self._fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.verificar_tras_inactividad = verificar_tras_inactividad
+
+        self._condicion = threading.Condition(threading.Lock())
+        self._libres = []          # [(conexion, instante_devolucion)] LIFO
+        self._creadas_en = {}      # id(conexion) -> instante de creación
+        self._ocupadas = 0
+        self._esperando = 0
+        self._abriendo = 0
+        self._cerrado = False
+
+        self._total_tomadas = 0
+        self._total_timeouts = 0
+        self._total_recicladas = 0
+        self._total_descartadas = 0
+
+        for _ in range(minimo):
+            conn = self._abrir()
+            self._libres.append((conn, time.monotonic()))
+
+    def _abrir(self):
+        conn = self._fabrica()
+        self._creadas_en[id(conn)] = time.monotonic()
+        return conn
+
+    def _cerrar_conexion(self, conn):
+        self._creadas_en.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expirada(self, conn, ahora: float) -> bool:
+        creada = self._creadas_en.get(id(conn), ahora)
+        return self.vida_maxima > 0 and ahora - creada >= self.vida_maxima
+
+    def _es_saludable(self, conn, inactiva_desde: float, ahora: float) -> bool:
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if ahora - inactiva_desde >= self.verificar_tras_inactividad:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def tomar(self):
+        """Obtiene una conexión del pool, abriendo una nueva si hay cupo"""
+        limite = time.monotonic() + self.timeout
+        with self._condicion:
+            while True:
+                if self._cerrado:
+                    raise PoolAgotadoError("El pool de conexiones está cerrado")
+
+                if self._libres:
+                    conn, inactiva_desde = self._libres.pop()
+                    self._ocupadas += 1
+                    break
+
+                if self._ocupadas + len(self._libres) + self._abriendo < self.maximo:
+                    self._abriendo += 1
+                    conn = None
+                    break
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._total_timeouts += 1
+                    raise PoolAgotadoError(
+                        f"No hay conexiones disponibles después de {self.timeout}s "
+                        f"({self._ocupadas} ocupadas de {self.maximo})"
+                    )
+                self._esperando += 1
+                try:
+                    self._condicion.wait(restante)
+                finally:
+                    self._esperando -= 1
+
+        # La E/S (abrir, verificar) se hace fuera del candado
+        if conn is None:
+            try:
+                conn = self._abrir()
+            except Exception:
+                with self._condicion:
+                    self._abriendo -= 1
+                    self._condicion.notify()
+                raise
+            with self._condicion:
+                self._abriendo -= 1
+                self._ocupadas += 1
+                self._total_tomadas += 1
+            return conn
+
+        ahora = time.monotonic()
+        expirada = self._expirada(conn, ahora)
+        if expirada or not self._es_saludable(conn, inactiva_desde, ahora):
+            with self._condicion:
+                if expirada:
+                    self._total_recicladas += 1
+                else:
+                    self._total_descartadas += 1
+            self._cerrar_conexion(conn)
+            try:
+                conn = self._abrir()
+            except Exception:
+                with self._condicion:
+                    self._ocupadas -= 1
+                    self._condicion.notify()
+                raise
+
+        with self._condicion:
+            self._total_tomadas += 1
+        return conn
+
+    def devolver(self, conn, descartar: bool = False):
+        """Devuelve una conexión al pool; la cierra si está rota, expirada o se pide descartarla"""
+        if not descartar and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                descartar = True
+
+        ahora = time.monotonic()
+        reciclar = self._expirada(conn, ahora)
+        cerrar = descartar or conn.closed or reciclar or self._cerrado
+
+        with self._condicion:
+            self._ocupadas -= 1
+            if cerrar:
+                if reciclar:
+                    self._total_recicladas += 1
+                elif not self._cerrado:
+                    self._total_descartadas += 1
+            else:
+                self._libres.append((conn, ahora))
+            self._condicion.notify()
+
+        if cerrar:
+            self._cerrar_conexion(conn)
+
+    def cerrar(self):
+        """Cierra las conexiones libres; las ocupadas se cierran al devolverse"""
+        with self._condicion:
+            self._cerrado = True
+            libres, self._libres = self._libres, []
+            self._condicion.notify_all()
+        for conn, _ in libres:
+            self._cerrar_conexion(conn)
+
+    def estadisticas(self) -> dict:
+        with self._condicion:
+            return {
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "ocupadas": self._ocupadas,
+                "libres": len(self._libres),
+                "esperando": self._esperando,
+                "total_tomadas": self._total_tomadas,
+                "total_timeouts": self._total_timeouts,
+                "total_recicladas": self._total_recicladas,
+                "total_descartadas": self._total_descartadas,
+            }
+
+
 class DatabaseConnection:
     def __init__(self):
         self.host = os.getenv("DB_HOST", "localhost")
@@ -15,29 +227,174 @@ class DatabaseConnection:
         self.user = os.getenv("DB_USER", "postgres")
         self.password = os.getenv("DB_PASSWORD", "123456")
 
-    def get_connection(self):
+        # Configuración del pool (por proceso/worker de uvicorn)
+        self.pool_min = int(os.getenv("DB_POOL_MIN", "1"))
+        self.pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+        self.pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+        self.pool_vida_maxima = float(os.getenv("DB_POOL_VIDA_MAXIMA", "1800"))
+        self.pool_verificar_inactiva = float(os.getenv("DB_POOL_VERIFICAR_INACTIVA", "10"))
+
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+        # Réplicas de lectura (replicas.py): un pool por réplica, creado en su primera lectura
+        self.replicas = [Replica(parametros_replica(entrada, self.parametros())) for entrada in REPLICAS]
+        self.enrutador = Enrutador(self.replicas)
+        self._pools_replicas = {}  # réplica -> (pool, pid)
+
+    def parametros(self) -> dict:
+        """Parámetros de conexión del primario"""
+        return {
+            "host": self.host,
+            "port": self.port,
+            "dbname": self.database,
+            "user": self.user,
+            "password": self.password,
+        }
+
+    def get_connection(self, parametros: dict = None):
         return psycopg2.connect(
-            host=self.host,
-            port=self.port,
-            database=self.database,
-            user=self.user,
-            password=self.password,
-            cursor_factory=RealDictCursor
+            **(parametros or self.parametros()),
+            connection_factory=ConexionPreparada,
+            cursor_factory=CursorMedido
         )
 
+    @property
+    def pool(self) -> PoolConexiones:
+        """Pool del proceso actual; se crea en el primer uso (y de nuevo tras un fork)"""
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != pid:
+                    self._pool = PoolConexiones(
+                        self.get_connection,
+                        minimo=self.pool_min,
+                        maximo=self.pool_max,
+                        timeout=self.pool_timeout,
+                        vida_maxima=self.pool_vida_maxima,
+                        verificar_tras_inactividad=self.pool_verificar_inactiva,
+                    )
+                    self._pool_pid = pid
+        return self._pool
+
+    def _pool_replica(self, replica: Replica) -> PoolConexiones:
+        """Pool de la réplica en el proceso actual; sin mínimo para no conectar bajo el candado"""
+        pid = os.getpid()
+        with self._pool_lock:
+            pool, pool_pid = self._pools_replicas.get(replica, (None, None))
+            if pool is None or pool_pid != pid:
+                pool = PoolConexiones(
+                    lambda: self.get_connection(replica.parametros),
+                    minimo=0,
+                    maximo=self.pool_max,
+                    timeout=REPLICA_TIMEOUT,
+                    vida_maxima=self.pool_vida_maxima,
+                    verificar_tras_inactividad=self.pool_verificar_inactiva,
+                )
+                self._pools_replicas[replica] = (pool, pid)
+        return pool
+
+    def _expulsar(self, replica: Replica, motivo: str):
+        """Saca la réplica de la rotación y cierra su pool; se recrea cuando vuelve"""
+        self.enrutador.expulsar(replica, motivo)
+        with self._pool_lock:
+            pool, _ = self._pools_replicas.pop(replica, (None, None))
+        if pool is not None:
+            pool.cerrar()
+
+    def _tomar_replica(self):
+        """(réplica, pool, conexión) para una lectura, o (None, None, None) si debe ir al primario.
+
+        Una réplica que no acepta conexiones o no responde a la verificación se
+        expulsa y se prueba la siguiente; una atrasada se expulsa sin más. Si el
+        pool de la réplica está agotado la lectura va al primario sin expulsarla.
+        """
+        replica = self.enrutador.elegir()
+        while replica is not None:
+            pool = self._pool_replica(replica)
+            try:
+                conn = pool.tomar()
+            except PoolAgotadoError:
+                self.enrutador.soltar(replica)
+                return None, None, None
+            except psycopg2.Error as e:
+                self.enrutador.soltar(replica)
+                self._expulsar(replica, f"no acepta conexiones: {e}".strip())
+                replica = self.enrutador.elegir()
+                continue
+
+            if self.enrutador.toca_verificar(replica):
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(SQL_RETRASO_REPLICA)
+                        retraso = float(cursor.fetchone()["retraso"])
+                except psycopg2.Error as e:
+                    pool.devolver(conn, descartar=True)
+                    self.enrutador.soltar(replica)
+                    self._expulsar(replica, f"falló la verificación: {e}".strip())
+                    replica = self.enrutador.elegir()
+                    continue
+                if not self.enrutador.registrar_retraso(replica, retraso):
+                    pool.devolver(conn)
+                    self.enrutador.soltar(replica)
+                    replica = self.enrutador.elegir()
+                    continue
+            return replica, pool, conn
+        return None, None, None
+
     @contextmanager
-    def get_db_connection(self):
-        conn = None
+    def get_db_connection(self, lectura: bool = False):
+        """Conexión del primario; con `lectura=True`, de una réplica disponible si hay (replicas.py)"""
+        inicio = time.perf_counter()
+        try:
+            replica, pool, conn = self._tomar_replica() if lectura and self.replicas else (None, None, None)
+            if replica is None:
+                pool = self.pool
+                conn = pool.tomar()
+        finally:
+            # También la espera que termina en PoolAgotadoError: es justo la del pool saturado
+            observar_espera_conexion(time.perf_counter() - inicio)
+        descartar = False
         try:
-            conn = self.get_connection()
             yield conn
         except Exception as e:
-            if conn:
+            try:
                 conn.rollback()
-            logger.exception("Error en la transacción")
+            except Exception:
+                descartar = True
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                descartar = True
+            if replica is not None and conn.closed:
+                self._expulsar(replica, f"se cortó la conexión: {e}".strip())
+            # Sin log aquí: el repositorio y el servicio ya registran el error
             raise
         finally:
-            if conn:
-                conn.close()
+            pool.devolver(conn, descartar=descartar)
+            if replica is not None:
+                self.enrutador.soltar(replica)
+
+    def estadisticas_pool(self) -> dict:
+        if self._pool is None or self._pool_pid != os.getpid():
+            return {"ocupadas": 0, "libres": 0, "esperando": 0, "maximo": self.pool_max}
+        return self._pool.estadisticas()
+
+    def estadisticas_replicas(self) -> dict:
+        """Estado de cada réplica en el enrutador, con su pool si está abierto en este proceso"""
+        estadisticas = self.enrutador.estadisticas()
+        pid = os.getpid()
+        for replica, detalle in zip(self.replicas, estadisticas["replicas"]):
+            pool, pool_pid = self._pools_replicas.get(replica, (None, None))
+            detalle["pool"] = pool.estadisticas() if pool is not None and pool_pid == pid else None
+        return estadisticas
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.cerrar()
+            self._pool = None
+        with self._pool_lock:
+            pools, self._pools_replicas = list(self._pools_replicas.values()), {}
+        for pool, _ in pools:
+            pool.cerrar()
 
 db_connection = DatabaseConnection()
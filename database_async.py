@@ -0,0 +1,237 @@
+"""
+Conexión asíncrona a PostgreSQL con psycopg 3 y su pool nativo.
+
+Usa las mismas variables DB_* y DB_POOL_* que `database.DatabaseConnection`,
+y las mismas réplicas de lectura (DB_REPLICAS, ver replicas.py).
+Si psycopg 3 no está instalado, `ASYNC_DISPONIBLE` es False y la aplicación
+usa el repositorio síncrono como respaldo.
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+import time
+
+from metricas import observar_consulta, observar_espera_conexion, observar_filas
+from replicas import REPLICA_TIMEOUT, REPLICAS, SQL_RETRASO_REPLICA, Enrutador, Replica, parametros_replica
+from sentencias import SENTENCIAS_MAX, SENTENCIAS_PREPARADAS
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg.types.string import TextLoader
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+    ASYNC_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    psycopg = None
+    ASYNC_DISPONIBLE = False
+
+logger = logging.getLogger(__name__)
+
+
+if ASYNC_DISPONIBLE:
+    class CursorAsyncMedido(psycopg.AsyncCursor):
+        """Cursor que registra el tiempo de cada sentencia y las filas que devuelve o afecta"""
+
+        async def execute(self, query, params=None, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                observar_consulta(time.perf_counter() - inicio)
+                if self.rowcount >= 0:
+                    observar_filas(self.rowcount)
+
+
+class DatabaseConnectionAsync:
+    def __init__(self):
+        self.host = os.getenv("DB_HOST", "localhost")
+        self.port = os.getenv("DB_PORT", "5432")
+        self.database = os.getenv("DB_NAME", "LocalBaseDatosJava")
+        self.user = os.getenv("DB_USER", "postgres")
+        self.password = os.getenv("DB_PASSWORD", "123456")
+
+        self.pool_min = int(os.getenv("DB_POOL_MIN", "1"))
+        self.pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+        self.pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+        self.pool_vida_maxima = float(os.getenv("DB_POOL_VIDA_MAXIMA", "1800"))
+
+        self._pool = None
+        self._pool_lock = None
+
+        # Réplicas de lectura (replicas.py): un pool por réplica, abierto en su primera lectura
+        self.replicas = [Replica(parametros_replica(entrada, self.parametros())) for entrada in REPLICAS]
+        self.enrutador = Enrutador(self.replicas)
+        self._pools_replicas = {}  # réplica -> pool
+
+    def parametros(self) -> dict:
+        """Parámetros de conexión del primario"""
+        return {
+            "host": self.host,
+            "port": self.port,
+            "dbname": self.database,
+            "user": self.user,
+            "password": self.password,
+        }
+
+    def conninfo(self, parametros: dict = None) -> str:
+        return psycopg.conninfo.make_conninfo(**(parametros or self.parametros()))
+
+    @staticmethod
+    async def _configurar(conn):
+        # Los UUID se leen como texto, igual que con psycopg2
+        conn.adapters.register_loader("uuid", TextLoader)
+        # Caché de sentencias preparadas de la conexión (ver sentencias.py)
+        conn.prepared_max = SENTENCIAS_MAX
+        if not SENTENCIAS_PREPARADAS:
+            conn.prepare_threshold = None
+
+    async def _abrir_pool(self, conninfo: str, minimo: int, timeout: float):
+        pool = AsyncConnectionPool(
+            conninfo,
+            min_size=minimo,
+            max_size=self.pool_max,
+            timeout=timeout,
+            max_lifetime=self.pool_vida_maxima,
+            kwargs={"row_factory": dict_row, "cursor_factory": CursorAsyncMedido},
+            configure=self._configurar,
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+        await pool.open()
+        return pool
+
+    def _candado(self) -> asyncio.Lock:
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        return self._pool_lock
+
+    async def pool(self):
+        """Pool del event loop actual; se abre en el primer uso"""
+        if self._pool is None:
+            async with self._candado():
+                if self._pool is None:
+                    self._pool = await self._abrir_pool(self.conninfo(), self.pool_min, self.pool_timeout)
+        return self._pool
+
+    async def _pool_replica(self, replica: Replica):
+        pool = self._pools_replicas.get(replica)
+        if pool is None:
+            async with self._candado():
+                pool = self._pools_replicas.get(replica)
+                if pool is None:
+                    pool = await self._abrir_pool(self.conninfo(replica.parametros), 0, REPLICA_TIMEOUT)
+                    self._pools_replicas[replica] = pool
+        return pool
+
+    async def _expulsar(self, replica: Replica, motivo: str):
+        """Saca la réplica de la rotación y cierra su pool (deja de reintentar conectar); se recrea cuando vuelve"""
+        self.enrutador.expulsar(replica, motivo)
+        pool = self._pools_replicas.pop(replica, None)
+        if pool is not None:
+            await pool.close(timeout=1.0)
+
+    async def _tomar_replica(self):
+        """(réplica, pool, conexión) para una lectura, o (None, None, None) si debe ir al primario.
+
+        Mismo criterio que `DatabaseConnection._tomar_replica`. El pool de
+        psycopg 3 conecta en segundo plano y ante cualquier problema solo
+        informa PoolTimeout: si en la espera hubo conexiones fallidas la réplica
+        se expulsa; si no, estaba saturada y la lectura va al primario.
+        """
+        replica = self.enrutador.elegir()
+        while replica is not None:
+            pool = await self._pool_replica(replica)
+            errores = pool.get_stats().get("connections_errors", 0)
+            try:
+                conn = await pool.getconn()
+            except PoolTimeout as e:
+                self.enrutador.soltar(replica)
+                if pool.get_stats().get("connections_errors", 0) == errores:
+                    return None, None, None
+                await self._expulsar(replica, f"no acepta conexiones: {e}")
+                replica = self.enrutador.elegir()
+                continue
+
+            if self.enrutador.toca_verificar(replica):
+                try:
+                    cursor = await conn.execute(SQL_RETRASO_REPLICA, prepare=False)
+                    retraso = float((await cursor.fetchone())["retraso"])
+                except psycopg.Error as e:
+                    await pool.putconn(conn)
+                    self.enrutador.soltar(replica)
+                    await self._expulsar(replica, f"falló la verificación: {e}")
+                    replica = self.enrutador.elegir()
+                    continue
+                if not self.enrutador.registrar_retraso(replica, retraso):
+                    await conn.rollback()
+                    await pool.putconn(conn)
+                    self.enrutador.soltar(replica)
+                    replica = self.enrutador.elegir()
+                    continue
+            return replica, pool, conn
+        return None, None, None
+
+    @asynccontextmanager
+    async def get_db_connection(self, lectura: bool = False):
+        """Conexión del primario; con `lectura=True`, de una réplica disponible si hay (replicas.py)"""
+        inicio = time.perf_counter()
+        try:
+            replica, pool, conn = await self._tomar_replica() if lectura and self.replicas else (None, None, None)
+            if replica is None:
+                pool = await self.pool()
+                conn = await pool.getconn()
+        finally:
+            # También la espera que termina en PoolTimeout: es justo la del pool saturado
+            observar_espera_conexion(time.perf_counter() - inicio)
+
+        try:
+            # Igual que pool.connection(): COMMIT al salir bien, ROLLBACK ante un error
+            async with conn:
+                yield conn
+        except Exception as e:
+            # Sin log aquí: el repositorio y el servicio ya registran el error
+            if replica is not None and conn.broken:
+                await self._expulsar(replica, f"se cortó la conexión: {e}")
+            raise
+        finally:
+            await pool.putconn(conn)
+            if replica is not None:
+                self.enrutador.soltar(replica)
+
+    def _estadisticas(self, pool, minimo: int) -> dict:
+        stats = pool.get_stats()
+        tamano = stats.get("pool_size", 0)
+        libres = stats.get("pool_available", 0)
+        return {
+            "minimo": minimo,
+            "maximo": self.pool_max,
+            "ocupadas": tamano - libres,
+            "libres": libres,
+            "esperando": stats.get("requests_waiting", 0),
+            "total_tomadas": stats.get("requests_num", 0),
+            "total_timeouts": stats.get("requests_errors", 0),
+        }
+
+    def estadisticas_pool(self) -> dict:
+        if self._pool is None:
+            return {"ocupadas": 0, "libres": 0, "esperando": 0, "maximo": self.pool_max}
+        return self._estadisticas(self._pool, self.pool_min)
+
+    def estadisticas_replicas(self) -> dict:
+        """Estado de cada réplica en el enrutador, con su pool si está abierto"""
+        estadisticas = self.enrutador.estadisticas()
+        for replica, detalle in zip(self.replicas, estadisticas["replicas"]):
+            pool = self._pools_replicas.get(replica)
+            detalle["pool"] = self._estadisticas(pool, 0) if pool is not None else None
+        return estadisticas
+
+    async def cerrar(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        pools, self._pools_replicas = list(self._pools_replicas.values()), {}
+        for pool in pools:
+            await pool.close()
+
+db_connection_async = DatabaseConnectionAsync() if ASYNC_DISPONIBLE else None
\ No newline at end of file
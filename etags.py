@@ -0,0 +1,137 @@
+"""
+ETags fuertes de formulario_cliente derivados de updated_at.
+
+Cada escritura fija updated_at con precisión de microsegundos, así que el
+instante identifica la versión de la fila. El ETag es ese instante en
+microsegundos desde la época, en hexadecimal y entre comillas; se puede
+convertir de vuelta para usarlo en `WHERE updated_at = ...` sin leer la fila.
+
+Con el cuerpo comprimido (compresion.py) el ETag fuerte lleva el sufijo de la
+codificación (`"<v>-gz"`, `-br`, `-zst`): un validador fuerte identifica los
+bytes exactos. Antes de comparar If-Match o If-None-Match se quita el sufijo.
+
+También los validadores de GET condicional: Last-Modified por formulario, un
+ETag débil de colección para /formulario/all (posición en formulario_cambios,
+ver consultas.SQL_VERSION_COLECCION) y las políticas de Cache-Control (CACHE_CONTROL_FORMULARIO y
+CACHE_CONTROL_LISTADOS).
+"""
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional
+import os
+
+from consultas import CAMBIOS_HABILITADOS
+
+_EPOCA = datetime(1970, 1, 1)
+
+# "no-cache" deja guardar la respuesta pero obliga a revalidarla (304 si no cambió)
+CACHE_CONTROL_FORMULARIO = os.getenv("CACHE_CONTROL_FORMULARIO", "private, no-cache")
+CACHE_CONTROL_LISTADOS = os.getenv("CACHE_CONTROL_LISTADOS", "private, no-cache")
+# La versión de la colección sale del registro de cambios: sin él no hay ETag de listados
+ETAG_LISTADOS_HABILITADO = (os.getenv("ETAG_LISTADOS_HABILITADO", "true").lower() == "true"
+                            and CAMBIOS_HABILITADOS)
+
+# Sufijo del ETag fuerte por Content-Encoding
+SUFIJOS_CODIFICACION = {"gzip": "gz", "br": "br", "zstd": "zst"}
+_FINALES_CODIFICADOS = tuple(f'-{sufijo}"' for sufijo in SUFIJOS_CODIFICACION.values())
+
+
+def etag_desde_fecha(updated_at: datetime) -> str:
+    micros = (updated_at.replace(tzinfo=None) - _EPOCA) // timedelta(microseconds=1)
+    return f'"{micros:x}"'
+
+
+def etag_con_codificacion(etag: str, codificacion: str) -> str:
+    """ETag del cuerpo enviado con `codificacion`; los débiles no cambian"""
+    if etag.startswith("W/") or len(etag) < 2 or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{SUFIJOS_CODIFICACION[codificacion]}"'
+
+
+def etag_sin_codificacion(etag: str) -> str:
+    """Quita el sufijo de la codificación: queda el ETag de la versión"""
+    etag = etag.strip()
+    for final in _FINALES_CODIFICADOS:
+        if etag.endswith(final):
+            return etag[:-len(final)] + '"'
+    return etag
+
+
+def fecha_desde_etag(etag: str) -> Optional[datetime]:
+    """Devuelve el updated_at de un ETag fuerte (con o sin sufijo de codificación);
+    None si es débil o no es de esta API"""
+    etag = etag_sin_codificacion(etag)
+    if etag.startswith("W/") or len(etag) < 3 or etag[0] != '"' or etag[-1] != '"':
+        return None
+    try:
+        return _EPOCA + timedelta(microseconds=int(etag[1:-1], 16))
+    except (ValueError, OverflowError):
+        return None
+
+
+def versiones_if_match(if_match: Optional[str]) -> Optional[List[datetime]]:
+    """Traduce la cabecera If-Match a la lista de updated_at aceptados.
+
+    None si no hay precondición (cabecera ausente o `*`). Una lista vacía
+    significa que ningún ETag es válido y la precondición no puede cumplirse.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    versiones = []
+    for etag in if_match.split(","):
+        fecha = fecha_desde_etag(etag)
+        if fecha is not None:
+            versiones.append(fecha)
+    return versiones
+
+
+def etag_coleccion(posicion: int, cantidad: int) -> str:
+    """ETag débil de la colección: cambia con cada alta, modificación o baja confirmada (xmin
+    del snapshot y cambios registrados desde él). Es débil porque una transacción ajena que
+    termina también adelanta el xmin: el ETag cambia aunque las filas sean las mismas"""
+    return f'W/"c{posicion:x}-{cantidad:x}"'
+
+
+def fecha_http(fecha: datetime) -> str:
+    """Fecha en formato HTTP (GMT); las fechas sin zona se toman como hora local, como datetime.now()"""
+    return format_datetime(fecha.astimezone(timezone.utc), usegmt=True)
+
+
+def _fecha_desde_http(texto: str) -> Optional[datetime]:
+    try:
+        fecha = parsedate_to_datetime(texto)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return fecha if fecha.tzinfo is not None else fecha.replace(tzinfo=timezone.utc)
+
+
+def coincide_if_none_match(if_none_match: str, etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): se ignora el prefijo W/"""
+    if if_none_match.strip() == "*":
+        return True
+    actual = etag_sin_codificacion(etag).removeprefix("W/")
+    return any(etag_sin_codificacion(candidato).removeprefix("W/") == actual
+               for candidato in if_none_match.split(","))
+
+
+def no_modificado(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str,
+                  ultima_modificacion: Optional[datetime] = None) -> bool:
+    """True si la petición condicional puede responderse con 304.
+
+    If-None-Match tiene prioridad; If-Modified-Since solo se evalúa sin él y con
+    Last-Modified, comparando con resolución de segundos como la cabecera.
+    """
+    if if_none_match is not None:
+        return coincide_if_none_match(if_none_match, etag)
+    if if_modified_since is None or ultima_modificacion is None:
+        return False
+    fecha = _fecha_desde_http(if_modified_since)
+    return fecha is not None and ultima_modificacion.astimezone(timezone.utc).replace(microsecond=0) <= fecha
+
+
+def cabeceras_formulario(updated_at: datetime) -> dict:
+    return {
+        "ETag": etag_desde_fecha(updated_at),
+        "Last-Modified": fecha_http(updated_at),
+        "Cache-Control": CACHE_CONTROL_FORMULARIO,
+    }
@@ -0,0 +1,323 @@
+"""
+Claves de idempotencia para las escrituras que crean o eliminan en lote.
+
+Con la cabecera `Idempotency-Key`, POST /formulario/create, POST /formulario/bulk
+y DELETE /formulario/bulk guardan su respuesta (código, cabeceras y cuerpo) bajo
+"<método> <ruta> <clave>" durante IDEMPOTENCIA_TTL segundos. Un reintento con la
+misma clave y la misma petición recibe la respuesta guardada sin volver a validar
+ni a insertar, con la cabecera `Idempotent-Replayed: true`.
+
+- La misma clave con otra query o cuerpo responde 422.
+- Un duplicado que llega mientras la primera petición sigue en curso la espera
+  (hasta IDEMPOTENCIA_ESPERA segundos; después responde 409 con Retry-After).
+  En el mismo worker espera su finalización; entre workers consulta el almacén.
+- Las respuestas 5xx, 409 y 429 no se guardan: la clave se libera y el cliente
+  puede reintentar.
+
+Almacenes (IDEMPOTENCIA_ALMACEN):
+- `postgres`: tabla formulario_idempotencia (migraciones/0004_idempotencia.sql),
+  compartida por todos los workers.
+- `memoria`: por worker, para desarrollo o un solo proceso.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from consultas import (
+    SQL_IDEMPOTENCIA_RESERVAR, SQL_IDEMPOTENCIA_COMPLETAR, SQL_IDEMPOTENCIA_LIBERAR, SQL_IDEMPOTENCIA_PURGAR,
+)
+from database import db_connection, CursorMedido
+from database_async import db_connection_async
+from repository_async import FormularioClienteRepositoryAsync, formulario_repository_async
+from respuestas import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCIA_HABILITADA = os.getenv("IDEMPOTENCIA_HABILITADA", "true").lower() == "true"
+IDEMPOTENCIA_ALMACEN = os.getenv("IDEMPOTENCIA_ALMACEN", "postgres").lower()
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", "86400"))
+IDEMPOTENCIA_RESERVA = float(os.getenv("IDEMPOTENCIA_RESERVA", "60"))
+IDEMPOTENCIA_ESPERA = float(os.getenv("IDEMPOTENCIA_ESPERA", "10"))
+IDEMPOTENCIA_MAX_ENTRADAS = int(os.getenv("IDEMPOTENCIA_MAX_ENTRADAS", "100000"))
+IDEMPOTENCIA_PURGA_INTERVALO = float(os.getenv("IDEMPOTENCIA_PURGA_INTERVALO", "300"))
+
+CABECERA_CLAVE = b"idempotency-key"
+LARGO_MAXIMO_CLAVE = 255
+RUTAS_IDEMPOTENTES = {
+    ("POST", "/formulario/create"),
+    ("POST", "/formulario/bulk"),
+    ("DELETE", "/formulario/bulk"),
+}
+# Respuestas que dependen del momento y no del contenido de la petición
+CODIGOS_NO_GUARDABLES = {409, 429}
+
+
+@dataclass(slots=True)
+class RespuestaGuardada:
+    """Fila del almacén; `codigo` es None mientras la primera petición está en curso"""
+    huella: bytes
+    codigo: Optional[int] = None
+    cabeceras: Optional[list] = None
+    cuerpo: Optional[bytes] = None
+
+
+class AlmacenIdempotencia(ABC):
+    """Interfaz de los almacenes de claves"""
+
+    @abstractmethod
+    async def reservar(self, clave: str, huella: bytes) -> Tuple[bool, Optional[RespuestaGuardada]]:
+        """Reserva la clave si no existe o expiró: (True, None). Si no, (False, fila vigente)
+        o (False, None) si otra petición la está reservando en ese momento"""
+
+    @abstractmethod
+    async def completar(self, clave: str, huella: bytes, codigo: int, cabeceras: list, cuerpo: bytes):
+        ...
+
+    @abstractmethod
+    async def liberar(self, clave: str, huella: bytes):
+        ...
+
+
+class AlmacenIdempotenciaMemoria(AlmacenIdempotencia):
+    """Almacén por worker: las claves vencidas se descartan al pasar por ellas o al llenarse"""
+
+    def __init__(self, max_entradas: int = IDEMPOTENCIA_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()  # clave -> (expira_en, RespuestaGuardada)
+
+    async def reservar(self, clave: str, huella: bytes):
+        ahora = time.monotonic()
+        entrada = self._datos.get(clave)
+        if entrada is not None and entrada[0] > ahora:
+            return False, entrada[1]
+        self._datos[clave] = (ahora + IDEMPOTENCIA_RESERVA, RespuestaGuardada(huella))
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.max_entradas:
+            self._datos.popitem(last=False)
+        return True, None
+
+    async def completar(self, clave, huella, codigo, cabeceras, cuerpo):
+        entrada = self._datos.get(clave)
+        if entrada is not None and entrada[1].huella == huella:
+            self._datos[clave] = (time.monotonic() + IDEMPOTENCIA_TTL,
+                                  RespuestaGuardada(huella, codigo, cabeceras, cuerpo))
+
+    async def liberar(self, clave, huella):
+        entrada = self._datos.get(clave)
+        if entrada is not None and entrada[1].huella == huella and entrada[1].codigo is None:
+            del self._datos[clave]
+
+
+class AlmacenIdempotenciaPostgres(AlmacenIdempotencia):
+    """Tabla formulario_idempotencia por la misma ruta de datos que los repositorios (DB_MODO)"""
+
+    def __init__(self):
+        self.usar_async = isinstance(formulario_repository_async, FormularioClienteRepositoryAsync)
+        self._ultima_purga = time.monotonic()
+        self._purga: Optional[asyncio.Task] = None
+
+    def _ejecutar_sync(self, consulta, valores, leer: bool):
+        with db_connection.get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=CursorMedido)
+            cursor.execute(consulta, valores)
+            fila = cursor.fetchone() if leer else None
+            conn.commit()
+            return fila
+
+    async def _ejecutar(self, consulta, valores, leer: bool = False):
+        if not self.usar_async:
+            return await run_in_threadpool(self._ejecutar_sync, consulta, valores, leer)
+        async with db_connection_async.get_db_connection() as conn:
+            cursor = await conn.execute(consulta, valores)
+            return await cursor.fetchone() if leer else None
+
+    def _purgar_si_toca(self):
+        ahora = time.monotonic()
+        if ahora - self._ultima_purga < IDEMPOTENCIA_PURGA_INTERVALO or self._purga is not None:
+            return
+        self._ultima_purga = ahora
+
+        async def purgar():
+            try:
+                await self._ejecutar(SQL_IDEMPOTENCIA_PURGAR, ())
+            except Exception as e:
+                logger.error("Error purgando claves de idempotencia: %s", e)
+            finally:
+                self._purga = None
+
+        self._purga = asyncio.create_task(purgar())
+
+    async def reservar(self, clave, huella):
+        self._purgar_si_toca()
+        fila = await self._ejecutar(
+            SQL_IDEMPOTENCIA_RESERVAR, {"clave": clave, "huella": huella, "reserva": IDEMPOTENCIA_RESERVA}, leer=True,
+        )
+        if fila["reservada"]:
+            return True, None
+        if fila["huella"] is None:
+            return False, None
+        cabeceras = loads(bytes(fila["cabeceras"])) if fila["cabeceras"] is not None else None
+        cuerpo = bytes(fila["cuerpo"]) if fila["cuerpo"] is not None else None
+        return False, RespuestaGuardada(bytes(fila["huella"]), fila["codigo"], cabeceras, cuerpo)
+
+    async def completar(self, clave, huella, codigo, cabeceras, cuerpo):
+        await self._ejecutar(SQL_IDEMPOTENCIA_COMPLETAR,
+                             (codigo, dumps(cabeceras), cuerpo, IDEMPOTENCIA_TTL, clave, huella))
+
+    async def liberar(self, clave, huella):
+        await self._ejecutar(SQL_IDEMPOTENCIA_LIBERAR, (clave, huella))
+
+
+def crear_almacen_idempotencia() -> AlmacenIdempotencia:
+    if IDEMPOTENCIA_ALMACEN not in ("postgres", "memoria"):
+        raise ValueError(f"IDEMPOTENCIA_ALMACEN inválido: {IDEMPOTENCIA_ALMACEN!r} (use 'postgres' o 'memoria')")
+    if IDEMPOTENCIA_ALMACEN == "memoria":
+        return AlmacenIdempotenciaMemoria()
+    return AlmacenIdempotenciaPostgres()
+
+
+def _respuesta_error(codigo: int, mensaje: str, cabeceras=()):
+    cuerpo = dumps({"message": [mensaje], "data": []})
+    return codigo, [(b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode()),
+                    *cabeceras], cuerpo
+
+
+class MiddlewareIdempotencia:
+    """Middleware ASGI: va por dentro de CORS para que las respuestas repetidas reciban sus cabeceras"""
+
+    def __init__(self, app, almacen: Optional[AlmacenIdempotencia] = None):
+        self.app = app
+        self.almacen = almacen or almacen_idempotencia
+        self._en_curso = {}  # clave -> asyncio.Event de la petición que la reservó en este worker
+
+    async def _enviar(self, send, codigo: int, cabeceras, cuerpo: bytes):
+        await send({"type": "http.response.start", "status": codigo, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+    async def _reservar(self, clave: str, huella: bytes):
+        """Espera a que la clave quede libre o tenga respuesta; devuelve la respuesta a enviar o None si se reservó"""
+        limite = time.monotonic() + IDEMPOTENCIA_ESPERA
+        pausa = 0.01
+        espero = False
+        while True:
+            aviso = self._en_curso.get(clave)
+            if aviso is not None:
+                resultados_idempotencia["esperadas"] += not espero
+                espero = True
+                try:
+                    await asyncio.wait_for(aviso.wait(), max(0.0, limite - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+                continue
+
+            reservada, guardada = await self.almacen.reservar(clave, huella)
+            if reservada:
+                return None
+            if guardada is not None and guardada.huella != huella:
+                resultados_idempotencia["conflictos"] += 1
+                return _respuesta_error(422, "La clave de idempotencia ya se usó con otra petición")
+            if guardada is not None and guardada.codigo is not None:
+                resultados_idempotencia["repetidas"] += 1
+                cabeceras = [(nombre.encode("latin-1"), valor.encode("latin-1")) for nombre, valor in guardada.cabeceras]
+                return guardada.codigo, cabeceras + [(b"idempotent-replayed", b"true")], guardada.cuerpo
+
+            # En curso en otro worker (o reservándose ahora mismo)
+            if time.monotonic() >= limite:
+                break
+            resultados_idempotencia["esperadas"] += not espero
+            espero = True
+            await asyncio.sleep(pausa)
+            pausa = min(pausa * 2, 0.25)
+
+        resultados_idempotencia["en_curso"] += 1
+        return _respuesta_error(409, "Ya hay una petición en curso con esta clave de idempotencia",
+                                [(b"retry-after", b"1")])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in RUTAS_IDEMPOTENTES:
+            await self.app(scope, receive, send)
+            return
+
+        valor = next((v for nombre, v in scope["headers"] if nombre == CABECERA_CLAVE), None)
+        if valor is None:
+            await self.app(scope, receive, send)
+            return
+        if not valor.strip() or len(valor) > LARGO_MAXIMO_CLAVE:
+            await self._enviar(send, *_respuesta_error(
+                400, f"Idempotency-Key debe tener entre 1 y {LARGO_MAXIMO_CLAVE} caracteres"))
+            return
+
+        # El cuerpo se lee completo para la huella y se entrega igual a la aplicación
+        partes = []
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                return
+            partes.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False):
+                break
+        cuerpo = b"".join(partes)
+        huella = hashlib.sha256(scope.get("query_string", b"") + b"\n" + cuerpo).digest()
+        clave = f"{scope['method']} {scope['path']} {valor.decode('latin-1')}"
+
+        try:
+            respuesta = await self._reservar(clave, huella)
+        except Exception as e:
+            logger.error("Error consultando el almacén de idempotencia: %s", e)
+            respuesta = _respuesta_error(500, "Error interno del servidor")
+        if respuesta is not None:
+            await self._enviar(send, *respuesta)
+            return
+
+        resultados_idempotencia["nuevas"] += 1
+        aviso = self._en_curso[clave] = asyncio.Event()
+        entregado = False
+
+        async def recibir():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        codigo, cabeceras, cuerpo_respuesta = 500, [], []
+
+        async def enviar(mensaje):
+            nonlocal codigo, cabeceras
+            if mensaje["type"] == "http.response.start":
+                codigo, cabeceras = mensaje["status"], mensaje.get("headers", [])
+            elif mensaje["type"] == "http.response.body":
+                cuerpo_respuesta.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        guardar = False
+        try:
+            await self.app(scope, recibir, enviar)
+            guardar = codigo < 500 and codigo not in CODIGOS_NO_GUARDABLES
+        finally:
+            try:
+                if guardar:
+                    await self.almacen.completar(
+                        clave, huella, codigo,
+                        [(nombre.decode("latin-1"), v.decode("latin-1")) for nombre, v in cabeceras],
+                        b"".join(cuerpo_respuesta),
+                    )
+                else:
+                    await self.almacen.liberar(clave, huella)
+            except Exception as e:
+                logger.error("Error guardando la respuesta idempotente de %r: %s", clave, e)
+            finally:
+                del self._en_curso[clave]
+                aviso.set()
+
+
+resultados_idempotencia = {"nuevas": 0, "repetidas": 0, "esperadas": 0, "conflictos": 0, "en_curso": 0}
+almacen_idempotencia = crear_almacen_idempotencia()
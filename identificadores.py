@@ -0,0 +1,68 @@
+"""
+Generación de IDs para formulario_cliente.
+
+DB_ID_MODO elige quién genera el ID al insertar:
+- "db" (por defecto): la columna usa su DEFAULT uuid_generate_v4().
+- "uuid7": la aplicación genera UUIDv7 ordenados por tiempo, de modo que las
+  inserciones (que llegan en orden de created_at) se agregan al final del
+  índice de la clave primaria en lugar de repartirse por todo el B-tree.
+"""
+import os
+import threading
+import time
+import uuid
+
+MODOS_ID = ("db", "uuid7")
+
+_lock = threading.Lock()
+_ultimo_ms = 0
+_secuencia = 0
+
+
+def modo_id() -> str:
+    modo = os.getenv("DB_ID_MODO", "db").lower()
+    if modo not in MODOS_ID:
+        raise ValueError(f"DB_ID_MODO inválido: {modo!r} (use {' o '.join(MODOS_ID)})")
+    return modo
+
+
+def generar_uuid7() -> str:
+    """UUIDv7 (RFC 9562): 48 bits de milisegundos Unix, 12 bits de secuencia y 62 aleatorios.
+
+    Dentro del mismo milisegundo la secuencia aumenta, así los IDs de un mismo
+    proceso son estrictamente crecientes.
+    """
+    global _ultimo_ms, _secuencia
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms <= _ultimo_ms:
+            _secuencia += 1
+            if _secuencia > 0xFFF:
+                _ultimo_ms += 1
+                _secuencia = 0
+            ms = _ultimo_ms
+        else:
+            _ultimo_ms = ms
+            _secuencia = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        secuencia = _secuencia
+
+    aleatorio = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    valor = (ms & ((1 << 48) - 1)) << 80
+    valor |= 0x7 << 76
+    valor |= secuencia << 64
+    valor |= 0b10 << 62
+    valor |= aleatorio
+    return str(uuid.UUID(int=valor))
+
+
+def nuevo_id():
+    """ID a enviar en el INSERT, o None si lo genera la base de datos"""
+    return generar_uuid7() if modo_id() == "uuid7" else None
+
+
+def es_colision_de_id(error) -> bool:
+    """True si el error es una violación de unicidad sobre la clave primaria"""
+    if getattr(error, "pgcode", None) != "23505" and getattr(error, "sqlstate", None) != "23505":
+        return False
+    restriccion = getattr(getattr(error, "diag", None), "constraint_name", None) or ""
+    return restriccion.endswith("_pkey")
@@ -0,0 +1,268 @@
+"""
+Límites de tasa y descarte de carga (por worker).
+
+`MiddlewareLimites` decide antes de tocar la base:
+
+1. Cubeta de tokens por cliente y ruta (LIMITE_TASA / LIMITE_RAFAGA, con
+   excepciones por ruta en LIMITE_RUTAS) y, opcionalmente, por ruta para todos
+   los clientes (LIMITE_RUTAS_TOTAL). Sin tokens responde 429 con Retry-After.
+2. En las rutas que usan la base (/formulario/*, salvo el stream de cambios):
+   - Si la espera reciente por una conexión del pool (también las que
+     terminaron en timeout) supera LIMITE_ESPERA_POOL_MS y el pool sigue sin
+     cupo en ese momento, responde 503 de inmediato en vez de encolar la
+     petición hasta que el cliente se rinda. Apenas el pool tiene una conexión
+     libre las peticiones vuelven a pasar, sin esperar a que baje el promedio.
+   - Como mucho LIMITE_CONCURRENCIA_BD peticiones a la vez; las demás esperan
+     un cupo hasta LIMITE_ESPERA_COLA_MS y después reciben 503.
+
+El formato de LIMITE_RUTAS y LIMITE_RUTAS_TOTAL es
+"<MÉTODO> <plantilla>=<tasa>/<ráfaga>" separado por comas, p. ej.
+"GET /formulario/all=5/10,POST /formulario/bulk=1/2". Una tasa de 0 desactiva
+el límite de esa ruta. Los clientes se identifican por IP (la primera de
+X-Forwarded-For con LIMITE_CONFIAR_PROXY=true) o por la cabecera
+LIMITE_CABECERA_CLIENTE si se configura.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import math
+import os
+import time
+
+from starlette.routing import Match
+
+from metricas import ESPERA_CONEXION_RECIENTE
+from respuestas import dumps
+
+logger = logging.getLogger(__name__)
+
+LIMITES_HABILITADOS = os.getenv("LIMITES_HABILITADOS", "true").lower() == "true"
+LIMITE_TASA = float(os.getenv("LIMITE_TASA", "50"))
+LIMITE_RAFAGA = float(os.getenv("LIMITE_RAFAGA", "100"))
+LIMITE_RUTAS = os.getenv("LIMITE_RUTAS", "")
+LIMITE_RUTAS_TOTAL = os.getenv("LIMITE_RUTAS_TOTAL", "")
+LIMITE_MAX_CLIENTES = int(os.getenv("LIMITE_MAX_CLIENTES", "10000"))
+LIMITE_CONFIAR_PROXY = os.getenv("LIMITE_CONFIAR_PROXY", "false").lower() == "true"
+LIMITE_CABECERA_CLIENTE = os.getenv("LIMITE_CABECERA_CLIENTE", "").lower().encode("latin-1")
+LIMITE_CONCURRENCIA_BD = int(os.getenv("LIMITE_CONCURRENCIA_BD") or 2 * int(os.getenv("DB_POOL_MAX", "10")))
+LIMITE_ESPERA_COLA = float(os.getenv("LIMITE_ESPERA_COLA_MS", "1000")) / 1000
+LIMITE_ESPERA_POOL = float(os.getenv("LIMITE_ESPERA_POOL_MS", "500")) / 1000
+DB_MODO = os.getenv("DB_MODO", "async").lower()
+
+PREFIJO_RUTAS_BD = "/formulario"
+# Streams largos que no deben ocupar un cupo de concurrencia mientras están abiertos
+RUTAS_SIN_CUPO = {"/formulario/changes"}
+
+
+def leer_limites(texto: str) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """Interpreta "<MÉTODO> <plantilla>=<tasa>/<ráfaga>,..." como {(método, plantilla): (tasa, ráfaga)}"""
+    limites = {}
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        try:
+            ruta, _, valores = parte.rpartition("=")
+            metodo, plantilla = ruta.split(None, 1)
+            tasa, _, rafaga = valores.partition("/")
+            limites[(metodo.upper(), plantilla.strip())] = (float(tasa), float(rafaga or tasa))
+        except ValueError:
+            raise ValueError(f"Límite de ruta inválido: {parte!r} (use '<MÉTODO> <ruta>=<tasa>/<ráfaga>')")
+    return limites
+
+
+class CubetaTokens:
+    """`rafaga` tokens como máximo, repuestos a `tasa` por segundo"""
+
+    __slots__ = ("tasa", "rafaga", "tokens", "instante")
+
+    def __init__(self, tasa: float, rafaga: float, ahora: float):
+        self.tasa = tasa
+        self.rafaga = max(rafaga, 1.0)
+        self.tokens = self.rafaga
+        self.instante = ahora
+
+    def tomar(self, ahora: float) -> float:
+        """Consume un token; si no hay, devuelve los segundos hasta el próximo (0 si se tomó)"""
+        self.tokens = min(self.rafaga, self.tokens + max(0.0, ahora - self.instante) * self.tasa)
+        self.instante = max(self.instante, ahora)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.tasa
+
+
+class LimitadorTasa:
+    """Cubetas por clave con un máximo de claves (LRU), para acotar la memoria con muchos clientes"""
+
+    def __init__(self, max_claves: int = LIMITE_MAX_CLIENTES):
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()
+
+    def tomar(self, clave, tasa: float, rafaga: float, ahora: float) -> float:
+        cubeta = self._cubetas.get(clave)
+        if cubeta is None:
+            cubeta = self._cubetas[clave] = CubetaTokens(tasa, rafaga, ahora)
+            if len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+        else:
+            self._cubetas.move_to_end(clave)
+        return cubeta.tomar(ahora)
+
+    def __len__(self):
+        return len(self._cubetas)
+
+
+class LimitadorConcurrencia:
+    """Semáforo con espera acotada que lleva la cuenta de las peticiones en curso y en cola"""
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._semaforo = asyncio.Semaphore(maximo)
+        self.en_curso = 0
+        self.en_cola = 0
+
+    async def entrar(self, espera: float) -> bool:
+        if self._semaforo.locked():
+            self.en_cola += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), espera)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.en_cola -= 1
+        else:
+            await self._semaforo.acquire()
+        self.en_curso += 1
+        return True
+
+    def salir(self):
+        self.en_curso -= 1
+        self._semaforo.release()
+
+
+def _respuesta(codigo: int, mensaje: str, reintentar: float):
+    cuerpo = dumps({"message": [mensaje], "data": []})
+    return codigo, [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(cuerpo)).encode()),
+        (b"retry-after", str(max(1, math.ceil(reintentar))).encode()),
+    ], cuerpo
+
+
+def pool_sin_cupo() -> bool:
+    """True si el pool del primario de la ruta activa (DB_MODO) tiene peticiones esperando o todas sus conexiones ocupadas"""
+    # Import diferido: database importa replicas, que importa este módulo
+    from database import db_connection
+    from database_async import db_connection_async
+
+    conexion = db_connection_async if DB_MODO == "async" and db_connection_async is not None else db_connection
+    estado = conexion.estadisticas_pool()
+    return estado["esperando"] > 0 or estado["ocupadas"] >= estado["maximo"]
+
+
+def identificar_cliente(scope) -> str:
+    """IP del cliente (la primera de X-Forwarded-For si se confía en el proxy) o LIMITE_CABECERA_CLIENTE"""
+    if LIMITE_CABECERA_CLIENTE or LIMITE_CONFIAR_PROXY:
+        for nombre, valor in scope["headers"]:
+            if LIMITE_CABECERA_CLIENTE and nombre == LIMITE_CABECERA_CLIENTE:
+                return valor.decode("latin-1")
+            if LIMITE_CONFIAR_PROXY and nombre == b"x-forwarded-for":
+                return valor.decode("latin-1").split(",")[0].strip()
+    cliente = scope.get("client")
+    return cliente[0] if cliente else "desconocido"
+
+
+class MiddlewareLimites:
+    """Middleware ASGI: va por dentro de CORS para que las respuestas 429/503 lleven sus cabeceras"""
+
+    def __init__(self, app):
+        self.app = app
+        self.por_ruta = leer_limites(LIMITE_RUTAS)
+        self.por_ruta_total = leer_limites(LIMITE_RUTAS_TOTAL)
+        self.clientes = LimitadorTasa()
+        self.totales = LimitadorTasa()
+        self.concurrencia = LimitadorConcurrencia(LIMITE_CONCURRENCIA_BD)
+        estadisticas_limites["limitador"] = self
+
+    def _plantilla(self, scope) -> Optional[str]:
+        for ruta in scope["app"].routes:
+            coincidencia, _ = ruta.matches(scope)
+            if coincidencia == Match.FULL:
+                return ruta.path
+        return None
+
+    def _limitar(self, scope, ruta: Tuple[str, str]) -> float:
+        """Segundos hasta poder atender al cliente en esta ruta (0 si se atiende ya)"""
+        ahora = time.monotonic()
+        tasa, rafaga = self.por_ruta_total.get(ruta, (0.0, 0.0))
+        if tasa > 0:
+            espera = self.totales.tomar(ruta, tasa, rafaga, ahora)
+            if espera:
+                return espera
+        tasa, rafaga = self.por_ruta.get(ruta, (LIMITE_TASA, LIMITE_RAFAGA))
+        if tasa > 0:
+            return self.clientes.tomar((identificar_cliente(scope), ruta), tasa, rafaga, ahora)
+        return 0.0
+
+    async def _enviar(self, send, codigo, cabeceras, cuerpo):
+        await send({"type": "http.response.start", "status": codigo, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": cuerpo})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Las URL sin ruta comparten una sola serie para no crear contadores sin límite
+        plantilla = self._plantilla(scope) or "sin_ruta"
+        ruta = (scope["method"], plantilla)
+        contador = estadisticas_limites["rutas"].get(ruta)
+        if contador is None:
+            contador = estadisticas_limites["rutas"][ruta] = {"permitidas": 0, "limitadas": 0, "descartadas": 0}
+
+        espera = self._limitar(scope, ruta)
+        if espera:
+            contador["limitadas"] += 1
+            await self._enviar(send, *_respuesta(429, "Demasiadas peticiones; reintente más tarde", espera))
+            return
+
+        if not plantilla.startswith(PREFIJO_RUTAS_BD) or plantilla in RUTAS_SIN_CUPO:
+            contador["permitidas"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        # El promedio solo avisa; la decisión la toma el estado actual del pool
+        if ESPERA_CONEXION_RECIENTE.valor > LIMITE_ESPERA_POOL and pool_sin_cupo():
+            contador["descartadas"] += 1
+            await self._enviar(send, *_respuesta(
+                503, "El servicio está saturado; reintente más tarde", ESPERA_CONEXION_RECIENTE.valor))
+            return
+
+        if not await self.concurrencia.entrar(LIMITE_ESPERA_COLA):
+            contador["descartadas"] += 1
+            await self._enviar(send, *_respuesta(
+                503, "El servicio está saturado; reintente más tarde", LIMITE_ESPERA_COLA))
+            return
+
+        contador["permitidas"] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.concurrencia.salir()
+
+
+def estadisticas() -> dict:
+    limitador = estadisticas_limites["limitador"]
+    return {
+        "habilitados": LIMITES_HABILITADOS,
+        "espera_pool_reciente_ms": round(ESPERA_CONEXION_RECIENTE.valor * 1000, 3),
+        "concurrencia_bd": None if limitador is None else {
+            "maximo": limitador.concurrencia.maximo,
+            "en_curso": limitador.concurrencia.en_curso,
+            "en_cola": limitador.concurrencia.en_cola,
+        },
+        "clientes": 0 if limitador is None else len(limitador.clientes),
+    }
+
+
+# Contadores por (método, plantilla); el middleware se registra al crearse
+estadisticas_limites = {"limitador": None, "rutas": {}}
@@ -1,26 +1,75 @@
+import time
+
+INICIO_IMPORTACION = time.perf_counter()
+
+# Logs en cola (bitacora.py) antes de importar el resto, para que los del arranque
+# también salgan por ahí
+import bitacora
+bitacora.configurar_logs()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from controller import router as formulario_router
+from database import db_connection
+from database_async import db_connection_async
+from cache import formulario_cache
+from service import formulario_service
+from cambios import oyente_cambios
+from arranque import medicion_arranque, precalentar
+from idempotencia import IDEMPOTENCIA_HABILITADA, MiddlewareIdempotencia, resultados_idempotencia
+import limites
+import compresion
+import replicas
+from metricas import ESPERA_CONEXION_RECIENTE, METRICAS_HABILITADAS, MedidorCalculado, MiddlewareMetricas, registro
 import logging
 import uvicorn
 
-# Configuración de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Arranque y cierre de cada worker
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    inicio = time.perf_counter()
+    # Antes de atender: el nivel local del caché se activa recién con la suscripción confirmada
+    await formulario_cache.iniciar()
+    await precalentar(app)
+    medicion_arranque.marcar("precalentamiento", time.perf_counter() - inicio)
+    medicion_arranque.completar()
+    yield
+    # Cierre ordenado: uvicorn ya drenó las peticiones en curso (SERVIDOR_TIEMPO_DRENADO)
+    await oyente_cambios.cerrar()
+    if db_connection_async is not None:
+        await db_connection_async.cerrar()
+    db_connection.cerrar()
+    await formulario_cache.cerrar()
+
 # Crear la aplicación FastAPI
 app = FastAPI(
     title="API Formulario Cliente",
     description="API para gestión de formularios de clientes con validaciones de negocio",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=ciclo_de_vida
 )
 
+# Lectura de lo propio escrito con réplicas (DB_REPLICAS): por dentro de todo, para marcar
+# al cliente solo con el estado real de la escritura
+if replicas.REPLICAS:
+    app.add_middleware(replicas.MiddlewareLecturaPrimario)
+
+# Idempotency-Key en /create y /bulk; se agrega antes que CORS para quedar por dentro
+# y que las respuestas repetidas también lleven las cabeceras de CORS
+if IDEMPOTENCIA_HABILITADA:
+    app.add_middleware(MiddlewareIdempotencia)
+
+# Límites de tasa y descarte de carga: por fuera de la idempotencia (un 429 no reserva
+# la clave) y por dentro de CORS
+if limites.LIMITES_HABILITADOS:
+    app.add_middleware(limites.MiddlewareLimites)
+
 # Configuración de CORS
 app.add_middleware(
     CORSMiddleware,
@@ -28,8 +77,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Link", "Idempotent-Replayed", "Retry-After", "X-Request-ID"],
 )
 
+# Compresión gzip/br/zstd; por dentro de las métricas para que la latencia incluya su costo
+if compresion.COMPRESION_HABILITADA:
+    app.add_middleware(compresion.MiddlewareCompresion)
+
+# Métricas de latencia por ruta; va después de CORS para medir también su costo
+if METRICAS_HABILITADAS:
+    app.add_middleware(MiddlewareMetricas)
+
+# ID de la petición (X-Request-ID) para los logs: por fuera de todo, para que cualquier
+# log de la petición lo lleve
+app.add_middleware(bitacora.MiddlewareIdPeticion)
+
 # Incluir los routers
 app.include_router(formulario_router)
 
@@ -40,9 +102,151 @@ async def health_check():
     return {
         "status": "healthy",
         "message": "API Formulario Cliente funcionando correctamente",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "pool": db_connection.estadisticas_pool(),
+        "pool_async": db_connection_async.estadisticas_pool() if db_connection_async else None,
+        "replicas": _estadisticas_replicas(),
+        "cache": formulario_cache.estadisticas(),
+        "coalescencia": formulario_service.estadisticas(),
+        "creacion_agrupada": formulario_service.creacion_agrupada.estadisticas(),
+        "arranque": medicion_arranque.estadisticas(),
+        "limites": limites.estadisticas(),
+        "compresion": compresion.estadisticas(),
+        "logs": bitacora.estadisticas()
     }
 
+def _estadisticas_replicas():
+    return replicas.estadisticas({
+        "sync": db_connection.estadisticas_replicas(),
+        "async": db_connection_async.estadisticas_replicas() if db_connection_async else None,
+    })
+
+
+def _series_pools():
+    for nombre, estadisticas in (
+        ("sync", db_connection.estadisticas_pool()),
+        ("async", db_connection_async.estadisticas_pool() if db_connection_async else None),
+    ):
+        if estadisticas is None:
+            continue
+        for estado in ("ocupadas", "libres", "esperando"):
+            yield (nombre, estado), estadisticas.get(estado, 0)
+    # Pools de las réplicas: "sync:host:puerto", "async:host:puerto"
+    for ruta, enrutador in _estadisticas_replicas().items():
+        if not isinstance(enrutador, dict):
+            continue
+        for replica in enrutador["replicas"]:
+            for estado in ("ocupadas", "libres", "esperando"):
+                yield (f"{ruta}:{replica['replica']}", estado), (replica["pool"] or {}).get(estado, 0)
+
+
+def _series_lecturas_replicas():
+    for ruta, enrutador in _estadisticas_replicas().items():
+        if not isinstance(enrutador, dict):
+            continue
+        yield (ruta, "primario"), enrutador["lecturas_primario"]
+        for replica in enrutador["replicas"]:
+            yield (ruta, replica["replica"]), replica["lecturas"]
+
+
+def _series_replicas(campo):
+    def series():
+        for ruta, enrutador in _estadisticas_replicas().items():
+            if not isinstance(enrutador, dict):
+                continue
+            for replica in enrutador["replicas"]:
+                yield (ruta, replica["replica"]), float(replica[campo] or 0)
+    return series
+
+
+def _series_cache():
+    estadisticas = formulario_cache.estadisticas()
+    for evento in ("aciertos", "aciertos_compartido", "aciertos_negativos", "fallos", "coalescidas",
+                   "desalojos", "expiraciones", "invalidaciones"):
+        yield (evento,), estadisticas[evento]
+
+
+def _series_coalescencia():
+    estadisticas = formulario_service.estadisticas()
+    for operacion in ("por_id", "listados"):
+        for resultado in ("ejecutadas", "coalescidas"):
+            yield (operacion, resultado), estadisticas[operacion][resultado]
+
+
+def _series_limites():
+    for (metodo, ruta), contador in list(limites.estadisticas_limites["rutas"].items()):
+        for resultado, cantidad in contador.items():
+            yield (ruta, metodo, resultado), cantidad
+
+
+def _series_concurrencia():
+    estadisticas = limites.estadisticas()["concurrencia_bd"] or {}
+    for estado in ("en_curso", "en_cola"):
+        yield (estado,), estadisticas.get(estado, 0)
+
+
+def _series_compresion():
+    for (codificacion, modo), contador in list(compresion.estadisticas_compresion["codificaciones"].items()):
+        for tipo in ("originales", "comprimidos"):
+            yield (codificacion, modo, tipo), contador[f"bytes_{tipo}"]
+
+
+def _series_compresion_omitidas():
+    for motivo, cantidad in list(compresion.estadisticas_compresion["omitidas"].items()):
+        yield (motivo,), cantidad
+
+
+registro.registrar(MedidorCalculado(
+    "proceso_logs_descartados_total", "Registros de log no escritos: cola llena o errores repetidos omitidos",
+    ("motivo",), lambda: [(("cola_llena",), bitacora.estadisticas_logs["descartados"]),
+                          (("muestreo",), bitacora.estadisticas_logs["omitidos"])], tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "http_compresion_bytes_total", "Bytes de las respuestas comprimidas antes y después de comprimir",
+    ("codificacion", "modo", "tipo"), _series_compresion, tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "http_compresion_omitidas_total", "Respuestas comprimibles enviadas sin comprimir por motivo", ("motivo",),
+    _series_compresion_omitidas, tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "http_limites_total", "Peticiones permitidas, limitadas (429) y descartadas por saturación (503)",
+    ("ruta", "metodo", "resultado"), _series_limites, tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "http_concurrencia_bd", "Peticiones a rutas con base de datos en curso y en cola", ("estado",),
+    _series_concurrencia))
+registro.registrar(MedidorCalculado(
+    "db_espera_conexion_reciente_segundos", "Promedio reciente de la espera por una conexión del pool", (),
+    lambda: [((), ESPERA_CONEXION_RECIENTE.valor)]))
+registro.registrar(MedidorCalculado(
+    "proceso_arranque_segundos", "Duración del arranque del worker por fase", ("fase",),
+    lambda: (((fase,), segundos) for fase, segundos in medicion_arranque.fases.items())))
+registro.registrar(MedidorCalculado(
+    "db_pool_conexiones", "Conexiones del pool por estado", ("pool", "estado"), _series_pools))
+registro.registrar(MedidorCalculado(
+    "db_lecturas_total", "Lecturas de los repositorios por nodo (réplica o primario)", ("ruta", "nodo"),
+    _series_lecturas_replicas, tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "db_replica_disponible", "1 si la réplica está en la rotación, 0 si está expulsada", ("ruta", "replica"),
+    _series_replicas("disponible")))
+registro.registrar(MedidorCalculado(
+    "db_replica_expulsiones_total", "Veces que la réplica salió de la rotación", ("ruta", "replica"),
+    _series_replicas("expulsiones"), tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "db_replica_retraso_segundos", "Último retraso de replicación medido", ("ruta", "replica"),
+    _series_replicas("retraso_s")))
+registro.registrar(MedidorCalculado(
+    "formulario_cache_eventos_total", "Eventos del caché de lectura", ("evento",), _series_cache, tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "formulario_idempotencia_total", "Peticiones con Idempotency-Key por resultado", ("resultado",),
+    lambda: (((resultado,), cantidad) for resultado, cantidad in resultados_idempotencia.items()), tipo="counter"))
+registro.registrar(MedidorCalculado(
+    "formulario_lecturas_total", "Lecturas por ID y listados: consultas ejecutadas y peticiones que esperaron "
+    "una consulta idéntica en curso", ("operacion", "resultado"), _series_coalescencia, tipo="counter"))
+
+# Métricas en formato de texto de Prometheus
+if METRICAS_HABILITADAS:
+    @app.get("/metrics", tags=["Health Check"], include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registro.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Endpoint raíz
 @app.get("/", tags=["Root"])
 async def root():
@@ -56,7 +260,7 @@ async def root():
 # Manejador global de excepciones
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    logger.error(f"Error no manejado: {exc}")
+    logger.error("Error no manejado: %s", exc)
     return JSONResponse(
         status_code=500,
         content={
@@ -73,9 +277,12 @@ async def http_exception_handler(request, exc):
         content={
             "message": [str(exc.detail)],
             "data": []
-        }
+        },
+        headers=exc.headers
     )
 
+medicion_arranque.marcar("importacion", time.perf_counter() - INICIO_IMPORTACION)
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
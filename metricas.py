@@ -0,0 +1,348 @@
+"""
+Métricas de la API en formato de texto de Prometheus (GET /metrics), sin dependencias.
+
+- `MiddlewareMetricas` (ASGI puro): latencia por ruta, método y estado, y
+  peticiones en curso.
+- `medido(...)`: decorador para métodos del servicio y de los repositorios.
+  En los repositorios además fija la operación actual (`operacion_actual`),
+  que usan las conexiones y cursores para etiquetar la espera por una conexión
+  del pool, el tiempo de cada consulta y las filas devueltas.
+- Medidores calculados al exportar (pools y caché), sin costo por petición.
+
+Registrar una observación es una búsqueda binaria y tres sumas bajo un lock;
+con METRICAS_HABILITADAS=false los decoradores devuelven la función original.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+import inspect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICAS_HABILITADAS = os.getenv("METRICAS_HABILITADAS", "true").lower() == "true"
+
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_FILAS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+BUCKETS_LOTE = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Operación de repositorio en curso; etiqueta las métricas de conexión y consulta
+operacion_actual: ContextVar[str] = ContextVar("operacion_actual", default="otra")
+
+
+def _formatear_etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """Histograma con buckets fijos por combinación de etiquetas"""
+
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 buckets: Sequence[float] = BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # etiquetas -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, etiquetas: Tuple[str, ...] = ()):
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def conteo_total(self) -> int:
+        """Observaciones acumuladas en todas las series"""
+        with self._lock:
+            return sum(serie[2] for serie in self._series.values())
+
+    def exportar(self) -> Iterable[str]:
+        with self._lock:
+            series = [(etiquetas, list(conteos), suma, total) for etiquetas, (conteos, suma, total) in self._series.items()]
+        for etiquetas, conteos, suma, total in sorted(series):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                le = f'le="{_numero(limite)}"'
+                yield f"{self.nombre}_bucket{_formatear_etiquetas(self.etiquetas, etiquetas, le)} {acumulado}"
+            yield f"{self.nombre}_sum{_formatear_etiquetas(self.etiquetas, etiquetas)} {_numero(suma)}"
+            yield f"{self.nombre}_count{_formatear_etiquetas(self.etiquetas, etiquetas)} {total}"
+
+
+class Medidor:
+    """Valor que sube y baja (p. ej. peticiones en curso)"""
+
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def sumar(self, cantidad: int = 1):
+        with self._lock:
+            self.valor += cantidad
+
+    def exportar(self) -> Iterable[str]:
+        yield f"{self.nombre} {self.valor}"
+
+
+class MedidorCalculado:
+    """Medidor cuyo valor se calcula al exportar; `funcion` devuelve [(valores de etiquetas, valor)]"""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str], funcion: Callable[[], Iterable],
+                 tipo: str = "gauge"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def exportar(self) -> Iterable[str]:
+        try:
+            series = list(self.funcion())
+        except Exception as e:
+            logger.error("Error calculando la métrica %s: %s", self.nombre, e)
+            return
+        for etiquetas, valor in series:
+            yield f"{self.nombre}{_formatear_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}"
+
+
+class PromedioReciente:
+    """Promedio móvil exponencial que además decae a la mitad cada `vida_media` segundos
+    sin observaciones, para que un pico pasado no quede fijo si dejan de llegar datos"""
+
+    def __init__(self, peso: float = 0.2, vida_media: float = 5.0):
+        self.peso = peso
+        self.vida_media = vida_media
+        self._valor = 0.0
+        self._instante = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decaido(self, ahora: float) -> float:
+        return self._valor * 0.5 ** ((ahora - self._instante) / self.vida_media)
+
+    def observar(self, valor: float):
+        ahora = time.monotonic()
+        with self._lock:
+            self._valor = self._decaido(ahora) * (1 - self.peso) + valor * self.peso
+            self._instante = ahora
+
+    @property
+    def valor(self) -> float:
+        with self._lock:
+            return self._decaido(time.monotonic())
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self) -> str:
+        lineas = []
+        for metrica in self._metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.exportar())
+        return "\n".join(lineas) + "\n"
+
+
+registro = RegistroMetricas()
+
+PETICIONES_SEGUNDOS = registro.registrar(Histograma(
+    "http_peticiones_segundos", "Latencia de las peticiones HTTP", ("ruta", "metodo", "estado")))
+PETICIONES_EN_CURSO = registro.registrar(Medidor(
+    "http_peticiones_en_curso", "Peticiones HTTP en curso"))
+SERVICIO_SEGUNDOS = registro.registrar(Histograma(
+    "formulario_servicio_segundos", "Duración de los métodos de FormularioClienteService", ("metodo",)))
+REPOSITORIO_SEGUNDOS = registro.registrar(Histograma(
+    "formulario_repositorio_segundos", "Duración de los métodos del repositorio", ("metodo",)))
+ESPERA_CONEXION_SEGUNDOS = registro.registrar(Histograma(
+    "db_espera_conexion_segundos", "Tiempo para obtener una conexión del pool", ("operacion",)))
+CONSULTA_SEGUNDOS = registro.registrar(Histograma(
+    "db_consulta_segundos", "Tiempo de cada sentencia SQL (incluye la verificación de conexiones del pool)",
+    ("operacion",)))
+FILAS_DEVUELTAS = registro.registrar(Histograma(
+    "db_filas_devueltas", "Filas devueltas o afectadas por cada sentencia SQL", ("operacion",), BUCKETS_FILAS))
+SERIALIZACION_SEGUNDOS = registro.registrar(Histograma(
+    "formulario_serializacion_segundos", "Tiempo de serialización JSON de las respuestas"))
+COMPRESION_SEGUNDOS = registro.registrar(Histograma(
+    "http_compresion_segundos", "Tiempo de CPU comprimiendo cada respuesta (completa o en streaming)",
+    ("codificacion",)))
+LOTE_POR_ID_TAMANO = registro.registrar(Histograma(
+    "formulario_lote_por_id_tamano", "IDs distintos por consulta agrupada de GET /formulario/{id}", (),
+    BUCKETS_LOTE))
+CREACION_AGRUPADA_TAMANO = registro.registrar(Histograma(
+    "formulario_creacion_agrupada_tamano", "Filas por INSERT y COMMIT de las creaciones agrupadas de POST /formulario/create",
+    (), BUCKETS_LOTE))
+# Espera reciente por una conexión del pool; la usa el descarte de carga (limites.py)
+# y se actualiza aunque las métricas estén deshabilitadas
+ESPERA_CONEXION_RECIENTE = PromedioReciente()
+
+
+def medido(histograma: Histograma, etiqueta: str = None, fijar_operacion: bool = False):
+    """Registra la duración de la función en `histograma` con la etiqueta `etiqueta` (o su nombre).
+
+    Con `fijar_operacion=True` la operación queda en `operacion_actual` mientras
+    se ejecuta, para etiquetar las métricas de conexión y consulta.
+    """
+    def decorador(funcion):
+        if not METRICAS_HABILITADAS:
+            return funcion
+        etiquetas = (etiqueta or funcion.__name__,)
+
+        if inspect.isasyncgenfunction(funcion):
+            @wraps(funcion)
+            async def envoltura_generador_async(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    async for elemento in funcion(*args, **kwargs):
+                        yield elemento
+                finally:
+                    histograma.observar(time.perf_counter() - inicio, etiquetas)
+            return envoltura_generador_async
+
+        if inspect.isgeneratorfunction(funcion):
+            @wraps(funcion)
+            def envoltura_generador(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    yield from funcion(*args, **kwargs)
+                finally:
+                    histograma.observar(time.perf_counter() - inicio, etiquetas)
+            return envoltura_generador
+
+        if inspect.iscoroutinefunction(funcion):
+            @wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                marca = operacion_actual.set(etiquetas[0]) if fijar_operacion else None
+                inicio = time.perf_counter()
+                try:
+                    return await funcion(*args, **kwargs)
+                finally:
+                    histograma.observar(time.perf_counter() - inicio, etiquetas)
+                    if marca is not None:
+                        operacion_actual.reset(marca)
+            return envoltura_async
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            marca = operacion_actual.set(etiquetas[0]) if fijar_operacion else None
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                histograma.observar(time.perf_counter() - inicio, etiquetas)
+                if marca is not None:
+                    operacion_actual.reset(marca)
+        return envoltura
+
+    return decorador
+
+
+def medido_repositorio(funcion):
+    return medido(REPOSITORIO_SEGUNDOS, fijar_operacion=True)(funcion)
+
+
+def medido_servicio(funcion):
+    return medido(SERVICIO_SEGUNDOS)(funcion)
+
+
+def observar_consulta(segundos: float):
+    if METRICAS_HABILITADAS:
+        CONSULTA_SEGUNDOS.observar(segundos, (operacion_actual.get(),))
+
+
+def observar_filas(cantidad: int):
+    if METRICAS_HABILITADAS:
+        FILAS_DEVUELTAS.observar(cantidad, (operacion_actual.get(),))
+
+
+def observar_espera_conexion(segundos: float):
+    ESPERA_CONEXION_RECIENTE.observar(segundos)
+    if METRICAS_HABILITADAS:
+        ESPERA_CONEXION_SEGUNDOS.observar(segundos, (operacion_actual.get(),))
+
+
+def observar_lote_por_id(cantidad: int):
+    if METRICAS_HABILITADAS:
+        LOTE_POR_ID_TAMANO.observar(cantidad)
+
+
+def observar_creacion_agrupada(cantidad: int):
+    if METRICAS_HABILITADAS:
+        CREACION_AGRUPADA_TAMANO.observar(cantidad)
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: latencia por plantilla de ruta (no por URL, para acotar las series)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._rutas = {}  # endpoint -> plantilla de la ruta
+
+    def _ruta(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "sin_ruta"
+        ruta = self._rutas.get(endpoint)
+        if ruta is None:
+            ruta = "sin_ruta"
+            for candidata in scope["app"].routes:
+                if getattr(candidata, "endpoint", None) is endpoint:
+                    ruta = candidata.path
+                    break
+            self._rutas[endpoint] = ruta
+        return ruta
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estado = 500
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        PETICIONES_EN_CURSO.sumar(1)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            PETICIONES_EN_CURSO.sumar(-1)
+            PETICIONES_SEGUNDOS.observar(
+                time.perf_counter() - inicio, (self._ruta(scope), scope["method"], str(estado))
+            )
@@ -0,0 +1,20 @@
+-- Migración: tabla formulario_cliente (esquema inicial)
+-- Reemplaza al antiguo "-- Script para crear la tabla formulario.txt", sin el DROP TABLE.
+-- Es idempotente: sobre una base creada con aquel script no cambia nada.
+-- El trigger update_formulario_cliente_updated_at de aquel script se elimina en 0005.
+
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+CREATE TABLE IF NOT EXISTS formulario_cliente (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    nombre_completo VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    telefono BIGINT NOT NULL CHECK (telefono > 0 AND telefono <= 9223372036854775807),
+    mensaje VARCHAR(2000) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Índices iniciales; 0006 los reemplaza por los de las consultas actuales
+CREATE INDEX IF NOT EXISTS idx_formulario_cliente_email ON formulario_cliente(email);
+CREATE INDEX IF NOT EXISTS idx_formulario_cliente_created_at ON formulario_cliente(created_at);
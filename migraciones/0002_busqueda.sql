@@ -0,0 +1,28 @@
+-- Migración: búsqueda en formulario_cliente (GET /formulario/search)
+-- Se ejecuta sobre la tabla de 0001_formulario_cliente.sql.
+-- Es idempotente: puede ejecutarse más de una vez.
+
+-- Texto completo de nombre_completo (peso A) y mensaje (peso B).
+-- La configuración 'spanish' debe coincidir con CONFIG_BUSQUEDA en consultas.py.
+ALTER TABLE formulario_cliente
+    ADD COLUMN IF NOT EXISTS busqueda tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(nombre_completo, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(mensaje, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_formulario_cliente_busqueda
+    ON formulario_cliente USING GIN (busqueda);
+
+-- Prefijo de email: rango de bytes (COLLATE "C"), válido con cualquier collation de la base
+CREATE INDEX IF NOT EXISTS idx_formulario_cliente_email_prefijo
+    ON formulario_cliente ((email COLLATE "C"));
+
+CREATE INDEX IF NOT EXISTS idx_formulario_cliente_telefono
+    ON formulario_cliente (telefono);
+
+-- Orden de la paginación por keyset (created_at DESC, id DESC) sin paso de ordenamiento
+CREATE INDEX IF NOT EXISTS idx_formulario_cliente_created_at_id
+    ON formulario_cliente (created_at, id);
+
+ANALYZE formulario_cliente;
@@ -0,0 +1,39 @@
+-- Migración: registro de cambios de formulario_cliente (GET /formulario/changes y /formulario/sync)
+-- Los repositorios escriben aquí en la misma sentencia que cada INSERT, UPDATE y DELETE
+-- (consultas.registrar_cambios). Con CAMBIOS_HABILITADOS=false no se usa.
+-- Es idempotente: puede ejecutarse más de una vez.
+
+CREATE TABLE IF NOT EXISTS formulario_cambios (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    -- Transacción que hizo el cambio: el feed se ordena por (txid, id)
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    formulario_id UUID NOT NULL,
+    operacion VARCHAR(10) NOT NULL CHECK (operacion IN ('crear', 'actualizar', 'eliminar')),
+    creado_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_formulario_cambios_txid_id
+    ON formulario_cambios (txid, id);
+
+-- Para la purga por antigüedad:
+--   DELETE FROM formulario_cambios WHERE creado_en < now() - interval '7 days';
+CREATE INDEX IF NOT EXISTS idx_formulario_cambios_creado_en
+    ON formulario_cambios (creado_en);
+
+-- Un aviso por sentencia (sin contenido) despierta a los streams SSE al confirmar;
+-- los datos se leen siempre de la tabla
+CREATE OR REPLACE FUNCTION notificar_formulario_cambios()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM nuevas) THEN
+        PERFORM pg_notify('formulario_cambios', '');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS formulario_cambios_notificar ON formulario_cambios;
+CREATE TRIGGER formulario_cambios_notificar
+    AFTER INSERT ON formulario_cambios
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_formulario_cambios();
@@ -0,0 +1,20 @@
+-- Migración: claves de idempotencia de POST /formulario/create y /formulario/bulk
+-- (idempotencia.py, IDEMPOTENCIA_ALMACEN=postgres). Cada fila guarda la respuesta de
+-- la primera petición con esa clave; mientras se procesa, `codigo` es NULL y
+-- `expira_en` es el plazo de la reserva.
+-- Es idempotente: puede ejecutarse más de una vez.
+
+CREATE TABLE IF NOT EXISTS formulario_idempotencia (
+    -- "<método> <ruta> <Idempotency-Key>"
+    clave TEXT PRIMARY KEY,
+    -- SHA-256 de la query y el cuerpo: la misma clave con otra petición es un error
+    huella BYTEA NOT NULL,
+    codigo SMALLINT,
+    cabeceras BYTEA,
+    cuerpo BYTEA,
+    expira_en TIMESTAMPTZ NOT NULL
+);
+
+-- Para la purga de claves vencidas (IDEMPOTENCIA_PURGA_INTERVALO)
+CREATE INDEX IF NOT EXISTS idx_formulario_idempotencia_expira_en
+    ON formulario_idempotencia (expira_en);
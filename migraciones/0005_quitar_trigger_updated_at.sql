@@ -0,0 +1,8 @@
+-- Migración: quitar el trigger que fijaba updated_at en cada UPDATE
+-- Los repositorios ya envían updated_at en cada UPDATE (consultas.construir_actualizacion)
+-- y ese valor es la versión del ETag; el trigger lo pisaba con CURRENT_TIMESTAMP (el
+-- inicio de la transacción) y agregaba una llamada a PL/pgSQL por fila modificada.
+-- Es idempotente: puede ejecutarse más de una vez.
+
+DROP TRIGGER IF EXISTS update_formulario_cliente_updated_at ON formulario_cliente;
+DROP FUNCTION IF EXISTS update_updated_at_column();
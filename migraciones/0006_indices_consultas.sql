@@ -0,0 +1,28 @@
+-- migrar: sin-transaccion
+-- Migración: índices de formulario_cliente según las consultas de consultas.py
+-- Cada índice cubre el filtro y el orden (created_at DESC, id DESC) de la consulta que
+-- lo usa, así la página sale del índice sin paso de ordenamiento; los que quedan
+-- cubiertos por otros se eliminan para que cada INSERT mantenga menos índices
+-- (de 7 a 5 contando la clave primaria y el GIN de búsqueda).
+--
+-- Va fuera de una transacción: CONCURRENTLY no bloquea las escrituras mientras se
+-- construye cada índice, que en tablas grandes lleva minutos. Si se interrumpe, migrar.py
+-- informa los índices inválidos que quedaron; se eliminan con DROP INDEX CONCURRENTLY y
+-- se vuelve a ejecutar. Es idempotente.
+
+-- email exacto (COLLATE "C" da la misma igualdad que la collation por defecto) y prefijo
+-- de email por rango de bytes; reemplaza a idx_formulario_cliente_email y _email_prefijo
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_formulario_cliente_email_c_created_at_id
+    ON formulario_cliente ((email COLLATE "C"), created_at, id);
+
+-- teléfono exacto ordenado por fecha; reemplaza a idx_formulario_cliente_telefono
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_formulario_cliente_telefono_created_at_id
+    ON formulario_cliente (telefono, created_at, id);
+
+-- /all, el stream, los rangos de fecha y el keyset usan idx_formulario_cliente_created_at_id
+DROP INDEX CONCURRENTLY IF EXISTS idx_formulario_cliente_email;
+DROP INDEX CONCURRENTLY IF EXISTS idx_formulario_cliente_email_prefijo;
+DROP INDEX CONCURRENTLY IF EXISTS idx_formulario_cliente_telefono;
+DROP INDEX CONCURRENTLY IF EXISTS idx_formulario_cliente_created_at;
+
+ANALYZE formulario_cliente;
@@ -0,0 +1,35 @@
+-- Migración: mantenimiento del particionado opcional de formulario_cliente
+-- El particionado por rango mensual de created_at se activa con
+-- `python migrar.py particionar`, que convierte la tabla (la tabla actual pasa a ser la
+-- partición formulario_cliente_historico). Esta migración solo crea la función que
+-- agrega las particiones de los próximos meses; sin particionar no hace nada.
+-- Es idempotente: puede ejecutarse más de una vez.
+
+CREATE OR REPLACE FUNCTION formulario_cliente_crear_particiones(meses_adelante INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    inicio DATE;
+    nombre TEXT;
+    creadas INTEGER := 0;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'formulario_cliente'::regclass) <> 'p' THEN
+        RETURN 0;
+    END IF;
+    FOR i IN 0..meses_adelante LOOP
+        inicio := date_trunc('month', now()) + make_interval(months => i);
+        nombre := 'formulario_cliente_p' || to_char(inicio, 'YYYYMM');
+        CONTINUE WHEN to_regclass(nombre) IS NOT NULL;
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF formulario_cliente FOR VALUES FROM (%L) TO (%L)',
+                nombre, inicio, inicio + interval '1 month'
+            );
+            creadas := creadas + 1;
+        EXCEPTION WHEN invalid_object_definition THEN
+            -- El mes ya está cubierto (por la partición histórica): nada que crear
+            NULL;
+        END;
+    END LOOP;
+    RETURN creadas;
+END;
+$$ LANGUAGE plpgsql;
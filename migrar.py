@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Migraciones versionadas del esquema (carpeta migraciones/).
+
+Cada archivo `NNNN_nombre.sql` se aplica una vez, en orden, y queda anotado en
+la tabla `esquema_migraciones` con la suma SHA-256 de su contenido; si un
+archivo ya aplicado cambia, `upgrade` se detiene. Un candado consultivo evita
+que dos procesos (p. ej. varios contenedores al arrancar) migren a la vez.
+
+Cada migración corre en su propia transacción, salvo las que empiezan con
+`-- migrar: sin-transaccion` (CREATE INDEX CONCURRENTLY no puede ir en una):
+esas se ejecutan sentencia por sentencia y deben ser idempotentes para poder
+reintentarlas. Todas corren con `lock_timeout` (MIGRAR_LOCK_TIMEOUT) para que
+un ALTER que espera un candado no deje encoladas a las peticiones de la API.
+
+Uso:
+    python migrar.py estado                 # aplicadas y pendientes
+    python migrar.py upgrade [--hasta N]    # aplica las pendientes
+    python migrar.py particionar [--meses 3]   # convierte formulario_cliente en tabla particionada
+    python migrar.py particiones [--meses 3]   # crea las particiones de los próximos meses (cron)
+"""
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import os
+import re
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CARPETA_MIGRACIONES = Path(__file__).resolve().parent / "migraciones"
+PATRON_ARCHIVO = re.compile(r"^(\d{4})_(\w+)\.sql$")
+MARCA_SIN_TRANSACCION = "-- migrar: sin-transaccion"
+# Clave del candado consultivo (pg_advisory_lock) compartida por todos los procesos que migran
+CANDADO_MIGRACIONES = 7301
+MIGRAR_LOCK_TIMEOUT = os.getenv("MIGRAR_LOCK_TIMEOUT", "10s")
+
+SQL_TABLA_MIGRACIONES = """
+    CREATE TABLE IF NOT EXISTS esquema_migraciones (
+        version INTEGER PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        suma_sha256 TEXT NOT NULL,
+        aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now(),
+        duracion_ms INTEGER NOT NULL
+    )
+"""
+
+SQL_INDICES_INVALIDOS = """
+    SELECT i.indexrelid::regclass::text AS indice
+    FROM pg_index i
+    JOIN pg_class t ON t.oid = i.indrelid
+    WHERE NOT i.indisvalid AND t.relname LIKE 'formulario%'
+"""
+
+
+class ErrorMigracion(Exception):
+    """La base no está en un estado en el que se pueda migrar"""
+
+
+@dataclass
+class Migracion:
+    version: int
+    nombre: str
+    ruta: Path
+    sql: str
+
+    @property
+    def suma(self) -> str:
+        return sha256(self.sql.encode("utf-8")).hexdigest()
+
+    @property
+    def transaccional(self) -> bool:
+        return not self.sql.lstrip().startswith(MARCA_SIN_TRANSACCION)
+
+    def __str__(self):
+        return f"{self.version:04d}_{self.nombre}"
+
+
+def cargar_migraciones(carpeta: Path = CARPETA_MIGRACIONES) -> List[Migracion]:
+    migraciones = {}
+    for ruta in sorted(carpeta.glob("*.sql")):
+        coincidencia = PATRON_ARCHIVO.match(ruta.name)
+        if coincidencia is None:
+            raise ErrorMigracion(f"Nombre de migración inválido: {ruta.name} (use NNNN_nombre.sql)")
+        version = int(coincidencia.group(1))
+        if version in migraciones:
+            raise ErrorMigracion(f"Versión repetida {version:04d}: {migraciones[version].ruta.name} y {ruta.name}")
+        migraciones[version] = Migracion(version, coincidencia.group(2), ruta, ruta.read_text(encoding="utf-8"))
+    return [migraciones[version] for version in sorted(migraciones)]
+
+
+def dividir_sentencias(sql: str) -> List[str]:
+    """Separa un script en sentencias por `;`, respetando comentarios, literales y $etiqueta$"""
+    sentencias = []
+    actual = []
+    i, n = 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith("--", i):
+            fin = sql.find("\n", i)
+            i = n if fin == -1 else fin + 1
+            continue
+        if sql.startswith("/*", i):
+            fin = sql.find("*/", i + 2)
+            i = n if fin == -1 else fin + 2
+            continue
+        if c in ("'", '"'):
+            fin = i + 1
+            while fin < n:
+                if sql[fin] == c:
+                    if fin + 1 < n and sql[fin + 1] == c:  # comilla escapada duplicándola
+                        fin += 2
+                        continue
+                    break
+                fin += 1
+            actual.append(sql[i:fin + 1])
+            i = fin + 1
+            continue
+        if c == "$":
+            etiqueta = re.match(r"\$[A-Za-z_]*\$", sql[i:])
+            if etiqueta:
+                cierre = sql.find(etiqueta.group(0), i + len(etiqueta.group(0)))
+                fin = n if cierre == -1 else cierre + len(etiqueta.group(0))
+                actual.append(sql[i:fin])
+                i = fin
+                continue
+        if c == ";":
+            sentencia = "".join(actual).strip()
+            if sentencia:
+                sentencias.append(sentencia)
+            actual = []
+        else:
+            actual.append(c)
+        i += 1
+    sentencia = "".join(actual).strip()
+    if sentencia:
+        sentencias.append(sentencia)
+    return sentencias
+
+
+def conectar():
+    conexion = psycopg2.connect(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        database=os.getenv("DB_NAME", "LocalBaseDatosJava"),
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", "123456"),
+        application_name="migrar",
+    )
+    conexion.autocommit = True
+    with conexion.cursor() as cursor:
+        cursor.execute("SET lock_timeout = %s", (MIGRAR_LOCK_TIMEOUT,))
+    return conexion
+
+
+def aplicadas(cursor) -> Dict[int, str]:
+    cursor.execute(SQL_TABLA_MIGRACIONES)
+    cursor.execute("SELECT version, suma_sha256 FROM esquema_migraciones ORDER BY version")
+    return dict(cursor.fetchall())
+
+
+def verificar_sumas(migraciones: List[Migracion], registradas: Dict[int, str]):
+    conocidas = {migracion.version: migracion for migracion in migraciones}
+    for version, suma in registradas.items():
+        migracion = conocidas.get(version)
+        if migracion is None:
+            raise ErrorMigracion(f"La versión {version:04d} está aplicada pero su archivo no existe")
+        if migracion.suma != suma:
+            raise ErrorMigracion(
+                f"{migracion.ruta.name} cambió después de aplicarse; agregue una migración nueva en lugar de editarla"
+            )
+
+
+def verificar_indices(cursor):
+    cursor.execute(SQL_INDICES_INVALIDOS)
+    invalidos = [fila[0] for fila in cursor.fetchall()]
+    if invalidos:
+        raise ErrorMigracion(
+            f"Índices inválidos de un CREATE INDEX CONCURRENTLY interrumpido: {', '.join(invalidos)}. "
+            "Elimínelos con DROP INDEX CONCURRENTLY y vuelva a ejecutar upgrade"
+        )
+
+
+def aplicar(cursor, migracion: Migracion):
+    inicio = time.perf_counter()
+    if migracion.transaccional:
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(migracion.sql)
+            registrar(cursor, migracion, inicio)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    else:
+        for sentencia in dividir_sentencias(migracion.sql):
+            cursor.execute(sentencia)
+        verificar_indices(cursor)
+        registrar(cursor, migracion, inicio)
+    print(f"  ✅ {migracion} ({time.perf_counter() - inicio:.2f} s)")
+
+
+def registrar(cursor, migracion: Migracion, inicio: float):
+    cursor.execute(
+        "INSERT INTO esquema_migraciones (version, nombre, suma_sha256, duracion_ms) VALUES (%s, %s, %s, %s)",
+        (migracion.version, migracion.nombre, migracion.suma, round((time.perf_counter() - inicio) * 1000)),
+    )
+
+
+def upgrade(hasta: int = None):
+    migraciones = cargar_migraciones()
+    with closing(conectar()) as conexion, conexion.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (CANDADO_MIGRACIONES,))
+        try:
+            registradas = aplicadas(cursor)
+            verificar_sumas(migraciones, registradas)
+            pendientes = [
+                m for m in migraciones if m.version not in registradas and (hasta is None or m.version <= hasta)
+            ]
+            if not pendientes:
+                print("El esquema está al día")
+                return
+            print(f"Aplicando {len(pendientes)} migraciones:")
+            for migracion in pendientes:
+                aplicar(cursor, migracion)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (CANDADO_MIGRACIONES,))
+
+
+def estado():
+    migraciones = cargar_migraciones()
+    with closing(conectar()) as conexion, conexion.cursor() as cursor:
+        registradas = aplicadas(cursor)
+        cursor.execute("SELECT version, aplicada_en, duracion_ms FROM esquema_migraciones")
+        detalle = {version: (aplicada_en, duracion) for version, aplicada_en, duracion in cursor.fetchall()}
+        for migracion in migraciones:
+            if migracion.version not in registradas:
+                print(f"  ⏳ {migracion}  pendiente")
+                continue
+            aplicada_en, duracion = detalle[migracion.version]
+            cambio = "  ⚠️ el archivo cambió" if registradas[migracion.version] != migracion.suma else ""
+            print(f"  ✅ {migracion}  {aplicada_en:%Y-%m-%d %H:%M} ({duracion} ms){cambio}")
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('formulario_cliente')")
+        fila = cursor.fetchone()
+        print(f"formulario_cliente: {'particionada' if fila and fila[0] == 'p' else 'sin particionar'}")
+
+
+# Índices de la tabla particionada: los mismos que dejan las migraciones sobre la tabla
+# simple, con (id, created_at) como clave primaria porque debe incluir la clave de partición
+INDICES_PARTICIONADA = (
+    'ALTER TABLE formulario_cliente ADD CONSTRAINT formulario_cliente_pkey PRIMARY KEY (id, created_at)',
+    "CREATE INDEX idx_formulario_cliente_created_at_id ON formulario_cliente (created_at, id)",
+    "CREATE INDEX idx_formulario_cliente_busqueda ON formulario_cliente USING GIN (busqueda)",
+    'CREATE INDEX idx_formulario_cliente_email_c_created_at_id '
+    'ON formulario_cliente ((email COLLATE "C"), created_at, id)',
+    "CREATE INDEX idx_formulario_cliente_telefono_created_at_id ON formulario_cliente (telefono, created_at, id)",
+)
+
+
+def particionar(meses: int):
+    """Convierte formulario_cliente en una tabla particionada por mes de created_at.
+
+    La tabla actual pasa a ser la partición formulario_cliente_historico, con
+    las filas anteriores al mes siguiente; no se copian datos. Los pasos
+    largos (índice único de la nueva clave y validación del rango) no bloquean
+    las escrituras; el cambio final es solo de catálogo, bajo un candado
+    exclusivo breve.
+    """
+    migraciones = cargar_migraciones()
+    with closing(conectar()) as conexion, conexion.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (CANDADO_MIGRACIONES,))
+        try:
+            registradas = aplicadas(cursor)
+            verificar_sumas(migraciones, registradas)
+            if any(m.version not in registradas for m in migraciones):
+                raise ErrorMigracion("Hay migraciones pendientes: ejecute `python migrar.py upgrade` antes")
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'formulario_cliente'::regclass")
+            if cursor.fetchone()[0] == "p":
+                print("formulario_cliente ya está particionada")
+                return
+
+            cursor.execute("SELECT (date_trunc('month', now()) + interval '1 month')::timestamp")
+            corte: datetime = cursor.fetchone()[0]
+            print(f"Particionando formulario_cliente: historico hasta {corte:%Y-%m-%d}, luego por mes")
+
+            print("  1/4 created_at nulos")
+            cursor.execute(
+                "UPDATE formulario_cliente SET created_at = coalesce(updated_at, now()) WHERE created_at IS NULL"
+            )
+
+            print("  2/4 índice único (id, created_at) (CONCURRENTLY)")
+            cursor.execute(
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_formulario_cliente_id_created_at "
+                "ON formulario_cliente (id, created_at)"
+            )
+            verificar_indices(cursor)
+
+            # Con el CHECK validado, SET NOT NULL y ATTACH PARTITION no recorren la tabla
+            print("  3/4 validación del rango de la partición histórica")
+            cursor.execute("""
+                SELECT 1 FROM pg_constraint
+                WHERE conrelid = 'formulario_cliente'::regclass AND conname = 'formulario_cliente_historico_rango'
+            """)
+            if cursor.fetchone() is None:
+                cursor.execute(
+                    "ALTER TABLE formulario_cliente ADD CONSTRAINT formulario_cliente_historico_rango "
+                    "CHECK (created_at IS NOT NULL AND created_at < %s) NOT VALID",
+                    (corte,),
+                )
+            cursor.execute("ALTER TABLE formulario_cliente VALIDATE CONSTRAINT formulario_cliente_historico_rango")
+
+            print("  4/4 cambio a tabla particionada")
+            cursor.execute("BEGIN")
+            try:
+                cursor.execute("LOCK TABLE formulario_cliente IN ACCESS EXCLUSIVE MODE")
+                cursor.execute("ALTER TABLE formulario_cliente RENAME TO formulario_cliente_historico")
+                # Los nombres de índices y restricciones son los que usará la tabla nueva
+                cursor.execute("""
+                    SELECT indexrelid::regclass::text FROM pg_index
+                    WHERE indrelid = 'formulario_cliente_historico'::regclass
+                """)
+                for (indice,) in cursor.fetchall():
+                    cursor.execute(f'ALTER INDEX "{indice}" RENAME TO '
+                                   f'"{indice.replace("formulario_cliente", "formulario_cliente_historico", 1)}"')
+                cursor.execute("ALTER TABLE formulario_cliente_historico ALTER COLUMN created_at SET NOT NULL")
+                cursor.execute("""
+                    CREATE TABLE formulario_cliente (
+                        LIKE formulario_cliente_historico INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS
+                    ) PARTITION BY RANGE (created_at)
+                """)
+                cursor.execute("ALTER TABLE formulario_cliente DROP CONSTRAINT formulario_cliente_historico_rango")
+                for sentencia in INDICES_PARTICIONADA:
+                    cursor.execute(sentencia)
+                # La clave primaria anterior (solo id) pasa a ser el índice único (id, created_at), ya construido
+                cursor.execute("ALTER TABLE formulario_cliente_historico DROP CONSTRAINT formulario_cliente_historico_pkey")
+                cursor.execute(
+                    "ALTER TABLE formulario_cliente_historico ADD CONSTRAINT formulario_cliente_historico_pkey "
+                    "PRIMARY KEY USING INDEX idx_formulario_cliente_historico_id_created_at"
+                )
+                # Los índices de la histórica equivalentes a los de la tabla nueva se adjuntan sin reconstruirse
+                cursor.execute(
+                    "ALTER TABLE formulario_cliente ATTACH PARTITION formulario_cliente_historico "
+                    "FOR VALUES FROM (MINVALUE) TO (%s)",
+                    (corte,),
+                )
+                cursor.execute("CREATE TABLE formulario_cliente_pdefecto PARTITION OF formulario_cliente DEFAULT")
+                cursor.execute("SELECT formulario_cliente_crear_particiones(%s)", (meses,))
+                creadas = cursor.fetchone()[0]
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("ANALYZE formulario_cliente")
+            print(f"  ✅ formulario_cliente particionada ({creadas} particiones mensuales nuevas)")
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (CANDADO_MIGRACIONES,))
+
+
+def crear_particiones(meses: int):
+    with closing(conectar()) as conexion, conexion.cursor() as cursor:
+        cursor.execute("SELECT formulario_cliente_crear_particiones(%s)", (meses,))
+        print(f"Particiones nuevas: {cursor.fetchone()[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    comandos.add_parser("estado", help="migraciones aplicadas y pendientes")
+    comando_upgrade = comandos.add_parser("upgrade", help="aplica las migraciones pendientes")
+    comando_upgrade.add_argument("--hasta", type=int, help="aplicar hasta esta versión (inclusive)")
+    for nombre, ayuda in (("particionar", "convierte formulario_cliente en tabla particionada por mes"),
+                          ("particiones", "crea las particiones de los próximos meses")):
+        comando = comandos.add_parser(nombre, help=ayuda)
+        comando.add_argument("--meses", type=int, default=3, help="meses a crear por adelantado")
+    args = parser.parse_args()
+
+    try:
+        if args.comando == "estado":
+            estado()
+        elif args.comando == "upgrade":
+            upgrade(args.hasta)
+        elif args.comando == "particionar":
+            particionar(args.meses)
+        else:
+            crear_particiones(args.meses)
+    except (ErrorMigracion, psycopg2.Error) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,22 @@
-from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Any, Optional, List
+from dataclasses import dataclass
 from datetime import datetime
-import re
+from validaciones import NombreCompleto, Email, Telefono, Mensaje
 
 
 class FormularioClienteCreate(BaseModel):
-    nombre_completo: str = Field(..., min_length=2, max_length=255, description="Nombre completo del cliente")
-    email: EmailStr = Field(..., description="Email válido del cliente")
-    telefono: int = Field(..., description="Número de teléfono")
-    mensaje: str = Field(..., min_length=1, max_length=500, description="Mensaje del cliente")
-
-    @validator('nombre_completo')
-    def validate_nombre_completo(cls, v):
-        if not re.match(r'^[a-zA-ZáéíóúüñÁÉÍÓÚÜÑ\s\-\'\.]+$', v.strip()):
-            raise ValueError('El nombre solo puede contener letras, espacios, guiones y apóstrofes')
-
-        palabras = v.strip().split()
-        if len(palabras) < 2:
-            raise ValueError('Debe ingresar nombre y apellido')
-
-        return v.strip().title()
-
-    @validator('telefono')
-    def validate_telefono(cls, v):
-        telefono_str = str(v)
-        if not re.match(r'^\d{7,15}$', telefono_str):
-            raise ValueError('El teléfono debe tener entre 7 y 15 dígitos')
-        return v
-
-    @validator('mensaje')
-    def validate_mensaje(cls, v):
-        palabras = len(v.strip().split())
-        if palabras > 500:
-            raise ValueError('El mensaje no puede exceder las 500 palabras')
-        return v.strip()
+    nombre_completo: NombreCompleto = Field(..., description="Nombre completo del cliente")
+    email: Email = Field(..., description="Email válido del cliente")
+    telefono: Telefono = Field(..., description="Número de teléfono")
+    mensaje: Mensaje = Field(..., description="Mensaje del cliente")
 
 
 class FormularioClienteUpdate(BaseModel):
-    nombre_completo: Optional[str] = Field(None, min_length=2, max_length=255)
-    email: Optional[EmailStr] = None
-    telefono: Optional[int] = None
-    mensaje: Optional[str] = Field(None, min_length=1, max_length=500)
-
-    @validator('nombre_completo')
-    def validate_nombre_completo(cls, v):
-        if v is not None:
-            if not re.match(r'^[a-zA-ZáéíóúüñÁÉÍÓÚÜÑ\s\-\'\.]+$', v.strip()):
-                raise ValueError('El nombre solo puede contener letras, espacios, guiones y apóstrofes')
-
-            palabras = v.strip().split()
-            if len(palabras) < 2:
-                raise ValueError('Debe ingresar nombre y apellido')
-
-            return v.strip().title()
-        return v
-
-    @validator('telefono')
-    def validate_telefono(cls, v):
-        if v is not None:
-            telefono_str = str(v)
-            if not re.match(r'^\d{7,15}$', telefono_str):
-                raise ValueError('El teléfono debe tener entre 7 y 15 dígitos')
-        return v
-
-    @validator('mensaje')
-    def validate_mensaje(cls, v):
-        if v is not None:
-            palabras = len(v.strip().split())
-            if palabras > 500:
-                raise ValueError('El mensaje no puede exceder las 500 palabras')
-            return v.strip()
-        return v
+    nombre_completo: Optional[NombreCompleto] = None
+    email: Optional[Email] = None
+    telefono: Optional[Telefono] = None
+    mensaje: Optional[Mensaje] = None
 
 
 class FormularioClienteResponse(BaseModel):
@@ -85,3 +31,89 @@ class FormularioClienteResponse(BaseModel):
 class ApiResponse(BaseModel):
     message: list[str]
     data: list[FormularioClienteResponse]  # ✅ Ahora coincide con lo que devuelves
+
+
+@dataclass(slots=True, frozen=True)
+class FormularioRegistro:
+    """Fila de formulario tal como la devuelve la base de datos.
+
+    Es la representación interna de los repositorios, el caché y el servicio:
+    se construye sin validación y se serializa directamente a JSON.
+    `FormularioClienteResponse` queda como esquema documentado en OpenAPI.
+    """
+    id: str
+    nombre_completo: str
+    email: str
+    telefono: int
+    mensaje: str
+    created_at: datetime
+    updated_at: datetime
+
+
+@dataclass(slots=True, frozen=True)
+class FiltrosBusqueda:
+    """Filtros de GET /formulario/search; los que son None no se aplican"""
+    email: Optional[str] = None
+    email_prefijo: Optional[str] = None
+    telefono: Optional[int] = None
+    desde: Optional[datetime] = None
+    hasta: Optional[datetime] = None
+    texto: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class CambioFormulario:
+    """Evento del registro de cambios; `formulario` es el estado actual (None si ya no existe)"""
+    cursor: str
+    operacion: str  # crear, actualizar o eliminar
+    id: str
+    fecha: datetime
+    formulario: Optional[FormularioRegistro]
+
+
+@dataclass(slots=True)
+class RespuestaApi:
+    """Sobre {"message": [...], "data": [...]} que se serializa una sola vez"""
+    message: List[str]
+    data: List[Any]
+
+
+class ResultadoLoteItem(BaseModel):
+    indice: int
+    estado: int  # código HTTP del ítem: 201 creado, 200 eliminado, 400/404/422/500 error
+    id: Optional[str] = None
+    errores: Optional[List[str]] = None
+
+
+class ApiResponseLote(BaseModel):
+    message: list[str]
+    data: list[ResultadoLoteItem]
+
+
+class LineaRechazada(BaseModel):
+    linea: int
+    errores: List[str]
+
+
+class ResumenImportacion(BaseModel):
+    importados: int
+    rechazados: int
+    errores: List[LineaRechazada]  # las primeras IMPORTAR_MAX_ERRORES líneas rechazadas
+
+
+class ApiResponseImportacion(BaseModel):
+    message: list[str]
+    data: list[ResumenImportacion]
+
+
+class CambioFormularioResponse(BaseModel):
+    cursor: str
+    operacion: str
+    id: str
+    fecha: datetime
+    formulario: Optional[FormularioClienteResponse] = None
+
+
+class ApiResponseCambios(BaseModel):
+    message: list[str]
+    data: list[CambioFormularioResponse]
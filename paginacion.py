@@ -0,0 +1,79 @@
+"""
+Paginación por keyset sobre (created_at, id) para GET /formulario/all y
+/formulario/search; las búsquedas por texto agregan la relevancia al keyset.
+
+El cursor de la siguiente página es un token opaco (base64 url-safe) con el
+created_at y el id de la última fila entregada; la consulta continúa con
+`WHERE (created_at, id) < (...)`, que recorre idx_formulario_cliente_created_at_id
+sin OFFSET, así que el costo por página no crece con la tabla.
+
+El registro de cambios (/formulario/changes y /formulario/sync) usa un cursor
+con el mismo formato sobre su posición (txid, id).
+"""
+from datetime import datetime
+from typing import Optional
+import base64
+import json
+import os
+import uuid
+
+TAMANO_PAGINA_DEFECTO = int(os.getenv("PAGINA_TAMANO_DEFECTO", "100"))
+TAMANO_PAGINA_MAXIMO = int(os.getenv("PAGINA_TAMANO_MAXIMO", "1000"))
+TAMANO_LOTE_STREAM = int(os.getenv("STREAM_TAMANO_LOTE", "500"))
+
+
+class CursorInvalidoError(ValueError):
+    """El token de paginación no es válido"""
+
+
+def codificar_cursor(created_at: datetime, formulario_id: str, rango: Optional[float] = None) -> str:
+    """Token de la fila; las búsquedas por texto incluyen además su relevancia (`rango`)"""
+    posicion = [created_at.isoformat(), str(formulario_id)]
+    if rango is not None:
+        posicion.insert(0, rango)
+    crudo = json.dumps(posicion, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def _leer_cursor(token: str) -> list:
+    relleno = "=" * (-len(token) % 4)
+    posicion = json.loads(base64.urlsafe_b64decode(token + relleno))
+    if not isinstance(posicion, list):
+        raise ValueError("cursor sin posición")
+    return posicion
+
+
+def decodificar_cursor(token: str):
+    """Devuelve la tupla (created_at, id) codificada en el token"""
+    try:
+        created_at, formulario_id = _leer_cursor(token)
+        return datetime.fromisoformat(created_at), str(uuid.UUID(formulario_id))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise CursorInvalidoError("El cursor de paginación no es válido") from e
+
+
+def decodificar_cursor_con_rango(token: str):
+    """Devuelve la tupla (rango, created_at, id) de un cursor de búsqueda por texto"""
+    try:
+        rango, created_at, formulario_id = _leer_cursor(token)
+        if isinstance(rango, bool) or not isinstance(rango, (int, float)):
+            raise ValueError("rango no numérico")
+        return float(rango), datetime.fromisoformat(created_at), str(uuid.UUID(formulario_id))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise CursorInvalidoError("El cursor de paginación no es válido") from e
+
+
+def codificar_cursor_cambios(txid: int, cambio_id: int) -> str:
+    crudo = json.dumps([txid, cambio_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor_cambios(token: str):
+    """Devuelve la posición (txid, id) de un cursor del registro de cambios"""
+    try:
+        txid, cambio_id = _leer_cursor(token)
+        if not all(type(valor) is int and valor >= 0 for valor in (txid, cambio_id)):
+            raise ValueError("posición no entera")
+        return txid, cambio_id
+    except (ValueError, TypeError, AttributeError) as e:
+        raise CursorInvalidoError("El cursor de cambios no es válido") from e
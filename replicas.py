@@ -0,0 +1,311 @@
+"""
+Lecturas en réplicas de PostgreSQL con lectura de lo propio escrito.
+
+DB_REPLICAS lista las réplicas separadas por comas: un DSN ("host=... port=..."),
+una URL postgresql://... o solo host[:puerto]; lo que una entrada no indica
+(base, usuario, contraseña, puerto) se toma de las variables DB_* del primario.
+Sin réplicas todo va al primario, como antes.
+
+- Las lecturas de los repositorios (por ID, /all, /search, el stream de
+  /all y las versiones de los GET condicionales) piden la conexión con
+  `lectura=True` y van a una réplica elegida por DB_REPLICAS_ESTRATEGIA:
+  "rotacion" (round-robin) o "menos_conexiones" (la de menos conexiones en uso
+  en este worker). Las escrituras, el registro de cambios y la idempotencia
+  siempre usan el primario.
+- Lectura de lo propio escrito: durante DB_LEER_PRIMARIO_TRAS_ESCRITURA
+  segundos después de una escritura confirmada leen del primario
+  * el cliente que la hizo (`MiddlewareLecturaPrimario`: cookie
+    `leer_primario_hasta`, válida en cualquier worker, y memoria del worker por
+    cliente para los que no guardan cookies), y
+  * cualquier lectura de las filas escritas (`escrituras_recientes`), también
+    en los workers que reciben la invalidación por el caché compartido. Así
+    una réplica atrasada no vuelve a llenar el caché con la versión anterior.
+- Una réplica se expulsa DB_REPLICA_EXPULSION segundos si no se puede tomar
+  una conexión en DB_REPLICA_TIMEOUT segundos, si su conexión se rompe o si
+  su retraso (medido como mucho cada DB_REPLICA_VERIFICAR_INTERVALO segundos)
+  supera DB_REPLICA_RETRASO_MAXIMO. La lectura sigue en otra réplica o en el
+  primario; al vencer la expulsión la réplica se vuelve a verificar.
+
+El retraso máximo debe ser menor que la ventana de lectura en el primario:
+es lo que garantiza que, pasada la ventana, la réplica ya tiene la escritura.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+import logging
+import math
+import os
+import threading
+import time
+
+import psycopg2.extensions
+
+from limites import identificar_cliente
+
+logger = logging.getLogger(__name__)
+
+REPLICAS = [entrada.strip() for entrada in (os.getenv("DB_REPLICAS") or "").split(",") if entrada.strip()]
+REPLICAS_ESTRATEGIA = (os.getenv("DB_REPLICAS_ESTRATEGIA") or "rotacion").lower()
+LEER_PRIMARIO_TRAS_ESCRITURA = float(os.getenv("DB_LEER_PRIMARIO_TRAS_ESCRITURA") or "5")
+REPLICA_TIMEOUT = int(os.getenv("DB_REPLICA_TIMEOUT") or "2")
+REPLICA_EXPULSION = float(os.getenv("DB_REPLICA_EXPULSION") or "30")
+REPLICA_RETRASO_MAXIMO = float(os.getenv("DB_REPLICA_RETRASO_MAXIMO") or "1")  # 0 = sin límite
+REPLICA_VERIFICAR_INTERVALO = float(os.getenv("DB_REPLICA_VERIFICAR_INTERVALO") or "2")
+REPLICAS_MAX_RECIENTES = int(os.getenv("DB_REPLICAS_MAX_RECIENTES") or "100000")
+
+if REPLICAS_ESTRATEGIA not in ("rotacion", "menos_conexiones"):
+    raise ValueError(f"DB_REPLICAS_ESTRATEGIA inválida: {REPLICAS_ESTRATEGIA!r} (use 'rotacion' o 'menos_conexiones')")
+
+# Segundos de atraso de la réplica: 0 si recibe el WAL en streaming y ya aplicó todo lo
+# recibido (sin escrituras en el primario, now() - último commit aplicado crecería sin
+# haber atraso). Sin streaming (recién arrancada, cortada del primario) no se puede saber
+# si está al día y cuenta el tiempo desde el último commit aplicado.
+SQL_RETRASO_REPLICA = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS retraso
+"""
+
+COOKIE_LECTURA_PRIMARIO = "leer_primario_hasta"
+METODOS_ESCRITURA = {"POST", "PUT", "PATCH", "DELETE"}
+
+# True mientras la petición (o una lectura puntual) debe leer del primario
+leer_del_primario: ContextVar[bool] = ContextVar("leer_del_primario", default=False)
+
+
+@contextmanager
+def en_primario(activo: bool = True):
+    """Las lecturas dentro del bloque van al primario (si `activo`)"""
+    if not activo:
+        yield
+        return
+    token = leer_del_primario.set(True)
+    try:
+        yield
+    finally:
+        leer_del_primario.reset(token)
+
+
+def parametros_replica(entrada: str, primario: Dict[str, str]) -> Dict[str, str]:
+    """Parámetros de conexión de una entrada de DB_REPLICAS, completados con los del primario"""
+    if "=" in entrada or "://" in entrada:
+        propios = psycopg2.extensions.parse_dsn(entrada)
+    else:
+        host, _, puerto = entrada.partition(":")
+        propios = {"host": host, "port": puerto} if puerto else {"host": host}
+    return {**primario, "connect_timeout": str(max(2, REPLICA_TIMEOUT)), **propios}
+
+
+class Replica:
+    """Una réplica de lectura con su estado de salud en este worker"""
+
+    def __init__(self, parametros: Dict[str, str]):
+        self.parametros = parametros
+        self.nombre = f"{parametros.get('host', 'localhost')}:{parametros.get('port', '5432')}"
+        self.en_uso = 0
+        self.lecturas = 0
+        self.expulsiones = 0
+        self.expulsada_hasta = 0.0
+        self.verificada_en = 0.0
+        self.retraso: Optional[float] = None
+        self.ultimo_error: Optional[str] = None
+
+
+class Enrutador:
+    """Elige la réplica de cada lectura y lleva la cuenta de las expulsadas (seguro entre hilos)"""
+
+    def __init__(self, replicas: List[Replica], estrategia: str = REPLICAS_ESTRATEGIA,
+                 expulsion: float = REPLICA_EXPULSION, retraso_maximo: float = REPLICA_RETRASO_MAXIMO,
+                 verificar_intervalo: float = REPLICA_VERIFICAR_INTERVALO):
+        self.replicas = replicas
+        self.estrategia = estrategia
+        self.expulsion = expulsion
+        self.retraso_maximo = retraso_maximo
+        self.verificar_intervalo = verificar_intervalo
+        self._lock = threading.Lock()
+        self._siguiente = 0
+        self.lecturas_primario = 0
+
+    def elegir(self) -> Optional[Replica]:
+        """Réplica para una lectura, ya contada como en uso, o None si debe ir al primario"""
+        if not self.replicas:
+            return None
+        ahora = time.monotonic()
+        with self._lock:
+            disponibles = [] if leer_del_primario.get() else [
+                replica for replica in self.replicas if replica.expulsada_hasta <= ahora
+            ]
+            if not disponibles:
+                self.lecturas_primario += 1
+                return None
+            # La rotación también reparte los empates de "menos_conexiones"
+            inicio = self._siguiente % len(disponibles)
+            self._siguiente += 1
+            disponibles = disponibles[inicio:] + disponibles[:inicio]
+            if self.estrategia == "menos_conexiones":
+                replica = min(disponibles, key=lambda r: r.en_uso)
+            else:
+                replica = disponibles[0]
+            replica.en_uso += 1
+            replica.lecturas += 1
+            return replica
+
+    def soltar(self, replica: Replica):
+        with self._lock:
+            replica.en_uso -= 1
+
+    def expulsar(self, replica: Replica, motivo: str):
+        with self._lock:
+            replica.expulsada_hasta = time.monotonic() + self.expulsion
+            replica.verificada_en = 0.0  # al volver se verifica en la primera lectura
+            replica.expulsiones += 1
+            replica.ultimo_error = motivo
+        logger.warning("Réplica %s expulsada por %gs: %s", replica.nombre, self.expulsion, motivo)
+
+    def toca_verificar(self, replica: Replica) -> bool:
+        """True (una sola vez por intervalo) si la lectura actual debe medir el retraso de la réplica"""
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - replica.verificada_en < self.verificar_intervalo:
+                return False
+            replica.verificada_en = ahora
+            return True
+
+    def registrar_retraso(self, replica: Replica, retraso: float) -> bool:
+        """Anota el retraso medido; False (y la expulsa) si supera el máximo"""
+        replica.retraso = retraso
+        if self.retraso_maximo > 0 and retraso > self.retraso_maximo:
+            self.expulsar(replica, f"retraso de {retraso:.3f}s (máximo {self.retraso_maximo:g}s)")
+            return False
+        return True
+
+    def estadisticas(self) -> dict:
+        ahora = time.monotonic()
+        with self._lock:
+            return {
+                "estrategia": self.estrategia,
+                "lecturas_primario": self.lecturas_primario,
+                "replicas": [
+                    {
+                        "replica": replica.nombre,
+                        "disponible": replica.expulsada_hasta <= ahora,
+                        "en_uso": replica.en_uso,
+                        "lecturas": replica.lecturas,
+                        "expulsiones": replica.expulsiones,
+                        "retraso_s": replica.retraso,
+                        "ultimo_error": replica.ultimo_error,
+                    }
+                    for replica in self.replicas
+                ],
+            }
+
+
+class VentanasRecientes:
+    """Claves (filas o clientes) escritas hace menos de `ventana` segundos, con un máximo de entradas"""
+
+    def __init__(self, ventana: float = LEER_PRIMARIO_TRAS_ESCRITURA, max_entradas: int = REPLICAS_MAX_RECIENTES):
+        self.ventana = ventana
+        self.max_entradas = max_entradas
+        self._hasta = OrderedDict()  # clave -> instante (monotonic) en que vence
+        self._lock = threading.Lock()
+
+    def marcar(self, claves: Iterable):
+        if not REPLICAS or self.ventana <= 0:
+            return
+        hasta = time.monotonic() + self.ventana
+        with self._lock:
+            for clave in claves:
+                self._hasta[clave] = hasta
+                self._hasta.move_to_end(clave)
+            # Las más antiguas son también las primeras en vencer
+            while len(self._hasta) > self.max_entradas:
+                self._hasta.popitem(last=False)
+
+    def reciente(self, clave) -> bool:
+        if not REPLICAS:
+            return False
+        with self._lock:
+            hasta = self._hasta.get(clave)
+            if hasta is None:
+                return False
+            if hasta <= time.monotonic():
+                del self._hasta[clave]
+                return False
+            return True
+
+    def __len__(self):
+        return len(self._hasta)
+
+
+# Filas escritas recientemente: sus lecturas van al primario en todas las peticiones
+escrituras_recientes = VentanasRecientes()
+estadisticas_replicas = {"middleware": None}
+
+
+class MiddlewareLecturaPrimario:
+    """Middleware ASGI: las peticiones de un cliente que acaba de escribir leen del primario.
+
+    Tras una escritura con respuesta 2xx/3xx responde con la cookie
+    `leer_primario_hasta` (instante Unix en que vence la ventana) y recuerda al
+    cliente en este worker; mientras la cookie o la memoria sigan vigentes,
+    `leer_del_primario` es True durante toda la petición.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.clientes = VentanasRecientes()
+        self.peticiones_en_primario = 0
+        estadisticas_replicas["middleware"] = self
+
+    @staticmethod
+    def _cookie_vigente(scope) -> bool:
+        for nombre, valor in scope["headers"]:
+            if nombre != b"cookie":
+                continue
+            for parte in valor.decode("latin-1").split(";"):
+                clave, _, hasta = parte.strip().partition("=")
+                if clave == COOKIE_LECTURA_PRIMARIO:
+                    try:
+                        return float(hasta) > time.time()
+                    except ValueError:
+                        return False
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REPLICAS:
+            await self.app(scope, receive, send)
+            return
+
+        cliente = identificar_cliente(scope)
+        en_ventana = self.clientes.reciente(cliente) or self._cookie_vigente(scope)
+        if en_ventana:
+            self.peticiones_en_primario += 1
+        escritura = scope["method"] in METODOS_ESCRITURA and self.clientes.ventana > 0
+
+        async def enviar(mensaje):
+            if escritura and mensaje["type"] == "http.response.start" and mensaje["status"] < 400:
+                self.clientes.marcar([cliente])
+                ventana = self.clientes.ventana
+                cookie = (f"{COOKIE_LECTURA_PRIMARIO}={time.time() + ventana:.3f}; Max-Age={math.ceil(ventana)}; "
+                          f"Path=/; HttpOnly; SameSite=Lax")
+                mensaje["headers"] = [*mensaje.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(mensaje)
+
+        with en_primario(en_ventana):
+            await self.app(scope, receive, enviar)
+
+
+def estadisticas(por_ruta: Dict[str, Optional[dict]]) -> dict:
+    """Estado de las réplicas por ruta de datos ("sync"/"async") y de la lectura en el primario"""
+    middleware = estadisticas_replicas["middleware"]
+    return {
+        "habilitadas": bool(REPLICAS),
+        "leer_primario_tras_escritura_s": LEER_PRIMARIO_TRAS_ESCRITURA,
+        "filas_recientes": len(escrituras_recientes),
+        "peticiones_en_primario": middleware.peticiones_en_primario if middleware else 0,
+        **{ruta: estado for ruta, estado in por_ruta.items() if estado is not None},
+    }
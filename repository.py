@@ -1,182 +1,383 @@
-import uuid
-from typing import List, Optional
+from typing import Iterator, List, Optional, Set, Tuple, Union
 from datetime import datetime
-from database import db_connection
-from models import FormularioClienteCreate, FormularioClienteUpdate, FormularioClienteResponse
+from database import db_connection, CursorMedido
+from models import FormularioClienteCreate, FormularioClienteUpdate, FormularioRegistro, FiltrosBusqueda, CambioFormulario
+from cambios import cambio_desde_fila
+from consultas import (
+    SQL_BUSCAR_POR_ID, SQL_BUSCAR_POR_IDS, SQL_ELIMINAR_LOTE, MAX_INTENTOS_INSERCION,
+    construir_insercion, construir_actualizacion, construir_eliminacion, construir_pagina, construir_recorrido,
+    construir_busqueda, SQL_BUSCAR_CAMBIOS, SQL_POSICION_CAMBIOS, SQL_VERSION_POR_ID, SQL_VERSION_COLECCION,
+    sql_insercion_lote, valores_insercion, aplanar, construir_exportacion, SQL_IMPORTAR, SQL_IMPORTAR_CAMBIOS,
+)
+from copia import EscritorEnCola, datos_importacion
+from identificadores import nuevo_id, es_colision_de_id
+from metricas import medido_repositorio
+from sentencias import ejecutar
+import io
 import logging
-import psycopg2.extras
+import threading
+import uuid
+import psycopg2
 
 logger = logging.getLogger(__name__)
 
 class FormularioClienteRepository:
-    
-    def generar_uuid_unico(self) -> str:
-        """Genera un UUID único que no exista en la base de datos"""
-        with db_connection.get_db_connection() as conn:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            
-            max_intentos = 5
-            for _ in range(max_intentos):
-                nuevo_uuid = str(uuid.uuid4())
-                
-                cursor.execute(
-                    "SELECT COUNT(*) AS total FROM formulario_cliente WHERE id = %s",
-                    (nuevo_uuid,)
-                )
-                
-                if cursor.fetchone()["total"] == 0:
-                    return nuevo_uuid
-            
-            raise Exception("No se pudo generar un UUID único después de varios intentos")
-    
-    def crear_formulario(self, formulario: FormularioClienteCreate) -> FormularioClienteResponse:
-        """Crear un nuevo formulario cliente"""
+
+    @medido_repositorio
+    def crear_formulario(self, formulario: FormularioClienteCreate) -> FormularioRegistro:
+        """Crear un nuevo formulario cliente con un único INSERT ... RETURNING"""
         try:
             with db_connection.get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                
-                nuevo_id = self.generar_uuid_unico()
+                cursor = conn.cursor(cursor_factory=CursorMedido)
                 fecha_actual = datetime.now()
 
-                cursor.execute("""
-                    INSERT INTO formulario_cliente 
-                    (id, nombre_completo, email, telefono, mensaje, created_at, updated_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id, nombre_completo, email, telefono, mensaje, created_at, updated_at
-                """, (
-                    nuevo_id,
-                    formulario.nombre_completo,
-                    formulario.email,
-                    formulario.telefono,
-                    formulario.mensaje,
-                    fecha_actual,
-                    fecha_actual
-                ))
-                
+                for intento in range(1, MAX_INTENTOS_INSERCION + 1):
+                    consulta, valores = construir_insercion(formulario, fecha_actual, nuevo_id())
+                    try:
+                        ejecutar(cursor, consulta, valores)
+                        break
+                    except psycopg2.IntegrityError as e:
+                        conn.rollback()
+                        if not es_colision_de_id(e) or intento == MAX_INTENTOS_INSERCION:
+                            raise
+                        logger.warning("Colisión de ID al crear formulario, reintento %s", intento)
+
                 resultado = cursor.fetchone()
                 conn.commit()
-                
-                return FormularioClienteResponse(**resultado)
-                
+
+                return FormularioRegistro(**resultado)
+
         except Exception as e:
-            logger.error(f"Error creando formulario: {e}")
+            logger.error("Error creando formulario: %s", e)
             raise
-    
-    def buscar_por_id(self, formulario_id: str) -> Optional[FormularioClienteResponse]:
-        """Buscar formulario por ID"""
+
+    def _insertar_tramo(self, cursor, tramo, resultados, inicio):
+        cursor.execute(sql_insercion_lote(len(tramo)), aplanar(tramo))
+        por_id = {str(fila["id"]): fila for fila in cursor.fetchall()}
+        for desplazamiento, valores in enumerate(tramo):
+            resultados[inicio + desplazamiento] = FormularioRegistro(**por_id[valores[0]])
+
+    @medido_repositorio
+    def crear_formularios_lote(self, formularios: List[FormularioClienteCreate], atomico: bool = True,
+                               tamano_tramo: int = 1000) -> List[Union[FormularioRegistro, Exception]]:
+        """Inserta varios formularios en una transacción con INSERT multi-fila por tramos.
+
+        Con `atomico=False` cada tramo va en un SAVEPOINT; si un tramo falla se
+        reintenta fila por fila para devolver el error en la posición de cada
+        formulario y guardar el resto.
+        """
         try:
             with db_connection.get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                
-                cursor.execute("""
-                    SELECT id, nombre_completo, email, telefono, mensaje, created_at, updated_at
-                    FROM formulario_cliente
-                    WHERE id = %s
-                """, (formulario_id,))
-                
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+                fecha_actual = datetime.now()
+
+                filas = [valores_insercion(f, fecha_actual, nuevo_id() or str(uuid.uuid4())) for f in formularios]
+                resultados = [None] * len(filas)
+
+                for inicio in range(0, len(filas), tamano_tramo):
+                    tramo = filas[inicio:inicio + tamano_tramo]
+                    if atomico:
+                        self._insertar_tramo(cursor, tramo, resultados, inicio)
+                        continue
+
+                    cursor.execute("SAVEPOINT tramo_lote")
+                    try:
+                        self._insertar_tramo(cursor, tramo, resultados, inicio)
+                        cursor.execute("RELEASE SAVEPOINT tramo_lote")
+                    except psycopg2.Error:
+                        cursor.execute("ROLLBACK TO SAVEPOINT tramo_lote")
+                        for desplazamiento, valores in enumerate(tramo):
+                            cursor.execute("SAVEPOINT fila_lote")
+                            try:
+                                self._insertar_tramo(cursor, [valores], resultados, inicio + desplazamiento)
+                                cursor.execute("RELEASE SAVEPOINT fila_lote")
+                            except psycopg2.Error as e:
+                                cursor.execute("ROLLBACK TO SAVEPOINT fila_lote")
+                                resultados[inicio + desplazamiento] = e
+
+                conn.commit()
+                return resultados
+
+        except Exception as e:
+            logger.error("Error creando lote de formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    def buscar_por_id(self, formulario_id: str) -> Optional[FormularioRegistro]:
+        """Buscar formulario por ID"""
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_BUSCAR_POR_ID, (formulario_id,))
+
                 resultado = cursor.fetchone()
-                
+
                 if resultado:
-                    return FormularioClienteResponse(**resultado)
-                
+                    return FormularioRegistro(**resultado)
+
                 return None
-                
+
         except Exception as e:
-            logger.error(f"Error buscando formulario por ID: {e}")
+            logger.error("Error buscando formulario por ID: %s", e)
             raise
-    
-    def buscar_todos(self) -> List[FormularioClienteResponse]:
-        """Obtener todos los formularios"""
+
+    @medido_repositorio
+    def buscar_por_ids(self, formulario_ids: List[str]) -> List[FormularioRegistro]:
+        """Buscar varios formularios por ID en una sola consulta (los que no existen se omiten)"""
         try:
-            with db_connection.get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                
-                cursor.execute("""
-                    SELECT id, nombre_completo, email, telefono, mensaje, created_at, updated_at
-                    FROM formulario_cliente
-                    ORDER BY created_at DESC
-                """)
-                
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_BUSCAR_POR_IDS, (formulario_ids,))
+
+                return [FormularioRegistro(**resultado) for resultado in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error("Error buscando formularios por ID: %s", e)
+            raise
+
+    @medido_repositorio
+    def version_por_id(self, formulario_id: str) -> Optional[datetime]:
+        """updated_at del formulario (None si no existe), sin leer el resto de la fila"""
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_VERSION_POR_ID, (formulario_id,))
+
+                resultado = cursor.fetchone()
+                return resultado["updated_at"] if resultado else None
+
+        except Exception as e:
+            logger.error("Error consultando la versión del formulario: %s", e)
+            raise
+
+    @medido_repositorio
+    def version_coleccion(self) -> Tuple[int, int]:
+        """xmin del snapshot y cambios registrados desde él: cambia con cada alta, modificación o baja"""
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_VERSION_COLECCION)
+
+                resultado = cursor.fetchone()
+                return resultado["posicion"], resultado["cantidad"]
+
+        except Exception as e:
+            logger.error("Error consultando la versión de la colección: %s", e)
+            raise
+
+    @medido_repositorio
+    def buscar_pagina(self, limite: int, despues_de=None) -> List[FormularioRegistro]:
+        """Obtener una página de formularios ordenados por fecha de creación (keyset)"""
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                consulta, valores = construir_pagina(limite, despues_de)
+                ejecutar(cursor, consulta, valores)
+
                 resultados = cursor.fetchall()
-                
-                return [FormularioClienteResponse(**resultado) for resultado in resultados]
-                
+
+                return [FormularioRegistro(**resultado) for resultado in resultados]
+
         except Exception as e:
-            logger.error(f"Error obteniendo todos los formularios: {e}")
+            logger.error("Error obteniendo página de formularios: %s", e)
             raise
-    
-    def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate) -> Optional[FormularioClienteResponse]:
-        """Actualizar un formulario existente"""
+
+    @medido_repositorio
+    def buscar_filtrados(self, filtros: FiltrosBusqueda, limite: int,
+                         despues_de=None) -> List[Tuple[FormularioRegistro, Optional[float]]]:
+        """Página de búsqueda; cada formulario viene con su relevancia (None sin texto)"""
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                consulta, valores = construir_busqueda(filtros, limite, despues_de)
+                cursor.execute(consulta, valores)
+
+                resultados = cursor.fetchall()
+
+                filas = []
+                for resultado in resultados:
+                    rango = resultado.pop("rango", None)
+                    filas.append((FormularioRegistro(**resultado), rango))
+                return filas
+
+        except Exception as e:
+            logger.error("Error buscando formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    def buscar_cambios(self, despues_de: Tuple[int, int], limite: int) -> List[CambioFormulario]:
+        """Eventos del registro de cambios posteriores a la posición (txid, id), en orden"""
+        try:
+            with db_connection.get_db_connection() as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_BUSCAR_CAMBIOS, (despues_de[0], despues_de[1], limite))
+
+                return [cambio_desde_fila(fila) for fila in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error("Error consultando cambios de formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    def posicion_cambios(self) -> Tuple[int, int]:
+        """Posición actual del registro de cambios (los eventos anteriores se consideran vistos)"""
         try:
             with db_connection.get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                
-                campos_actualizar = []
-                valores = []
-                
-                if formulario.nombre_completo is not None:
-                    campos_actualizar.append("nombre_completo = %s")
-                    valores.append(formulario.nombre_completo)
-                
-                if formulario.email is not None:
-                    campos_actualizar.append("email = %s")
-                    valores.append(formulario.email)
-                
-                if formulario.telefono is not None:
-                    campos_actualizar.append("telefono = %s")
-                    valores.append(formulario.telefono)
-                
-                if formulario.mensaje is not None:
-                    campos_actualizar.append("mensaje = %s")
-                    valores.append(formulario.mensaje)
-
-                # Siempre actualizar updated_at
-                campos_actualizar.append("updated_at = %s")
-                valores.append(datetime.now())
-                
-                if not campos_actualizar:
-                    return self.buscar_por_id(formulario_id)
-                
-                valores.append(formulario_id)
-                
-                consulta = f"""
-                    UPDATE formulario_cliente 
-                    SET {', '.join(campos_actualizar)}
-                    WHERE id = %s
-                    RETURNING id, nombre_completo, email, telefono, mensaje, created_at, updated_at
-                """
-                
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_POSICION_CAMBIOS)
+
+                return cursor.fetchone()["txid"], 0
+
+        except Exception as e:
+            logger.error("Error consultando la posición de cambios: %s", e)
+            raise
+
+    @medido_repositorio
+    def iterar_todos(self, despues_de=None, tamano_lote: int = 500) -> Iterator[FormularioRegistro]:
+        """Recorre todos los formularios con un cursor con nombre (del lado del servidor),
+        trayendo `tamano_lote` filas por viaje; la memoria no depende del tamaño de la tabla"""
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor(name=f"recorrido_{uuid.uuid4().hex}", cursor_factory=CursorMedido)
+                cursor.itersize = tamano_lote
+
+                consulta, valores = construir_recorrido(despues_de)
                 cursor.execute(consulta, valores)
+
+                try:
+                    for resultado in cursor:
+                        yield FormularioRegistro(**resultado)
+                finally:
+                    cursor.close()
+
+        except Exception as e:
+            logger.error("Error recorriendo formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    def exportar(self, formato: str, desde: Optional[datetime] = None,
+                 hasta: Optional[datetime] = None) -> Iterator[bytes]:
+        """COPY ... TO STDOUT de los formularios en CSV o NDJSON, en bloques de bytes.
+
+        copy_expert corre en un hilo aparte y entrega los bloques por una cola
+        acotada (copia.EscritorEnCola). Si el recorrido se abandona a mitad del
+        COPY la conexión se cierra: no se puede reutilizar hasta leer el resto.
+        """
+        try:
+            with db_connection.get_db_connection(lectura=True) as conn:
+                cursor = conn.cursor()
+                consulta, valores = construir_exportacion(formato, desde, hasta)
+                escritor = EscritorEnCola()
+                hilo = threading.Thread(
+                    target=escritor.copiar, args=(cursor, cursor.mogrify(consulta, valores).decode()), daemon=True
+                )
+                hilo.start()
+                try:
+                    yield from escritor
+                finally:
+                    escritor.cancelar()
+                    hilo.join()
+                    if not escritor.completo:
+                        conn.close()
+
+        except Exception as e:
+            logger.error("Error exportando formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    def importar_formularios(self, formularios: List[FormularioClienteCreate]) -> List[str]:
+        """Guarda formularios ya validados con un COPY ... FROM STDIN en una transacción; devuelve sus IDs"""
+        try:
+            with db_connection.get_db_connection() as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ids = [nuevo_id() or str(uuid.uuid4()) for _ in formularios]
+                cursor.copy_expert(SQL_IMPORTAR, io.BytesIO(datos_importacion(formularios, ids, datetime.now())))
+                if SQL_IMPORTAR_CAMBIOS is not None:
+                    ejecutar(cursor, SQL_IMPORTAR_CAMBIOS, (ids,))
+
+                conn.commit()
+                return ids
+
+        except Exception as e:
+            logger.error("Error importando formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate,
+                              versiones: Optional[List[datetime]] = None) -> Optional[FormularioRegistro]:
+        """Actualizar un formulario con un único UPDATE ... RETURNING.
+
+        Devuelve None si no existe o si su versión no está en `versiones`.
+        """
+        try:
+            with db_connection.get_db_connection() as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                consulta, valores = construir_actualizacion(formulario_id, formulario, datetime.now(), versiones)
+
+                ejecutar(cursor, consulta, valores)
                 resultado = cursor.fetchone()
-                
+
                 if resultado:
                     conn.commit()
-                    return FormularioClienteResponse(**resultado)
-                
+                    return FormularioRegistro(**resultado)
+
                 return None
-                
+
         except Exception as e:
-            logger.error(f"Error actualizando formulario: {e}")
+            logger.error("Error actualizando formulario: %s", e)
             raise
-    
-    def eliminar_formulario(self, formulario_id: str) -> bool:
-        """Eliminar un formulario por ID"""
+
+    @medido_repositorio
+    def eliminar_formulario(self, formulario_id: str, versiones: Optional[List[datetime]] = None) -> bool:
+        """Eliminar un formulario por ID; False si no existe o su versión no está en `versiones`"""
         try:
             with db_connection.get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-                
-                cursor.execute("""
-                    DELETE FROM formulario_cliente
-                    WHERE id = %s
-                """, (formulario_id,))
-                
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, *construir_eliminacion(formulario_id, versiones))
+
                 filas_afectadas = cursor.rowcount
                 conn.commit()
-                
+
                 return filas_afectadas > 0
-                
+
+        except Exception as e:
+            logger.error("Error eliminando formulario: %s", e)
+            raise
+
+    @medido_repositorio
+    def eliminar_formularios_lote(self, formulario_ids: List[str], atomico: bool = True) -> Tuple[Set[str], bool]:
+        """Elimina varios formularios con un solo DELETE ... WHERE id = ANY(...).
+
+        Devuelve los IDs encontrados y si se confirmó; con `atomico=True` no se
+        elimina nada cuando falta alguno.
+        """
+        try:
+            with db_connection.get_db_connection() as conn:
+                cursor = conn.cursor(cursor_factory=CursorMedido)
+
+                ejecutar(cursor, SQL_ELIMINAR_LOTE, (formulario_ids,))
+                eliminados = {str(fila["id"]) for fila in cursor.fetchall()}
+
+                if atomico and len(eliminados) < len(set(formulario_ids)):
+                    conn.rollback()
+                    return eliminados, False
+
+                conn.commit()
+                return eliminados, True
+
         except Exception as e:
-            logger.error(f"Error eliminando formulario: {e}")
+            logger.error("Error eliminando lote de formularios: %s", e)
             raise
 
 # Instancia global del repositorio
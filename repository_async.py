@@ -0,0 +1,452 @@
+from typing import AsyncIterator, List, Optional, Set, Tuple, Union
+from datetime import datetime
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from database_async import db_connection_async, psycopg, ASYNC_DISPONIBLE
+from models import FormularioClienteCreate, FormularioClienteUpdate, FormularioRegistro, FiltrosBusqueda, CambioFormulario
+from cambios import cambio_desde_fila
+from consultas import (
+    SQL_BUSCAR_POR_ID, SQL_BUSCAR_POR_IDS, SQL_ELIMINAR_LOTE, MAX_INTENTOS_INSERCION,
+    construir_insercion, construir_actualizacion, construir_eliminacion, construir_pagina, construir_recorrido,
+    construir_busqueda, SQL_BUSCAR_CAMBIOS, SQL_POSICION_CAMBIOS, SQL_VERSION_POR_ID, SQL_VERSION_COLECCION,
+    sql_insercion_lote, valores_insercion, aplanar, construir_exportacion, SQL_IMPORTAR, SQL_IMPORTAR_CAMBIOS,
+)
+from copia import EXPORTAR_BLOQUE_BYTES, datos_importacion
+from identificadores import nuevo_id, es_colision_de_id
+from metricas import medido_repositorio
+from repository import FormularioClienteRepository, formulario_repository
+import anyio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class FormularioClienteRepositoryAsync:
+    """Repositorio no bloqueante sobre psycopg 3; misma interfaz que el síncrono con `await`"""
+
+    @medido_repositorio
+    async def crear_formulario(self, formulario: FormularioClienteCreate) -> FormularioRegistro:
+        """Crear un nuevo formulario cliente con un único INSERT ... RETURNING"""
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                fecha_actual = datetime.now()
+
+                for intento in range(1, MAX_INTENTOS_INSERCION + 1):
+                    consulta, valores = construir_insercion(formulario, fecha_actual, nuevo_id())
+                    try:
+                        cursor = await conn.execute(consulta, valores, prepare=True)
+                        break
+                    except psycopg.IntegrityError as e:
+                        await conn.rollback()
+                        if not es_colision_de_id(e) or intento == MAX_INTENTOS_INSERCION:
+                            raise
+                        logger.warning("Colisión de ID al crear formulario, reintento %s", intento)
+
+                resultado = await cursor.fetchone()
+                await conn.commit()
+
+                return FormularioRegistro(**resultado)
+
+        except Exception as e:
+            logger.error("Error creando formulario: %s", e)
+            raise
+
+    async def _insertar_tramo(self, conn, tramo, resultados, inicio):
+        cursor = await conn.execute(sql_insercion_lote(len(tramo)), aplanar(tramo), prepare=False)
+        por_id = {str(fila["id"]): fila for fila in await cursor.fetchall()}
+        for desplazamiento, valores in enumerate(tramo):
+            resultados[inicio + desplazamiento] = FormularioRegistro(**por_id[valores[0]])
+
+    @medido_repositorio
+    async def crear_formularios_lote(self, formularios: List[FormularioClienteCreate], atomico: bool = True,
+                                     tamano_tramo: int = 1000) -> List[Union[FormularioRegistro, Exception]]:
+        """Inserta varios formularios en una transacción con INSERT multi-fila por tramos.
+
+        Con `atomico=False` cada tramo va en un SAVEPOINT; si un tramo falla se
+        reintenta fila por fila para devolver el error en la posición de cada
+        formulario y guardar el resto.
+        """
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                fecha_actual = datetime.now()
+
+                filas = [valores_insercion(f, fecha_actual, nuevo_id() or str(uuid.uuid4())) for f in formularios]
+                resultados = [None] * len(filas)
+
+                for inicio in range(0, len(filas), tamano_tramo):
+                    tramo = filas[inicio:inicio + tamano_tramo]
+                    if atomico:
+                        await self._insertar_tramo(conn, tramo, resultados, inicio)
+                        continue
+
+                    await conn.execute("SAVEPOINT tramo_lote")
+                    try:
+                        await self._insertar_tramo(conn, tramo, resultados, inicio)
+                        await conn.execute("RELEASE SAVEPOINT tramo_lote")
+                    except psycopg.Error:
+                        await conn.execute("ROLLBACK TO SAVEPOINT tramo_lote")
+                        for desplazamiento, valores in enumerate(tramo):
+                            await conn.execute("SAVEPOINT fila_lote")
+                            try:
+                                await self._insertar_tramo(conn, [valores], resultados, inicio + desplazamiento)
+                                await conn.execute("RELEASE SAVEPOINT fila_lote")
+                            except psycopg.Error as e:
+                                await conn.execute("ROLLBACK TO SAVEPOINT fila_lote")
+                                resultados[inicio + desplazamiento] = e
+
+                await conn.commit()
+                return resultados
+
+        except Exception as e:
+            logger.error("Error creando lote de formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def buscar_por_id(self, formulario_id: str) -> Optional[FormularioRegistro]:
+        """Buscar formulario por ID"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                cursor = await conn.execute(SQL_BUSCAR_POR_ID, (formulario_id,), prepare=True)
+
+                resultado = await cursor.fetchone()
+
+                if resultado:
+                    return FormularioRegistro(**resultado)
+
+                return None
+
+        except Exception as e:
+            logger.error("Error buscando formulario por ID: %s", e)
+            raise
+
+    @medido_repositorio
+    async def buscar_por_ids(self, formulario_ids: List[str]) -> List[FormularioRegistro]:
+        """Buscar varios formularios por ID en una sola consulta (los que no existen se omiten)"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                cursor = await conn.execute(SQL_BUSCAR_POR_IDS, (formulario_ids,), prepare=True)
+
+                return [FormularioRegistro(**resultado) for resultado in await cursor.fetchall()]
+
+        except Exception as e:
+            logger.error("Error buscando formularios por ID: %s", e)
+            raise
+
+    @medido_repositorio
+    async def version_por_id(self, formulario_id: str) -> Optional[datetime]:
+        """updated_at del formulario (None si no existe), sin leer el resto de la fila"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                cursor = await conn.execute(SQL_VERSION_POR_ID, (formulario_id,), prepare=True)
+
+                resultado = await cursor.fetchone()
+                return resultado["updated_at"] if resultado else None
+
+        except Exception as e:
+            logger.error("Error consultando la versión del formulario: %s", e)
+            raise
+
+    @medido_repositorio
+    async def version_coleccion(self) -> Tuple[int, int]:
+        """xmin del snapshot y cambios registrados desde él: cambia con cada alta, modificación o baja"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                cursor = await conn.execute(SQL_VERSION_COLECCION, prepare=True)
+
+                resultado = await cursor.fetchone()
+                return resultado["posicion"], resultado["cantidad"]
+
+        except Exception as e:
+            logger.error("Error consultando la versión de la colección: %s", e)
+            raise
+
+    @medido_repositorio
+    async def buscar_pagina(self, limite: int, despues_de=None) -> List[FormularioRegistro]:
+        """Obtener una página de formularios ordenados por fecha de creación (keyset)"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                consulta, valores = construir_pagina(limite, despues_de)
+                cursor = await conn.execute(consulta, valores, prepare=True)
+
+                resultados = await cursor.fetchall()
+
+                return [FormularioRegistro(**resultado) for resultado in resultados]
+
+        except Exception as e:
+            logger.error("Error obteniendo página de formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def buscar_filtrados(self, filtros: FiltrosBusqueda, limite: int,
+                               despues_de=None) -> List[Tuple[FormularioRegistro, Optional[float]]]:
+        """Página de búsqueda; cada formulario viene con su relevancia (None sin texto)"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                consulta, valores = construir_busqueda(filtros, limite, despues_de)
+                cursor = await conn.execute(consulta, valores, prepare=False)
+
+                resultados = await cursor.fetchall()
+
+                filas = []
+                for resultado in resultados:
+                    rango = resultado.pop("rango", None)
+                    filas.append((FormularioRegistro(**resultado), rango))
+                return filas
+
+        except Exception as e:
+            logger.error("Error buscando formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def buscar_cambios(self, despues_de: Tuple[int, int], limite: int) -> List[CambioFormulario]:
+        """Eventos del registro de cambios posteriores a la posición (txid, id), en orden"""
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                cursor = await conn.execute(SQL_BUSCAR_CAMBIOS, (despues_de[0], despues_de[1], limite), prepare=True)
+
+                return [cambio_desde_fila(fila) for fila in await cursor.fetchall()]
+
+        except Exception as e:
+            logger.error("Error consultando cambios de formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def posicion_cambios(self) -> Tuple[int, int]:
+        """Posición actual del registro de cambios (los eventos anteriores se consideran vistos)"""
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                cursor = await conn.execute(SQL_POSICION_CAMBIOS, prepare=True)
+
+                return (await cursor.fetchone())["txid"], 0
+
+        except Exception as e:
+            logger.error("Error consultando la posición de cambios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def iterar_todos(self, despues_de=None, tamano_lote: int = 500) -> AsyncIterator[FormularioRegistro]:
+        """Recorre todos los formularios con un cursor con nombre (del lado del servidor)"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                async with conn.cursor(name=f"recorrido_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = tamano_lote
+
+                    consulta, valores = construir_recorrido(despues_de)
+                    await cursor.execute(consulta, valores)
+
+                    try:
+                        async for resultado in cursor:
+                            yield FormularioRegistro(**resultado)
+                    except anyio.get_cancelled_exc_class():
+                        # Cancelada a mitad de un FETCH: quedó un resultado sin leer y ni el
+                        # CLOSE del cursor ni el ROLLBACK pueden ir; se cierra y el pool la descarta
+                        await conn.close()
+                        raise
+
+        except Exception as e:
+            logger.error("Error recorriendo formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def exportar(self, formato: str, desde: Optional[datetime] = None,
+                       hasta: Optional[datetime] = None) -> AsyncIterator[bytes]:
+        """COPY ... TO STDOUT de los formularios en CSV o NDJSON, en bloques de EXPORTAR_BLOQUE_BYTES"""
+        try:
+            async with db_connection_async.get_db_connection(lectura=True) as conn:
+                consulta, valores = construir_exportacion(formato, desde, hasta)
+                async with conn.cursor() as cursor:
+                    async with cursor.copy(consulta, valores) as copia:
+                        try:
+                            partes, tamano = [], 0
+                            async for datos in copia:
+                                partes.append(bytes(datos))
+                                tamano += len(datos)
+                                if tamano >= EXPORTAR_BLOQUE_BYTES:
+                                    yield b"".join(partes)
+                                    partes, tamano = [], 0
+                            if partes:
+                                yield b"".join(partes)
+                        except BaseException as e:
+                            # El cliente cortó a mitad del COPY: se cancela y se drena lo que
+                            # queda sin que la cancelación de la tarea lo interrumpa, para que
+                            # la conexión vuelva limpia al pool
+                            with anyio.CancelScope(shield=True):
+                                await copia.finish(e)
+                                await conn.rollback()
+                            raise
+
+        except Exception as e:
+            logger.error("Error exportando formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def importar_formularios(self, formularios: List[FormularioClienteCreate]) -> List[str]:
+        """Guarda formularios ya validados con un COPY ... FROM STDIN en una transacción; devuelve sus IDs"""
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                ids = [nuevo_id() or str(uuid.uuid4()) for _ in formularios]
+                async with conn.cursor() as cursor:
+                    async with cursor.copy(SQL_IMPORTAR) as copia:
+                        await copia.write(datos_importacion(formularios, ids, datetime.now()))
+                if SQL_IMPORTAR_CAMBIOS is not None:
+                    await conn.execute(SQL_IMPORTAR_CAMBIOS, (ids,), prepare=True)
+
+                await conn.commit()
+                return ids
+
+        except Exception as e:
+            logger.error("Error importando formularios: %s", e)
+            raise
+
+    @medido_repositorio
+    async def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate,
+                                    versiones: Optional[List[datetime]] = None) -> Optional[FormularioRegistro]:
+        """Actualizar un formulario con un único UPDATE ... RETURNING.
+
+        Devuelve None si no existe o si su versión no está en `versiones`.
+        """
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                consulta, valores = construir_actualizacion(formulario_id, formulario, datetime.now(), versiones)
+
+                cursor = await conn.execute(consulta, valores, prepare=True)
+                resultado = await cursor.fetchone()
+
+                if resultado:
+                    await conn.commit()
+                    return FormularioRegistro(**resultado)
+
+                return None
+
+        except Exception as e:
+            logger.error("Error actualizando formulario: %s", e)
+            raise
+
+    @medido_repositorio
+    async def eliminar_formulario(self, formulario_id: str, versiones: Optional[List[datetime]] = None) -> bool:
+        """Eliminar un formulario por ID; False si no existe o su versión no está en `versiones`"""
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                cursor = await conn.execute(*construir_eliminacion(formulario_id, versiones), prepare=True)
+
+                filas_afectadas = cursor.rowcount
+                await conn.commit()
+
+                return filas_afectadas > 0
+
+        except Exception as e:
+            logger.error("Error eliminando formulario: %s", e)
+            raise
+
+    @medido_repositorio
+    async def eliminar_formularios_lote(self, formulario_ids: List[str], atomico: bool = True) -> Tuple[Set[str], bool]:
+        """Elimina varios formularios con un solo DELETE ... WHERE id = ANY(...).
+
+        Devuelve los IDs encontrados y si se confirmó; con `atomico=True` no se
+        elimina nada cuando falta alguno.
+        """
+        try:
+            async with db_connection_async.get_db_connection() as conn:
+                cursor = await conn.execute(SQL_ELIMINAR_LOTE, (formulario_ids,), prepare=True)
+                eliminados = {str(fila["id"]) for fila in await cursor.fetchall()}
+
+                if atomico and len(eliminados) < len(set(formulario_ids)):
+                    await conn.rollback()
+                    return eliminados, False
+
+                await conn.commit()
+                return eliminados, True
+
+        except Exception as e:
+            logger.error("Error eliminando lote de formularios: %s", e)
+            raise
+
+
+class FormularioClienteRepositoryEnHilos:
+    """Respaldo: expone el repositorio síncrono con interfaz async ejecutándolo en el threadpool"""
+
+    def __init__(self, repositorio: FormularioClienteRepository):
+        self._repositorio = repositorio
+
+    async def crear_formulario(self, formulario: FormularioClienteCreate) -> FormularioRegistro:
+        return await run_in_threadpool(self._repositorio.crear_formulario, formulario)
+
+    async def buscar_por_id(self, formulario_id: str) -> Optional[FormularioRegistro]:
+        return await run_in_threadpool(self._repositorio.buscar_por_id, formulario_id)
+
+    async def buscar_por_ids(self, formulario_ids: List[str]) -> List[FormularioRegistro]:
+        return await run_in_threadpool(self._repositorio.buscar_por_ids, formulario_ids)
+
+    async def version_por_id(self, formulario_id: str) -> Optional[datetime]:
+        return await run_in_threadpool(self._repositorio.version_por_id, formulario_id)
+
+    async def version_coleccion(self) -> Tuple[int, int]:
+        return await run_in_threadpool(self._repositorio.version_coleccion)
+
+    async def buscar_pagina(self, limite: int, despues_de=None) -> List[FormularioRegistro]:
+        return await run_in_threadpool(self._repositorio.buscar_pagina, limite, despues_de)
+
+    async def buscar_filtrados(self, filtros: FiltrosBusqueda, limite: int,
+                               despues_de=None) -> List[Tuple[FormularioRegistro, Optional[float]]]:
+        return await run_in_threadpool(self._repositorio.buscar_filtrados, filtros, limite, despues_de)
+
+    async def buscar_cambios(self, despues_de: Tuple[int, int], limite: int) -> List[CambioFormulario]:
+        return await run_in_threadpool(self._repositorio.buscar_cambios, despues_de, limite)
+
+    async def posicion_cambios(self) -> Tuple[int, int]:
+        return await run_in_threadpool(self._repositorio.posicion_cambios)
+
+    async def iterar_todos(self, despues_de=None, tamano_lote: int = 500) -> AsyncIterator[FormularioRegistro]:
+        filas = self._repositorio.iterar_todos(despues_de, tamano_lote)
+        try:
+            async for fila in iterate_in_threadpool(filas):
+                yield fila
+        finally:
+            # Si el cliente cortó, el generador se cierra en el hilo: cierra el cursor y suelta la conexión
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(filas.close)
+
+    async def exportar(self, formato: str, desde: Optional[datetime] = None,
+                       hasta: Optional[datetime] = None) -> AsyncIterator[bytes]:
+        bloques = self._repositorio.exportar(formato, desde, hasta)
+        try:
+            async for bloque in iterate_in_threadpool(bloques):
+                yield bloque
+        finally:
+            # Si el cliente cortó, el generador se cierra en el hilo y corta el COPY
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(bloques.close)
+
+    async def importar_formularios(self, formularios: List[FormularioClienteCreate]) -> List[str]:
+        return await run_in_threadpool(self._repositorio.importar_formularios, formularios)
+
+    async def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate,
+                                    versiones: Optional[List[datetime]] = None) -> Optional[FormularioRegistro]:
+        return await run_in_threadpool(self._repositorio.actualizar_formulario, formulario_id, formulario, versiones)
+
+    async def eliminar_formulario(self, formulario_id: str, versiones: Optional[List[datetime]] = None) -> bool:
+        return await run_in_threadpool(self._repositorio.eliminar_formulario, formulario_id, versiones)
+
+    async def crear_formularios_lote(self, formularios: List[FormularioClienteCreate], atomico: bool = True,
+                                     tamano_tramo: int = 1000) -> List[Union[FormularioRegistro, Exception]]:
+        return await run_in_threadpool(self._repositorio.crear_formularios_lote, formularios, atomico, tamano_tramo)
+
+    async def eliminar_formularios_lote(self, formulario_ids: List[str], atomico: bool = True) -> Tuple[Set[str], bool]:
+        return await run_in_threadpool(self._repositorio.eliminar_formularios_lote, formulario_ids, atomico)
+
+
+def crear_repositorio_async(modo: Optional[str] = None):
+    """Elige la implementación según DB_MODO: "async" (psycopg 3) o "sync" (psycopg2 en hilos)"""
+    modo = (modo or os.getenv("DB_MODO", "async")).lower()
+    if modo not in ("async", "sync"):
+        raise ValueError(f"DB_MODO inválido: {modo!r} (use 'async' o 'sync')")
+    if modo == "async" and not ASYNC_DISPONIBLE:
+        logger.warning("psycopg 3 no está instalado; se usa el repositorio síncrono en hilos")
+        modo = "sync"
+    if modo == "sync":
+        return FormularioClienteRepositoryEnHilos(formulario_repository)
+    return FormularioClienteRepositoryAsync()
+
+# Instancia global del repositorio usada por el servicio
+formulario_repository_async = crear_repositorio_async()
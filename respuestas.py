@@ -0,0 +1,68 @@
+"""
+Serialización JSON de las respuestas de la API.
+
+Los repositorios devuelven `FormularioRegistro` (dataclass con __slots__) y el
+servicio arma el sobre `RespuestaApi` una sola vez. `RespuestaJSON` lo codifica
+con orjson sin pasar por la validación de `response_model` ni por
+`jsonable_encoder`; el JSON resultante es el mismo que generaba pydantic.
+Si orjson no está instalado se usa el módulo json estándar.
+"""
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from typing import Any
+import json
+import time
+
+from starlette.responses import Response
+
+from models import FormularioRegistro
+from metricas import METRICAS_HABILITADAS, SERIALIZACION_SEGUNDOS
+
+try:
+    import orjson
+    ORJSON_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+    ORJSON_DISPONIBLE = False
+
+
+def _convertir(valor):
+    if is_dataclass(valor):
+        return {campo.name: getattr(valor, campo.name) for campo in fields(valor)}
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def dumps(contenido: Any) -> bytes:
+    """Codifica a JSON compacto en UTF-8 (dataclasses y datetime incluidos)"""
+    if orjson is not None:
+        return orjson.dumps(contenido)
+    return json.dumps(contenido, default=_convertir, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(crudo):
+    if orjson is not None:
+        return orjson.loads(crudo)
+    return json.loads(crudo)
+
+
+def registro_desde_json(crudo) -> FormularioRegistro:
+    datos = loads(crudo)
+    datos["created_at"] = datetime.fromisoformat(datos["created_at"])
+    datos["updated_at"] = datetime.fromisoformat(datos["updated_at"])
+    return FormularioRegistro(**datos)
+
+
+class RespuestaJSON(Response):
+    """Respuesta JSON que serializa el contenido tal cual, sin revalidarlo"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if not METRICAS_HABILITADAS:
+            return dumps(content)
+        inicio = time.perf_counter()
+        cuerpo = dumps(content)
+        SERIALIZACION_SEGUNDOS.observar(time.perf_counter() - inicio)
+        return cuerpo
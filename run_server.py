@@ -1,30 +1,251 @@
 #!/usr/bin/env python3
 """
-Script para ejecutar el servidor de desarrollo
+Script para ejecutar el servidor.
+
+- Desarrollo (DEBUG=true): un proceso con recarga automática.
+- Producción (DEBUG=false o --produccion): varios workers de uvicorn bajo un
+  supervisor propio que comparte el socket, reinicia los workers que terminan
+  (por SERVIDOR_MAX_PETICIONES o por error) y drena las peticiones en curso al
+  recibir SIGTERM.
+
+El número de workers sale de las CPU y la memoria que el contenedor puede usar
+(límites de cgroup v1/v2) salvo que se fije con WEB_CONCURRENCY o --workers.
+`python run_server.py --produccion --plan` muestra la configuración calculada
+sin arrancar.
 """
-import uvicorn
+from importlib.util import find_spec
+import argparse
+import logging
+import multiprocessing
 import os
+import random
+import signal
+import threading
+import time
+
+import uvicorn
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
-if __name__ == "__main__":
+logger = logging.getLogger("run_server")
+
+CGROUP = "/sys/fs/cgroup"
+
+
+def _leer(ruta: str):
+    try:
+        with open(ruta) as archivo:
+            return archivo.read().strip()
+    except OSError:
+        return None
+
+
+def cpus_disponibles() -> float:
+    """CPU que el proceso puede usar: afinidad y cuota de CFS del cgroup, la menor"""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cpus = float(os.cpu_count() or 1)
+
+    cuota = periodo = None
+    cpu_max = _leer(f"{CGROUP}/cpu.max")  # cgroup v2: "<cuota> <periodo>" o "max <periodo>"
+    if cpu_max:
+        valor, _, periodo_texto = cpu_max.partition(" ")
+        if valor != "max":
+            cuota, periodo = int(valor), int(periodo_texto or 100000)
+    else:  # cgroup v1: cuota -1 significa sin límite
+        cuota_texto = _leer(f"{CGROUP}/cpu/cpu.cfs_quota_us")
+        periodo_texto = _leer(f"{CGROUP}/cpu/cpu.cfs_period_us")
+        if cuota_texto and periodo_texto and int(cuota_texto) > 0:
+            cuota, periodo = int(cuota_texto), int(periodo_texto)
+
+    if cuota and periodo:
+        cpus = min(cpus, cuota / periodo)
+    return cpus
+
+
+def memoria_disponible() -> int:
+    """Bytes de memoria del contenedor (límite del cgroup) o del equipo, el menor"""
+    try:
+        memoria = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        memoria = 0
+
+    # cgroup v2 ("max" sin límite) o v1 (un número enorme sin límite)
+    for ruta in (f"{CGROUP}/memory.max", f"{CGROUP}/memory/memory.limit_in_bytes"):
+        limite = _leer(ruta)
+        if limite and limite.isdigit():
+            memoria = min(memoria, int(limite)) if memoria else int(limite)
+            break
+    return memoria
+
+
+def calcular_workers(cpus: float, memoria: int) -> int:
+    """Workers por CPU (SERVIDOR_WORKERS_POR_CPU), limitados por memoria y conexiones a la base"""
+    fijado = os.getenv("WEB_CONCURRENCY")
+    if fijado:
+        return max(1, int(fijado))
+
+    workers = max(1, round(cpus * float(os.getenv("SERVIDOR_WORKERS_POR_CPU", "1"))))
+
+    memoria_por_worker = int(os.getenv("SERVIDOR_MEMORIA_POR_WORKER_MB", "256")) * 1024 * 1024
+    if memoria and memoria_por_worker > 0:
+        workers = min(workers, max(1, memoria // memoria_por_worker))
+
+    # Cada worker abre hasta DB_POOL_MAX conexiones más la del LISTEN de cambios
+    conexiones = int(os.getenv("DB_MAX_CONEXIONES") or 0)
+    if conexiones > 0:
+        workers = min(workers, max(1, conexiones // (int(os.getenv("DB_POOL_MAX", "10")) + 1)))
+    return workers
+
+
+def elegir_loop() -> str:
+    return "uvloop" if find_spec("uvloop") is not None else "asyncio"
+
+
+def elegir_http() -> str:
+    return "httptools" if find_spec("httptools") is not None else "h11"
+
+
+def opciones_produccion(host: str, port: int, log_level: str) -> dict:
+    """Argumentos de uvicorn.Config para cada worker de producción"""
+    return {
+        "app": "main:app",
+        "host": host,
+        "port": port,
+        "loop": elegir_loop(),
+        "http": elegir_http(),
+        "lifespan": "on",
+        "log_level": log_level,
+        "access_log": os.getenv("SERVIDOR_ACCESS_LOG", "false").lower() == "true",
+        "timeout_keep_alive": int(os.getenv("SERVIDOR_KEEP_ALIVE", "5")),
+        # Los streams SSE no terminan solos: pasado este plazo se cortan y el cliente
+        # se reconecta a otro worker con Last-Event-ID
+        "timeout_graceful_shutdown": int(os.getenv("SERVIDOR_TIEMPO_DRENADO", "20")),
+    }
+
+
+def _servir_worker(opciones: dict, sockets):
+    uvicorn.Server(uvicorn.Config(**opciones)).run(sockets=sockets)
+
+
+class Supervisor:
+    """Mantiene `workers` procesos de uvicorn sobre el mismo socket.
+
+    El Multiprocess de uvicorn 0.24 no reemplaza a un worker que termina, así que
+    con `limit_max_requests` el servidor se quedaría sin workers; aquí cada
+    salida se reemplaza mientras no se esté deteniendo el servidor.
+    """
+
+    def __init__(self, opciones: dict, workers: int, max_peticiones: int, variacion: int):
+        self.opciones = opciones
+        self.workers = workers
+        self.max_peticiones = max_peticiones
+        self.variacion = variacion
+        self.procesos = []
+        self.reinicios = 0
+        self._detener = threading.Event()
+        self._contexto = multiprocessing.get_context("spawn")
+
+    def _iniciar_worker(self, sockets):
+        opciones = dict(self.opciones)
+        if self.max_peticiones > 0:
+            # La variación evita que todos los workers se reciclen a la vez
+            opciones["limit_max_requests"] = self.max_peticiones + random.randint(0, self.variacion)
+        proceso = self._contexto.Process(target=_servir_worker, args=(opciones, sockets))
+        proceso.start()
+        return proceso
+
+    def _al_recibir_senal(self, senal, _marco):
+        logger.info("Señal %s: drenando workers", signal.Signals(senal).name)
+        self._detener.set()
+
+    def ejecutar(self):
+        config = uvicorn.Config(**self.opciones)
+        sockets = [config.bind_socket()]
+
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(senal, self._al_recibir_senal)
+
+        self.procesos = [self._iniciar_worker(sockets) for _ in range(self.workers)]
+        while not self._detener.wait(0.5):
+            for indice, proceso in enumerate(self.procesos):
+                if proceso.is_alive():
+                    continue
+                if proceso.exitcode != 0:
+                    logger.warning("Worker %s terminó con código %s; se reemplaza", proceso.pid, proceso.exitcode)
+                    time.sleep(1)  # evita un bucle de reinicios si el worker no logra arrancar
+                self.reinicios += 1
+                self.procesos[indice] = self._iniciar_worker(sockets)
+
+        # Cada worker deja de aceptar conexiones, espera a las peticiones en curso
+        # (hasta SERVIDOR_TIEMPO_DRENADO) y cierra sus pools
+        for proceso in self.procesos:
+            proceso.terminate()
+        limite = time.monotonic() + self.opciones["timeout_graceful_shutdown"] + 10
+        for proceso in self.procesos:
+            proceso.join(max(0.0, limite - time.monotonic()))
+            if proceso.is_alive():
+                logger.warning("Worker %s no terminó a tiempo; se fuerza el cierre", proceso.pid)
+                proceso.kill()
+                proceso.join()
+        for sock in sockets:
+            sock.close()
+        logger.info("Servidor detenido (%s workers reemplazados durante la ejecución)", self.reinicios)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de la API Formulario Cliente")
+    parser.add_argument("--produccion", action="store_true", help="varios workers, sin recarga (igual que DEBUG=false)")
+    parser.add_argument("--workers", type=int, help="número de workers (por defecto se calcula)")
+    parser.add_argument("--plan", action="store_true", help="muestra la configuración de producción y sale")
+    args = parser.parse_args()
+
     # Obtener configuración del entorno
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
-    debug = os.getenv("DEBUG", "True").lower() == "true"
+    debug = os.getenv("DEBUG", "True").lower() == "true" and not args.produccion
     log_level = os.getenv("LOG_LEVEL", "info").lower()
-    
-    print(f"🚀 Iniciando servidor en http://{host}:{port}")
-    print(f"📚 Documentación disponible en http://{host}:{port}/docs")
-    print(f"🏥 Health check en http://{host}:{port}/health")
-    
-    uvicorn.run(
-        "main:app",
-        host=host,
-        port=port,
-        reload=debug,
-        log_level=log_level,
-        access_log=True
-    )
\ No newline at end of file
+
+    if debug and not args.plan:
+        print(f"🚀 Iniciando servidor en http://{host}:{port}")
+        print(f"📚 Documentación disponible en http://{host}:{port}/docs")
+        print(f"🏥 Health check en http://{host}:{port}/health")
+
+        uvicorn.run(
+            "main:app",
+            host=host,
+            port=port,
+            reload=True,
+            log_level=log_level,
+            access_log=True
+        )
+        return
+
+    from bitacora import configurar_logs  # después de load_dotenv: lee LOG_FORMATO y compañía
+
+    configurar_logs(log_level)
+    cpus, memoria = cpus_disponibles(), memoria_disponible()
+    workers = args.workers or calcular_workers(cpus, memoria)
+    opciones = opciones_produccion(host, port, log_level)
+    max_peticiones = int(os.getenv("SERVIDOR_MAX_PETICIONES", "0"))
+    variacion = int(os.getenv("SERVIDOR_MAX_PETICIONES_VARIACION") or max_peticiones // 10)
+
+    logger.info(
+        "Producción: %s workers en http://%s:%s (CPU %g, memoria %s MB, loop %s, http %s, reciclado %s, drenado %s s)",
+        workers, host, port, cpus, memoria // (1024 * 1024), opciones["loop"], opciones["http"],
+        f"cada {max_peticiones} peticiones" if max_peticiones else "desactivado",
+        opciones["timeout_graceful_shutdown"],
+    )
+    if args.plan:
+        return
+
+    # Los workers lo heredan: con más de uno, cache.py exige invalidaciones compartidas
+    os.environ["SERVIDOR_WORKERS"] = str(workers)
+    Supervisor(opciones, workers, max_peticiones, variacion).ejecutar()
+
+
+if __name__ == "__main__":
+    main()
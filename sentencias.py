@@ -0,0 +1,87 @@
+"""
+Registro de sentencias preparadas de formulario_cliente.
+
+Las consultas fijas de los repositorios (consultas.py) se declaran con
+`Sentencia(nombre, sql)`: siguen siendo el mismo texto con `%s`, pero con un
+nombre estable. Cada conexión del pool las prepara la primera vez que las usa
+y desde entonces solo las ejecuta, sin que PostgreSQL vuelva a analizarlas y
+planificarlas en cada petición. Las consultas armadas a medida (búsqueda,
+INSERT multi-fila, recorrido con cursor con nombre) se envían como texto.
+
+- psycopg2 (repository.py): `ejecutar(cursor, consulta, valores)` hace
+  PREPARE una vez y EXECUTE por nombre; `ConexionPreparada` recuerda las ya
+  preparadas en un LRU de DB_SENTENCIAS_MAX nombres (DEALLOCATE al desalojar).
+- psycopg 3 (repository_async.py): la caché de sentencias del propio driver
+  (`prepared_max` = DB_SENTENCIAS_MAX), con `prepare=True` en las fijas y
+  `prepare=False` en las armadas a medida, para que no las desalojen. El
+  driver descarta todas las de la conexión en cada rollback(); el pool
+  confirma con COMMIT al devolverla, así que solo se pierden tras un error.
+
+En los dos casos el registro vive en la conexión: cuando el pool la recicla se
+descarta con ella y la conexión nueva vuelve a preparar. Con
+DB_SENTENCIAS_PREPARADAS=false (p. ej. detrás de pgbouncer en modo
+transacción) todo se envía como texto.
+"""
+from collections import OrderedDict
+import os
+import re
+
+import psycopg2.extensions
+
+SENTENCIAS_PREPARADAS = os.getenv("DB_SENTENCIAS_PREPARADAS", "true").lower() == "true"
+SENTENCIAS_MAX = int(os.getenv("DB_SENTENCIAS_MAX") or "64")
+
+# Marcador de parámetro con su conversión opcional, p. ej. `%s::uuid[]`
+_MARCADOR = re.compile(r"%s(::[\w\[\]]+)?")
+
+
+class Sentencia(str):
+    """Texto SQL con marcadores `%s` y el nombre con el que se prepara en cada conexión.
+
+    `preparar` es el PREPARE con marcadores `$n`; `ejecutar` es el EXECUTE
+    con un `%s` por parámetro para psycopg2, que interpola del lado del
+    cliente. Las conversiones explícitas (`%s::uuid[]`) se repiten en los
+    argumentos del EXECUTE: una lista llega como `text[]`, que no se convierte
+    sola al tipo del parámetro.
+    """
+
+    def __new__(cls, nombre: str, sql: str):
+        sentencia = super().__new__(cls, sql)
+        sentencia.nombre = nombre
+        conversiones = [conversion or "" for conversion in _MARCADOR.findall(sql)]
+        numeros = iter(range(1, len(conversiones) + 1))
+        texto = _MARCADOR.sub(lambda marcador: f"${next(numeros)}{marcador.group(1) or ''}", sql)
+        sentencia.preparar = f"PREPARE {nombre} AS {texto}"
+        argumentos = ", ".join(f"%s{conversion}" for conversion in conversiones)
+        sentencia.ejecutar = f"EXECUTE {nombre}({argumentos})" if argumentos else f"EXECUTE {nombre}"
+        return sentencia
+
+
+class ConexionPreparada(psycopg2.extensions.connection):
+    """Conexión psycopg2 que recuerda qué sentencias tiene preparadas (LRU por nombre)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = OrderedDict()
+
+
+def ejecutar(cursor, consulta, valores=None):
+    """`cursor.execute` de psycopg2 que usa la sentencia preparada si `consulta` es una `Sentencia`.
+
+    Un PREPARE no se deshace con el ROLLBACK de la transacción, así que se
+    anota como preparada antes del EXECUTE, que sí puede fallar.
+    """
+    preparadas = getattr(cursor.connection, "preparadas", None)
+    if not SENTENCIAS_PREPARADAS or preparadas is None or not isinstance(consulta, Sentencia):
+        return cursor.execute(consulta, valores)
+
+    if consulta.nombre in preparadas:
+        preparadas.move_to_end(consulta.nombre)
+    else:
+        if len(preparadas) >= SENTENCIAS_MAX:
+            antigua, _ = preparadas.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {antigua}")
+        cursor.execute(consulta.preparar)
+        preparadas[consulta.nombre] = None
+    return cursor.execute(consulta.ejecutar, valores)
+
@@ -1,153 +1,783 @@
-from typing import List
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Tuple
 from fastapi import HTTPException, status
-from models import FormularioClienteCreate, FormularioClienteUpdate, ApiResponse, FormularioClienteResponse
-from repository import formulario_repository
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from models import FormularioClienteCreate, FormularioClienteUpdate, FiltrosBusqueda, RespuestaApi, CambioFormulario
+from repository_async import formulario_repository_async
+from cache import NO_ENCONTRADO, formulario_cache
+from consultas import es_error_de_datos
+from respuestas import dumps
+from metricas import medido_servicio
+from etags import versiones_if_match
+from coalescencia import COALESCENCIA_HABILITADA, LotePorId, VueloUnico
+from creacion_agrupada import ColaLlenaError, CreacionAgrupada
+from copia import (
+    IMPORTAR_MAX_ERRORES, IMPORTAR_TAMANO_BLOQUE, LectorRegistros, RegistroDemasiadoLargoError, leer_encabezado,
+    validar_bloque,
+)
+from replicas import en_primario, escrituras_recientes, leer_del_primario
+from cambios import CAMBIOS_INTERVALO_SONDEO, CAMBIOS_LATIDO, CAMBIOS_TAMANO_LOTE, oyente_cambios
+from paginacion import (
+    TAMANO_PAGINA_DEFECTO, TAMANO_LOTE_STREAM, CursorInvalidoError, codificar_cursor, decodificar_cursor,
+    decodificar_cursor_con_rango, codificar_cursor_cambios, decodificar_cursor_cambios,
+)
+import anyio
+import asyncio
 import logging
+import math
+import os
+import time
 import uuid
 
 logger = logging.getLogger(__name__)
 
+LOTE_MAX_ITEMS = int(os.getenv("LOTE_MAX_ITEMS", "5000"))
+
+
+def mensajes_validacion(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(parte) for parte in detalle['loc']) or 'formulario'}: {detalle['msg']}"
+        for detalle in error.errors()
+    ]
+
+
+def item_lote(indice: int, estado: int, id: Optional[str] = None, errores: Optional[List[str]] = None) -> dict:
+    """Resultado de un ítem del lote con la forma de `ResultadoLoteItem`, omitiendo los campos vacíos"""
+    item = {"indice": indice, "estado": estado}
+    if id is not None:
+        item["id"] = id
+    if errores is not None:
+        item["errores"] = errores
+    return item
+
+
 class FormularioClienteService:
+
+    def __init__(self, repositorio=None, cache=None):
+        # Repositorio con interfaz async: psycopg 3 nativo o psycopg2 en hilos (DB_MODO)
+        self.repositorio = repositorio or formulario_repository_async
+        self.cache = cache or formulario_cache
+        # Lecturas idénticas concurrentes comparten una consulta; las escrituras las olvidan
+        self.vuelo_por_id = VueloUnico(COALESCENCIA_HABILITADA)
+        self.vuelo_listados = VueloUnico(COALESCENCIA_HABILITADA)
+        self.lote_por_id = LotePorId(lambda formulario_ids: self.repositorio.buscar_por_ids(formulario_ids))
+        # Creaciones concurrentes guardadas juntas con un solo COMMIT (CREAR_AGRUPADO_VENTANA_MS)
+        self.creacion_agrupada = CreacionAgrupada(
+            lambda formularios: self.repositorio.crear_formularios_lote(formularios, atomico=False)
+        )
+
+    def _cargar_por_id(self, formulario_id: str):
+        if leer_del_primario.get():
+            # Lectura en el primario (replicas.py): no se une a consultas ni lotes que van a una réplica
+            return self.vuelo_por_id.ejecutar(
+                ("primario", formulario_id), lambda: self.repositorio.buscar_por_id(formulario_id)
+            )
+        if self.lote_por_id.habilitado:
+            cargar = self.lote_por_id.cargar
+        else:
+            cargar = self.repositorio.buscar_por_id
+        return self.vuelo_por_id.ejecutar(formulario_id, lambda: cargar(formulario_id))
+
+    def _olvidar_lecturas(self, formulario_ids=()):
+        """Tras confirmar una escritura, las lecturas nuevas no se unen a consultas previas a ella
+        y las de las filas escritas van al primario mientras las réplicas se ponen al día"""
+        for formulario_id in formulario_ids:
+            self.vuelo_por_id.olvidar(formulario_id)
+            self.vuelo_por_id.olvidar(("primario", formulario_id))
+        self.vuelo_listados.olvidar()
+        escrituras_recientes.marcar(formulario_ids)
+
+    def estadisticas(self) -> dict:
+        return {
+            "habilitada": COALESCENCIA_HABILITADA,
+            "por_id": {"ejecutadas": self.vuelo_por_id.ejecutadas, "coalescidas": self.vuelo_por_id.coalescidas},
+            "listados": {"ejecutadas": self.vuelo_listados.ejecutadas, "coalescidas": self.vuelo_listados.coalescidas},
+            "lote_por_id": {
+                "ventana_ms": self.lote_por_id.ventana * 1000,
+                "lotes": self.lote_por_id.lotes,
+                "ids_agrupados": self.lote_por_id.ids_agrupados,
+            },
+        }
     
-    def crear_formulario(self, formulario: FormularioClienteCreate) -> ApiResponse:
+    @medido_servicio
+    async def crear_formulario(self, formulario: FormularioClienteCreate) -> RespuestaApi:
         try:
-            resultado = formulario_repository.crear_formulario(formulario)
+            if self.creacion_agrupada.habilitado:
+                resultado = await self.creacion_agrupada.crear(formulario)
+            else:
+                resultado = await self.repositorio.crear_formulario(formulario)
+            self._olvidar_lecturas([resultado.id])
+            await self.cache.guardar(resultado.id, resultado)
         
         # ✅ Ya no necesitas los logs de debug
-            return ApiResponse(
+            return RespuestaApi(
                 message=["Formulario creado satisfactoriamente."],
                 data=[resultado]
             )
+        except ColaLlenaError as e:
+            logger.warning("Creación rechazada: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El servicio está saturado; reintente más tarde",
+                headers={"Retry-After": str(max(1, math.ceil(e.espera)))}
+            )
         except Exception as e:
-            logger.error(f"Error en servicio crear_formulario: {e}")
+            logger.error("Error en servicio crear_formulario: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error interno del servidor al crear el formulario"
             )
     
-    def buscar_por_id(self, formulario_id: str) -> ApiResponse:
+    @medido_servicio
+    async def buscar_por_id(self, formulario_id: str) -> RespuestaApi:
         try:
             # Validar formato UUID
             try:
-                uuid.UUID(formulario_id)
+                formulario_id = str(uuid.UUID(formulario_id))
             except ValueError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="El ID proporcionado no tiene un formato válido"
                 )
             
-            resultado = formulario_repository.buscar_por_id(formulario_id)
+            with en_primario(escrituras_recientes.reciente(formulario_id)):
+                resultado = await self.cache.obtener_o_cargar(
+                    formulario_id, lambda: self._cargar_por_id(formulario_id)
+                )
             if not resultado:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Formulario no encontrado"
                 )
             
-            return ApiResponse(
+            return RespuestaApi(
                 message=["Formulario consultado satisfactoriamente."],
                 data=[resultado]
             )
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error en servicio buscar_por_id: {e}")
+            logger.error("Error en servicio buscar_por_id: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error interno del servidor al consultar el formulario"
             )
     
-    def buscar_todos(self) -> ApiResponse:
+    @medido_servicio
+    async def version_por_id(self, formulario_id: str) -> Optional[datetime]:
+        """updated_at para un GET condicional: del caché local si está, si no con una consulta
+        que solo trae la versión. None si no existe o el ID no es válido (la ruta normal responde)
+
+        El caché local solo se usa si las invalidaciones llegan a todos los workers: si no,
+        un worker que no atendió la escritura respondería 304 con la versión anterior.
+        """
         try:
-            resultados = formulario_repository.buscar_todos()
+            formulario_id = str(uuid.UUID(formulario_id))
+        except ValueError:
+            return None
+        try:
+            registro = self.cache.obtener_local(formulario_id) if self.cache.invalidacion_entre_workers else None
+            if registro is NO_ENCONTRADO:
+                return None
+            if registro is not None:
+                return registro.updated_at
+            with en_primario(escrituras_recientes.reciente(formulario_id)):
+                return await self.vuelo_listados.ejecutar(
+                    ("version", formulario_id, leer_del_primario.get()),
+                    lambda: self.repositorio.version_por_id(formulario_id)
+                )
+        except Exception as e:
+            logger.error("Error en servicio version_por_id: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al consultar el formulario"
+            )
+
+    @medido_servicio
+    async def version_coleccion(self) -> Tuple[int, int]:
+        """Posición en el registro de cambios, para el ETag de /formulario/all"""
+        try:
+            return await self.vuelo_listados.ejecutar(
+                ("version", leer_del_primario.get()), self.repositorio.version_coleccion
+            )
+        except Exception as e:
+            logger.error("Error en servicio version_coleccion: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al consultar los formularios"
+            )
+
+    def _decodificar_cursor(self, cursor: Optional[str], con_rango: bool = False):
+        if not cursor:
+            return None
+        try:
+            return decodificar_cursor_con_rango(cursor) if con_rango else decodificar_cursor(cursor)
+        except CursorInvalidoError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+    def _decodificar_cursor_cambios(self, cursor: Optional[str]):
+        if not cursor:
+            return None
+        try:
+            return decodificar_cursor_cambios(cursor)
+        except CursorInvalidoError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+    def _leer_cambios(self, despues_de, limite: int):
+        # Los streams que están al día piden la misma posición: comparten la consulta
+        return self.vuelo_listados.ejecutar(
+            ("changes", despues_de, limite), lambda: self.repositorio.buscar_cambios(despues_de, limite)
+        )
+
+    @medido_servicio
+    async def buscar_todos(self, limite: int = TAMANO_PAGINA_DEFECTO, cursor: Optional[str] = None) -> Tuple[RespuestaApi, Optional[str]]:
+        """Devuelve una página y el cursor de la siguiente (None si es la última)"""
+        try:
+            despues_de = self._decodificar_cursor(cursor)
+
+            # Se pide una fila extra para saber si existe una página siguiente
+            resultados = await self.vuelo_listados.ejecutar(
+                ("all", limite, despues_de, leer_del_primario.get()), lambda: self.repositorio.buscar_pagina(limite + 1, despues_de)
+            )
+            siguiente_cursor = None
+            if len(resultados) > limite:
+                resultados = resultados[:limite]
+                ultimo = resultados[-1]
+                siguiente_cursor = codificar_cursor(ultimo.created_at, ultimo.id)
+
             if not resultados:
-                return ApiResponse(
+                return RespuestaApi(
                     message=["No se encontraron formularios."],
                     data=[]
-                )
+                ), None
             
-            return ApiResponse(
+            return RespuestaApi(
                 message=["Los formularios fueron consultados satisfactoriamente."],
                 data=resultados
-            )
+            ), siguiente_cursor
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error en servicio buscar_todos: {e}")
+            logger.error("Error en servicio buscar_todos: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error interno del servidor al consultar los formularios"
             )
-    
-    def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate) -> ApiResponse:
+
+    @medido_servicio
+    async def buscar(self, filtros: FiltrosBusqueda, limite: int = TAMANO_PAGINA_DEFECTO,
+                     cursor: Optional[str] = None) -> Tuple[RespuestaApi, Optional[str]]:
+        """Búsqueda filtrada; con texto los resultados vienen ordenados por relevancia"""
         try:
+            despues_de = self._decodificar_cursor(cursor, con_rango=bool(filtros.texto))
+
+            resultados = await self.vuelo_listados.ejecutar(
+                ("search", filtros, limite, despues_de, leer_del_primario.get()),
+                lambda: self.repositorio.buscar_filtrados(filtros, limite + 1, despues_de)
+            )
+            siguiente_cursor = None
+            if len(resultados) > limite:
+                resultados = resultados[:limite]
+                ultimo, rango = resultados[-1]
+                siguiente_cursor = codificar_cursor(ultimo.created_at, ultimo.id, rango)
+
+            if not resultados:
+                return RespuestaApi(
+                    message=["No se encontraron formularios con los filtros indicados."],
+                    data=[]
+                ), None
+
+            return RespuestaApi(
+                message=["Los formularios fueron consultados satisfactoriamente."],
+                data=[formulario for formulario, _ in resultados]
+            ), siguiente_cursor
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error en servicio buscar: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al buscar los formularios"
+            )
+
+    @medido_servicio
+    async def recorrer_todos(self, formato: str, cursor: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Stream de todos los formularios en NDJSON o como arreglo JSON por partes.
+
+        El cursor se valida antes de empezar a responder; un error a mitad del
+        stream corta la conexión para que el cliente no reciba un cuerpo truncado
+        con apariencia válida.
+        """
+        despues_de = self._decodificar_cursor(cursor)
+        filas = self.repositorio.iterar_todos(despues_de, TAMANO_LOTE_STREAM)
+
+        async def generar():
             try:
-                uuid.UUID(formulario_id)
-            except ValueError:
+                if formato == "ndjson":
+                    async for fila in filas:
+                        yield dumps(fila) + b"\n"
+                    return
+
+                yield '{"message":["Los formularios fueron consultados satisfactoriamente."],"data":['.encode()
+                separador = b""
+                async for fila in filas:
+                    yield separador + dumps(fila)
+                    separador = b","
+                yield b"]}"
+            except Exception as e:
+                logger.error("Error en servicio recorrer_todos: %s", e)
+                raise
+            finally:
+                # Devuelve la conexión y el cursor con nombre en cuanto el cliente corta,
+                # sin esperar al recolector
+                with anyio.CancelScope(shield=True):
+                    await filas.aclose()
+
+        return generar()
+
+    @medido_servicio
+    async def exportar(self, formato: str, desde: Optional[datetime] = None,
+                       hasta: Optional[datetime] = None) -> AsyncIterator[bytes]:
+        """Stream del COPY de los formularios creados en [desde, hasta) en CSV o NDJSON.
+
+        El primer bloque se lee antes de empezar a responder: si la consulta
+        falla la respuesta es un 500 y no un stream cortado. Un error posterior
+        corta la conexión, como en recorrer_todos.
+        """
+        if desde is not None and hasta is not None and desde >= hasta:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="'desde' debe ser anterior a 'hasta'"
+            )
+        bloques = self.repositorio.exportar(formato, desde, hasta)
+        try:
+            primero = await bloques.__anext__()
+        except StopAsyncIteration:
+            primero = b""
+        except Exception as e:
+            logger.error("Error en servicio exportar: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al exportar los formularios"
+            )
+
+        async def generar():
+            try:
+                yield primero
+                async for bloque in bloques:
+                    yield bloque
+            except Exception as e:
+                logger.error("Error en servicio exportar: %s", e)
+                raise
+            finally:
+                # Cierra el COPY en cuanto el cliente corta, sin esperar al recolector
+                with anyio.CancelScope(shield=True):
+                    await bloques.aclose()
+
+        return generar()
+
+    @medido_servicio
+    async def importar(self, formato: str, cuerpo: AsyncIterator[bytes]) -> Tuple[RespuestaApi, int]:
+        """Importa un archivo CSV o NDJSON a medida que llega, de a IMPORTAR_TAMANO_BLOQUE registros.
+
+        Cada bloque se valida fuera del event loop y sus formularios válidos se
+        guardan con un COPY en su propia transacción: un error no deshace los
+        bloques anteriores. Mientras un bloque se guarda se valida el siguiente
+        (a lo sumo una escritura en curso). Devuelve el resumen y el código HTTP
+        global: 201 si se importaron todos, 207 si solo algunos y 422 si ninguno.
+        """
+        lector = LectorRegistros(formato)
+        columnas = None
+        importados, rechazados, errores = 0, 0, []
+        pendientes = []
+        escritura: Optional[asyncio.Future] = None
+
+        def rechazar(lineas):
+            nonlocal rechazados
+            rechazados += len(lineas)
+            espacio = IMPORTAR_MAX_ERRORES - len(errores)
+            errores.extend({"linea": linea, "errores": mensajes} for linea, mensajes in lineas[:max(espacio, 0)])
+
+        async def guardar(registros, formularios, invalidos):
+            nonlocal importados
+            if formularios:
+                try:
+                    ids = await self.repositorio.importar_formularios(formularios)
+                except Exception as e:
+                    if not es_error_de_datos(e):
+                        raise
+                    logger.warning("La base de datos rechazó un bloque de la importación: %s", e)
+                    lineas_validas = sorted(set(linea for linea, _ in registros) - set(linea for linea, _ in invalidos))
+                    invalidos = sorted(invalidos + [(linea, ["La base de datos rechazó el bloque"])
+                                                    for linea in lineas_validas])
+                else:
+                    importados += len(ids)
+                    self._olvidar_lecturas(ids)
+            rechazar(invalidos)
+
+        async def esperar_escritura():
+            nonlocal escritura
+            if escritura is not None:
+                tarea, escritura = escritura, None
+                await tarea
+
+        async def procesar(registros):
+            nonlocal escritura
+            formularios, invalidos = await run_in_threadpool(validar_bloque, formato, registros, columnas)
+            await esperar_escritura()
+            escritura = asyncio.ensure_future(guardar(registros, formularios, invalidos))
+
+        def tomar_encabezado():
+            nonlocal columnas
+            if formato == "csv" and columnas is None and pendientes:
+                try:
+                    columnas = leer_encabezado(pendientes.pop(0)[1])
+                except ValueError as e:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        interrumpida = None
+        try:
+            try:
+                async for datos in cuerpo:
+                    pendientes.extend(lector.agregar(datos))
+                    tomar_encabezado()
+                    while len(pendientes) >= IMPORTAR_TAMANO_BLOQUE:
+                        await procesar(pendientes[:IMPORTAR_TAMANO_BLOQUE])
+                        del pendientes[:IMPORTAR_TAMANO_BLOQUE]
+                pendientes.extend(lector.terminar())
+                tomar_encabezado()
+            except RegistroDemasiadoLargoError as e:
+                interrumpida = e
+                rechazar([(e.linea, [str(e)])])
+            if pendientes:
+                await procesar(pendientes)
+            await esperar_escritura()
+
+            if interrumpida is None and importados + rechazados == 0:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="El ID proporcionado no tiene un formato válido"
+                    detail="El archivo no tiene formularios"
                 )
-            
-            existente = formulario_repository.buscar_por_id(formulario_id)
-            if not existente:
+        except HTTPException:
+            raise
+        except Exception as e:
+            if escritura is not None:
+                # El bloque en curso termina igual; se espera para informar cuántos quedaron guardados
+                await asyncio.gather(escritura, return_exceptions=True)
+            logger.error("Error en servicio importar después de %s formularios: %s", importados, e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error interno del servidor al importar los formularios ({importados} ya importados)"
+            )
+
+        mensajes = [f"{importados} formularios importados, {rechazados} líneas rechazadas."]
+        if interrumpida is not None:
+            mensajes.append(f"Importación interrumpida en la línea {interrumpida.linea}.")
+            codigo = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        elif not rechazados:
+            codigo = status.HTTP_201_CREATED
+        else:
+            codigo = status.HTTP_207_MULTI_STATUS if importados else status.HTTP_422_UNPROCESSABLE_ENTITY
+        return RespuestaApi(
+            message=mensajes,
+            data=[{"importados": importados, "rechazados": rechazados, "errores": errores}]
+        ), codigo
+
+    @medido_servicio
+    async def sincronizar(self, since: Optional[str], limite: int = TAMANO_PAGINA_DEFECTO) -> Tuple[RespuestaApi, str]:
+        """Cambios posteriores a `since` (desde el inicio del registro si falta) y el cursor para continuar.
+
+        El cursor se devuelve siempre, aunque no haya cambios, para la siguiente consulta.
+        """
+        try:
+            despues_de = self._decodificar_cursor_cambios(since) or (0, 0)
+            cambios = await self._leer_cambios(despues_de, limite)
+            if not cambios:
+                return RespuestaApi(
+                    message=["No hay cambios nuevos."],
+                    data=[]
+                ), since or codificar_cursor_cambios(*despues_de)
+
+            return RespuestaApi(
+                message=["Los cambios fueron consultados satisfactoriamente."],
+                data=cambios
+            ), cambios[-1].cursor
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error en servicio sincronizar: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al consultar los cambios"
+            )
+
+    @medido_servicio
+    async def seguir_cambios(self, cursor: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Stream SSE de cambios desde `cursor` (o desde ahora) que no termina.
+
+        Cada evento lleva el cursor en `id:` para que el cliente se reanude con
+        Last-Event-ID; el primero informa la posición inicial aunque no haya cambios.
+        Un error a mitad del stream corta la conexión y el cliente se reconecta.
+        """
+        try:
+            posicion = self._decodificar_cursor_cambios(cursor) or await self.repositorio.posicion_cambios()
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error en servicio seguir_cambios: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al consultar los cambios"
+            )
+
+        async def generar():
+            nonlocal posicion
+            inicial = codificar_cursor_cambios(*posicion)
+            yield b"".join((f"retry: {int(CAMBIOS_INTERVALO_SONDEO * 1000)}\nid: {inicial}\nevent: posicion\ndata: ".encode(),
+                            dumps({"cursor": inicial}), b"\n\n"))
+            ultimo_envio = time.monotonic()
+            try:
+                while True:
+                    aviso = oyente_cambios.aviso_actual()
+                    cambios: List[CambioFormulario] = await self._leer_cambios(posicion, CAMBIOS_TAMANO_LOTE)
+                    for cambio in cambios:
+                        yield b"".join((b"id: ", cambio.cursor.encode(), b"\nevent: ", cambio.operacion.encode(),
+                                        b"\ndata: ", dumps(cambio), b"\n\n"))
+                    if cambios:
+                        posicion = decodificar_cursor_cambios(cambios[-1].cursor)
+                        ultimo_envio = time.monotonic()
+                        if len(cambios) == CAMBIOS_TAMANO_LOTE:
+                            continue
+                    elif time.monotonic() - ultimo_envio >= CAMBIOS_LATIDO:
+                        # Comentario SSE: mantiene viva la conexión a través de proxies
+                        yield b": latido\n\n"
+                        ultimo_envio = time.monotonic()
+                    await oyente_cambios.esperar(aviso)
+            except Exception as e:
+                logger.error("Error en servicio seguir_cambios: %s", e)
+                raise
+
+        return generar()
+
+    async def _error_mutacion_fallida(self, formulario_id: str, versiones) -> HTTPException:
+        """Una mutación sin filas afectadas es 404, salvo que la fila exista con otra versión (412).
+        Solo en este caso, poco frecuente, se hace una lectura adicional, en el primario: una
+        réplica atrasada podría no tener todavía la fila o la versión que hizo fallar la condición."""
+        existe = False
+        if versiones is not None:
+            with en_primario():
+                existe = await self.repositorio.buscar_por_id(formulario_id) is not None
+        if existe:
+            return HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="El formulario fue modificado por otra petición; vuelva a consultarlo"
+            )
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Formulario no encontrado"
+        )
+
+    @medido_servicio
+    async def actualizar_formulario(self, formulario_id: str, formulario: FormularioClienteUpdate,
+                                    if_match: Optional[str] = None) -> RespuestaApi:
+        try:
+            try:
+                formulario_id = str(uuid.UUID(formulario_id))
+            except ValueError:
                 raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Formulario no encontrado"
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El ID proporcionado no tiene un formato válido"
                 )
             
-            resultado = formulario_repository.actualizar_formulario(formulario_id, formulario)
+            versiones = versiones_if_match(if_match)
+            resultado = await self.repositorio.actualizar_formulario(formulario_id, formulario, versiones)
             if not resultado:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Formulario no encontrado"
-                )
+                raise await self._error_mutacion_fallida(formulario_id, versiones)
+            self._olvidar_lecturas([formulario_id])
+            await self.cache.invalidar(formulario_id)
             
-            return ApiResponse(
+            return RespuestaApi(
                 message=["Formulario actualizado satisfactoriamente."],
                 data=[resultado]
             )
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error en servicio actualizar_formulario: {e}")
+            logger.error("Error en servicio actualizar_formulario: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error interno del servidor al actualizar el formulario"
             )
     
-    def eliminar_formulario(self, formulario_id: str) -> ApiResponse:
+    @medido_servicio
+    async def eliminar_formulario(self, formulario_id: str, if_match: Optional[str] = None) -> RespuestaApi:
         try:
             try:
-                uuid.UUID(formulario_id)
+                formulario_id = str(uuid.UUID(formulario_id))
             except ValueError:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="El ID proporcionado no tiene un formato válido"
                 )
             
-            existente = formulario_repository.buscar_por_id(formulario_id)
-            if not existente:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Formulario no encontrado"
-                )
-            
-            eliminado = formulario_repository.eliminar_formulario(formulario_id)
+            versiones = versiones_if_match(if_match)
+            eliminado = await self.repositorio.eliminar_formulario(formulario_id, versiones)
             if not eliminado:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Formulario no encontrado"
-                )
+                raise await self._error_mutacion_fallida(formulario_id, versiones)
+            self._olvidar_lecturas([formulario_id])
+            await self.cache.invalidar(formulario_id)
             
-            return ApiResponse(
+            return RespuestaApi(
                 message=["Formulario eliminado satisfactoriamente."],
                 data=[]
             )
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error en servicio eliminar_formulario: {e}")
+            logger.error("Error en servicio eliminar_formulario: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error interno del servidor al eliminar el formulario"
             )
 
+    def _validar_tamano_lote(self, items: list):
+        if not items:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El lote está vacío"
+            )
+        if len(items) > LOTE_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"El lote no puede tener más de {LOTE_MAX_ITEMS} elementos"
+            )
+
+    @medido_servicio
+    async def crear_lote(self, items: List[Any], atomico: bool = True) -> Tuple[RespuestaApi, int]:
+        """Valida cada ítem con FormularioClienteCreate y guarda los válidos en una transacción.
+
+        Devuelve la respuesta y el código HTTP global: 201 si se crearon todos,
+        207 si solo algunos (modo por ítem) y 422 si no se guardó ninguno.
+        """
+        self._validar_tamano_lote(items)
+        try:
+            resultados: List[Optional[dict]] = [None] * len(items)
+            formularios, posiciones = [], []
+            for indice, item in enumerate(items):
+                try:
+                    formularios.append(FormularioClienteCreate.model_validate(item))
+                    posiciones.append(indice)
+                except ValidationError as e:
+                    resultados[indice] = item_lote(indice=indice, estado=422, errores=mensajes_validacion(e))
+
+            if atomico and len(formularios) < len(items):
+                for indice in posiciones:
+                    resultados[indice] = item_lote(indice=indice, estado=424)
+                return RespuestaApi(
+                    message=["El lote contiene formularios inválidos; no se guardó ninguno."],
+                    data=resultados
+                ), status.HTTP_422_UNPROCESSABLE_ENTITY
+
+            creados = await self.repositorio.crear_formularios_lote(formularios, atomico) if formularios else []
+            self._olvidar_lecturas([creado.id for creado in creados if not isinstance(creado, Exception)])
+
+            for indice, creado in zip(posiciones, creados):
+                if isinstance(creado, Exception):
+                    if es_error_de_datos(creado):
+                        resultados[indice] = item_lote(indice=indice, estado=422, errores=["La base de datos rechazó el formulario"])
+                    else:
+                        resultados[indice] = item_lote(indice=indice, estado=500, errores=["Error interno al guardar el formulario"])
+                else:
+                    resultados[indice] = item_lote(indice=indice, estado=201, id=creado.id)
+
+            total_creados = sum(1 for r in resultados if r["estado"] == 201)
+            if total_creados == len(items):
+                return RespuestaApi(
+                    message=[f"{total_creados} formularios creados satisfactoriamente."],
+                    data=resultados
+                ), status.HTTP_201_CREATED
+            return RespuestaApi(
+                message=[f"{total_creados} de {len(items)} formularios creados."],
+                data=resultados
+            ), status.HTTP_207_MULTI_STATUS if total_creados else status.HTTP_422_UNPROCESSABLE_ENTITY
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error en servicio crear_lote: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al crear los formularios"
+            )
+
+    @medido_servicio
+    async def eliminar_lote(self, formulario_ids: List[str], atomico: bool = True) -> Tuple[RespuestaApi, int]:
+        """Elimina varios formularios con un solo DELETE; mismo esquema de estados que crear_lote"""
+        self._validar_tamano_lote(formulario_ids)
+        try:
+            resultados: List[Optional[dict]] = [None] * len(formulario_ids)
+            validos = {}
+            for indice, formulario_id in enumerate(formulario_ids):
+                try:
+                    validos[indice] = str(uuid.UUID(formulario_id))
+                except (ValueError, TypeError, AttributeError):
+                    resultados[indice] = item_lote(
+                        indice=indice, estado=400, errores=["El ID proporcionado no tiene un formato válido"]
+                    )
+
+            if atomico and len(validos) < len(formulario_ids):
+                for indice, formulario_id in validos.items():
+                    resultados[indice] = item_lote(indice=indice, estado=424, id=formulario_id)
+                return RespuestaApi(
+                    message=["El lote contiene IDs inválidos; no se eliminó ninguno."],
+                    data=resultados
+                ), status.HTTP_400_BAD_REQUEST
+
+            eliminados, confirmado = set(), True
+            if validos:
+                eliminados, confirmado = await self.repositorio.eliminar_formularios_lote(list(validos.values()), atomico)
+            if confirmado:
+                self._olvidar_lecturas(eliminados)
+                for formulario_id in eliminados:
+                    await self.cache.invalidar(formulario_id)
+
+            for indice, formulario_id in validos.items():
+                if formulario_id not in eliminados:
+                    resultados[indice] = item_lote(
+                        indice=indice, estado=404, id=formulario_id, errores=["Formulario no encontrado"]
+                    )
+                else:
+                    resultados[indice] = item_lote(indice=indice, estado=200 if confirmado else 424, id=formulario_id)
+
+            if not confirmado:
+                return RespuestaApi(
+                    message=["Algunos formularios no existen; no se eliminó ninguno."],
+                    data=resultados
+                ), status.HTTP_404_NOT_FOUND
+
+            total_eliminados = sum(1 for r in resultados if r["estado"] == 200)
+            if total_eliminados == len(formulario_ids):
+                return RespuestaApi(
+                    message=[f"{total_eliminados} formularios eliminados satisfactoriamente."],
+                    data=resultados
+                ), status.HTTP_200_OK
+            return RespuestaApi(
+                message=[f"{total_eliminados} de {len(formulario_ids)} formularios eliminados."],
+                data=resultados
+            ), status.HTTP_207_MULTI_STATUS if total_eliminados else status.HTTP_404_NOT_FOUND
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error en servicio eliminar_lote: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Error interno del servidor al eliminar los formularios"
+            )
+
 formulario_service = FormularioClienteService()
@@ -0,0 +1,79 @@
+"""
+Tipos y reglas de validación compartidos por los modelos de formulario.
+
+Las longitudes las verifica pydantic-core (StringConstraints); las reglas de
+negocio son AfterValidator con patrones precompilados y se ejecutan una sola
+vez por campo. El email da el mismo resultado que EmailStr pero valida cada
+dominio una sola vez (ver `validar_email`). Envueltos en Optional
+(FormularioClienteUpdate) los validadores solo corren cuando el valor no es None.
+"""
+from functools import lru_cache
+from typing import Annotated
+import re
+
+from pydantic import AfterValidator, StringConstraints, WithJsonSchema
+from pydantic.networks import validate_email
+from pydantic_core import PydanticCustomError
+
+PATRON_NOMBRE = re.compile(r"^[a-zA-ZáéíóúüñÁÉÍÓÚÜÑ\s\-'.]+$")
+
+# Forma habitual de un email: parte local dot-atom ASCII y dominio ASCII en minúsculas
+PATRON_EMAIL_SIMPLE = re.compile(
+    r"^([A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*)@([a-z0-9-]+(?:\.[a-z0-9-]+)+)$"
+)
+
+TELEFONO_MINIMO = 10 ** 6       # 7 dígitos
+TELEFONO_MAXIMO = 10 ** 15 - 1  # 15 dígitos
+
+
+def validar_nombre_completo(valor: str) -> str:
+    valor = valor.strip()
+    if not PATRON_NOMBRE.match(valor):
+        raise ValueError('El nombre solo puede contener letras, espacios, guiones y apóstrofes')
+    if len(valor.split(maxsplit=1)) < 2:
+        raise ValueError('Debe ingresar nombre y apellido')
+    return valor.title()
+
+
+def validar_telefono(valor: int) -> int:
+    # Equivale a exigir entre 7 y 15 dígitos sin convertir el número a texto
+    if not TELEFONO_MINIMO <= valor <= TELEFONO_MAXIMO:
+        raise ValueError('El teléfono debe tener entre 7 y 15 dígitos')
+    return valor
+
+
+@lru_cache(maxsize=4096)
+def _dominio_valido(dominio: str) -> bool:
+    """True si email-validator acepta el dominio sin normalizarlo"""
+    direccion = "a@" + dominio
+    try:
+        return validate_email(direccion)[1] == direccion
+    except PydanticCustomError:
+        return False
+
+
+def validar_email(valor: str) -> str:
+    """Mismo resultado que EmailStr, pero sin repetir la validación del dominio.
+
+    Casi todo el costo de email-validator está en validar el dominio (IDNA), que
+    se repite entre formularios; para direcciones con la forma habitual solo se
+    valida una vez por dominio. Cualquier otra dirección, o un dominio rechazado,
+    pasa por la validación completa para conservar el mensaje de error.
+    """
+    coincidencia = PATRON_EMAIL_SIMPLE.match(valor)
+    if (coincidencia and len(coincidencia.group(1)) <= 64 and len(valor) <= 254
+            and _dominio_valido(coincidencia.group(2))):
+        return valor
+    return validate_email(valor)[1]
+
+
+def recortar(valor: str) -> str:
+    return valor.strip()
+
+
+# Con max_length=500 caracteres un mensaje no puede superar las 500 palabras,
+# así que basta con recortar los espacios
+Email = Annotated[str, AfterValidator(validar_email), WithJsonSchema({"type": "string", "format": "email"})]
+NombreCompleto = Annotated[str, StringConstraints(min_length=2, max_length=255), AfterValidator(validar_nombre_completo)]
+Telefono = Annotated[int, AfterValidator(validar_telefono)]
+Mensaje = Annotated[str, StringConstraints(min_length=1, max_length=500), AfterValidator(recortar)]